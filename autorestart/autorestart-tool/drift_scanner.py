@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from launch_template_utils import (
+    build_launch_template_data,
+    diff_template_data,
+    get_instance_userdata,
+    get_template_source_instance_id,
+    get_template_subnet_id,
+    update_launch_template,
+)
+from fleet_status import get_recovery_templates_by_stack
+from maintenance_mode import chunks, describe_alarms_by_prefix, get_stack_name
+
+# Adaptive retries back off on EC2 request throttling while the scanner fans out
+SCANNER_CLIENT_CONFIG = Config(retries={'mode': 'adaptive', 'max_attempts': 10})
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Detect drift between protected instances and their recovery launch templates')
+    parser.add_argument('--region', type=str, required=True, help='AWS region')
+    parser.add_argument('--stack-prefix', type=str, default='', help='Only scan stacks whose name starts with this prefix')
+    parser.add_argument('--fix', action='store_true', help='Create a new default template version for every drifted template')
+    parser.add_argument('--max-workers', type=int, default=8, help='Maximum concurrent EC2 calls (default: 8)')
+    parser.add_argument('--output', type=str, choices=['table', 'json'], default='table', help='Output format (default: table)')
+    return parser.parse_args()
+
+
+def describe_instances_by_id(ec2_client, instance_ids):
+    """Describe instances in batches, returning {instance ID: instance}"""
+    instances = {}
+    paginator = ec2_client.get_paginator('describe_instances')
+    for batch in chunks(sorted(instance_ids), 200):
+        # Unknown IDs fail the whole call, so filter on instance-id instead of passing InstanceIds
+        for page in paginator.paginate(Filters=[{'Name': 'instance-id', 'Values': batch}]):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    instances[instance['InstanceId']] = instance
+    return instances
+
+
+def describe_default_template_versions(ec2_client, template_ids):
+    """Return {template ID: default version} for the given templates in one paginated pass over the account"""
+    versions = {}
+    paginator = ec2_client.get_paginator('describe_launch_template_versions')
+    # Omitting the template ID with Versions=['$Default'] returns the default version of every template
+    for page in paginator.paginate(Versions=['$Default'], PaginationConfig={'PageSize': 200}):
+        for version in page['LaunchTemplateVersions']:
+            if version['LaunchTemplateId'] in template_ids:
+                versions[version['LaunchTemplateId']] = version
+    return versions
+
+
+def scan_drift(session, region, stack_prefix='', fix=False, max_workers=8):
+    """Compare the default version of every recovery template with the instance it was built from"""
+    cloudwatch_client = session.client('cloudwatch', region_name=region)
+    cloudformation_client = session.client('cloudformation', region_name=region)
+    ec2_client = session.client('ec2', region_name=region, config=SCANNER_CLIENT_CONFIG)
+
+    alarms = describe_alarms_by_prefix(cloudwatch_client)
+    templates_by_stack = get_recovery_templates_by_stack(cloudformation_client)
+
+    stacks = []
+    for alarm in alarms:
+        stack_name = get_stack_name(alarm['AlarmName'])
+        if stack_name.startswith(stack_prefix) and stack_name in templates_by_stack:
+            stacks.append((stack_name, templates_by_stack[stack_name]))
+
+    template_ids = {template_id for _, stack_template_ids in stacks for template_id in stack_template_ids}
+    versions = describe_default_template_versions(ec2_client, template_ids)
+
+    # A recovery template may be built from another instance than the alarm's, so compare each template
+    # with the instance named in it
+    source_instance_ids = {
+        template_id: get_template_source_instance_id(version.get('LaunchTemplateName'))
+        for template_id, version in versions.items()
+    }
+    instance_ids = set(filter(None, source_instance_ids.values()))
+    instances = describe_instances_by_id(ec2_client, instance_ids)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        userdata = dict(zip(instances, executor.map(lambda instance_id: get_instance_userdata(ec2_client, instance_id), instances)))
+
+        def check_template(stack_name, template_id):
+            instance_id = source_instance_ids.get(template_id)
+            result = {
+                'stack_name': stack_name,
+                'instance_id': instance_id,
+                'template_id': template_id,
+                'status': 'in-sync',
+                'drifted_fields': [],
+                'error': None
+            }
+            version = versions.get(template_id)
+            if not version:
+                result.update(status='error', error='Launch template not found')
+                return result
+            if not instance_id:
+                result.update(status='skipped', error='Source instance cannot be determined from the template name')
+                return result
+            instance = instances.get(instance_id)
+            if not instance:
+                result.update(status='skipped', error='Source instance not found')
+                return result
+
+            current = version['LaunchTemplateData']
+            desired = build_launch_template_data(instance, get_template_subnet_id(current), userdata.get(instance_id, ''))
+            drifted_fields = diff_template_data(current, desired)
+            if drifted_fields:
+                result.update(status='drifted', drifted_fields=drifted_fields)
+                if fix:
+                    try:
+                        update_launch_template(ec2_client, template_id, desired, drifted_fields)
+                        result['status'] = 'fixed'
+                    except Exception as e:
+                        result.update(status='error', error=f"Fix failed: {e}")
+            return result
+
+        futures = [
+            executor.submit(check_template, stack_name, template_id)
+            for stack_name, stack_template_ids in stacks
+            for template_id in stack_template_ids
+        ]
+        results = [future.result() for future in futures]
+
+    return sorted(results, key=lambda result: (result['stack_name'], result['template_id']))
+
+
+def print_report(results):
+    print(f"{'Stack':<40} {'Instance':<20} {'Template':<22} {'Status':<8} Drifted Fields")
+    print("-" * 120)
+    for result in results:
+        details = ', '.join(result['drifted_fields']) or result['error'] or '-'
+        print(f"{result['stack_name']:<40} {result['instance_id'] or '-':<20} {result['template_id']:<22} "
+              f"{result['status']:<8} {details}")
+    print("-" * 120)
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print(f"{len(results)} template(s) checked: " + ', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+
+def main():
+    args = parse_arguments()
+
+    try:
+        results = scan_drift(boto3.Session(), args.region, args.stack_prefix, args.fix, args.max_workers)
+    except Exception as e:
+        print(f"✗ Unexpected error: {e}")
+        sys.exit(1)
+
+    if args.output == 'json':
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+    # Non-zero exit lets a scheduled run alert on drift that was not fixed
+    if any(result['status'] in ('drifted', 'error') for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
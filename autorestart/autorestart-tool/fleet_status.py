@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+
+import boto3
+
+from maintenance_mode import (
+    describe_alarms_by_prefix,
+    format_lease_expiry,
+    get_alarm_instance_id,
+    get_leases,
+    get_stack_name,
+)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Report the protection status of every autorestart stack in a region')
+    parser.add_argument('--region', type=str, required=True, help='AWS region')
+    parser.add_argument('--output', type=str, choices=['table', 'json'], default='table', help='Output format (default: table)')
+    return parser.parse_args()
+
+
+def get_recovery_templates_by_stack(cloudformation_client):
+    """Return {stack name: [launch template IDs]} from the outputs of every stack in one paginated pass"""
+    templates = {}
+    paginator = cloudformation_client.get_paginator('describe_stacks')
+    for page in paginator.paginate():
+        for stack in page['Stacks']:
+            outputs = sorted(
+                (output for output in stack.get('Outputs', []) if output['OutputKey'].startswith('LaunchTemplateId')),
+                key=lambda output: int(output['OutputKey'][len('LaunchTemplateId'):] or 0)
+            )
+            templates[stack['StackName']] = [output['OutputValue'] for output in outputs]
+    return templates
+
+
+def build_fleet_status(session, region):
+    """Join the autorestart alarms with their stack outputs and maintenance leases"""
+    cloudwatch_client = session.client('cloudwatch', region_name=region)
+    cloudformation_client = session.client('cloudformation', region_name=region)
+    tagging_client = session.client('resourcegroupstaggingapi', region_name=region)
+
+    alarms = describe_alarms_by_prefix(cloudwatch_client)
+    templates = get_recovery_templates_by_stack(cloudformation_client)
+    leases = get_leases(tagging_client)
+
+    rows = []
+    for alarm in alarms:
+        stack_name = get_stack_name(alarm['AlarmName'])
+        lease = leases.get(alarm['AlarmArn'])
+        rows.append({
+            'stack_name': stack_name,
+            'instance_id': get_alarm_instance_id(alarm),
+            'alarm_state': alarm['StateValue'],
+            'actions_enabled': alarm['ActionsEnabled'],
+            # A lease only matters while recovery is still disabled
+            'lease_expiry': format_lease_expiry(lease) if lease and not alarm['ActionsEnabled'] else None,
+            'launch_template_ids': templates.get(stack_name, []),
+            'stack_found': stack_name in templates
+        })
+    return sorted(rows, key=lambda row: row['stack_name'])
+
+
+def print_table(rows):
+    print(f"{'Stack':<40} {'Instance':<20} {'State':<18} {'Recovery':<12} {'Lease Expiry':<21} Launch Templates")
+    print("-" * 140)
+    for row in rows:
+        recovery = 'ENABLED' if row['actions_enabled'] else 'MAINTENANCE'
+        templates = ', '.join(row['launch_template_ids']) if row['stack_found'] else '(stack not found)'
+        print(f"{row['stack_name']:<40} {row['instance_id'] or '-':<20} {row['alarm_state']:<18} "
+              f"{recovery:<12} {row['lease_expiry'] or '-':<21} {templates}")
+    print("-" * 140)
+
+    in_maintenance = sum(1 for row in rows if not row['actions_enabled'])
+    in_alarm = sum(1 for row in rows if row['alarm_state'] == 'ALARM')
+    print(f"{len(rows)} protected instance(s): {len(rows) - in_maintenance} recovery enabled, "
+          f"{in_maintenance} in maintenance, {in_alarm} in ALARM state")
+
+
+def main():
+    args = parse_arguments()
+
+    try:
+        rows = build_fleet_status(boto3.Session(), args.region)
+    except Exception as e:
+        print(f"✗ Unexpected error: {e}")
+        sys.exit(1)
+
+    if args.output == 'json':
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
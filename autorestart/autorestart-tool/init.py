@@ -6,6 +6,9 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from outpost_utils import get_outpost_info
+from inventory_cache import ResourceSnapshot
+
+DEFAULT_TEMPLATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AutoRestartTemplate.yaml')
 
 
 def parse_arguments():
@@ -17,6 +20,7 @@ def parse_arguments():
     parser.add_argument('--stack-name', type=str, required=True, help='Name of the CloudFormation stack')
     parser.add_argument('--region', type=str, required=True, help='AWS region for the CloudFormation stack')
     parser.add_argument('--notification-email', type=str, required=True, help='Email address for SNS notifications')
+    parser.add_argument('--resource-snapshot', type=str, help='Resource snapshot file written by the template generator for this run')
     return parser.parse_args()
 
 
@@ -60,7 +64,7 @@ def stack_exists(client, stack_name):
         return False
 
 
-def wait_for_stack(client, stack_name, action):
+def wait_for_stack(client, stack_name, action, exit_on_error=True):
     waiter = client.get_waiter('stack_' + ('update_complete' if action == 'update' else 'create_complete'))
     print(f"Waiting for stack {action} to complete...")
     try:
@@ -68,28 +72,66 @@ def wait_for_stack(client, stack_name, action):
         print(f"Stack {stack_name} has been {action}d successfully.")
     except Exception as e:
         print(f"An error occurred while waiting for the stack {action} to complete: {str(e)}")
+        if not exit_on_error:
+            raise
         sys.exit(1)
 
 
-def create_or_update_stack(client, stack_name, template_body, parameters):
+def create_or_update_stack(client, stack_name, template_body, parameters, exit_on_error=True):
+    """Create or update the stack and return the action taken ('create', 'update' or 'unchanged')"""
     if stack_exists(client, stack_name):
         print(f"Stack {stack_name} exists. Updating stack...")
-        response = client.update_stack(
-            StackName=stack_name,
-            TemplateBody=template_body,
-            Parameters=parameters,
-            Capabilities=['CAPABILITY_NAMED_IAM']
-        )
-        wait_for_stack(client, stack_name, 'update')
+        try:
+            client.update_stack(
+                StackName=stack_name,
+                TemplateBody=template_body,
+                Parameters=parameters,
+                Capabilities=['CAPABILITY_NAMED_IAM']
+            )
+        except client.exceptions.ClientError as e:
+            # CloudFormation rejects updates that would not change anything
+            if 'No updates are to be performed' in str(e):
+                print(f"Stack {stack_name} is already up to date.")
+                return 'unchanged'
+            raise
+        wait_for_stack(client, stack_name, 'update', exit_on_error)
+        return 'update'
     else:
         print(f"Stack {stack_name} does not exist. Creating stack...")
-        response = client.create_stack(
+        client.create_stack(
             StackName=stack_name,
             TemplateBody=template_body,
             Parameters=parameters,
             Capabilities=['CAPABILITY_NAMED_IAM']
         )
-        wait_for_stack(client, stack_name, 'create')
+        wait_for_stack(client, stack_name, 'create', exit_on_error)
+        return 'create'
+
+
+def build_stack_parameters(stack_name, source_instance_id, notification_email, vpc_id, subnet_ids):
+    """Build the CloudFormation parameter list for the auto-restart stack"""
+    return [
+        {
+            'ParameterKey': 'StackName',
+            'ParameterValue': stack_name
+        },
+        {
+            'ParameterKey': 'SourceInstanceId',
+            'ParameterValue': source_instance_id
+        },
+        {
+            'ParameterKey': 'NotificationEmail',
+            'ParameterValue': notification_email
+        },
+        {
+            'ParameterKey': 'VpcId',
+            'ParameterValue': vpc_id
+        },
+        {
+            'ParameterKey': 'SubnetIds',
+            'ParameterValue': ','.join(subnet_ids) if isinstance(subnet_ids, (list, tuple)) else subnet_ids
+        }
+    ]
 
 
 def generate_template_body(base_template_path, launch_template_descriptions, recovery_mode):
@@ -115,38 +157,36 @@ def generate_template_body(base_template_path, launch_template_descriptions, rec
     return template_body
 
 
-def get_source_instance_id(ec2_client, primary_template_id):
+def get_source_instance_id(ec2_client, primary_template_id, snapshot=None):
     """Get source instance ID from primary launch template name pattern"""
+    snapshot = snapshot or ResourceSnapshot(ec2_client)
     try:
         # Get launch template details
-        template_response = ec2_client.describe_launch_templates(LaunchTemplateIds=[primary_template_id])
-        template_name = template_response['LaunchTemplates'][0]['LaunchTemplateName']
+        template_name = snapshot.launch_template(primary_template_id)['LaunchTemplateName']
         
         # Extract instance ID from template name (format: lt-{name}-{instance-id})
         if '-i-' in template_name:
             instance_id = 'i-' + template_name.split('-i-')[1]
             # Validate instance exists
-            ec2_client.describe_instances(InstanceIds=[instance_id])
+            snapshot.instance(instance_id)
             return instance_id
         else:
             raise Exception(f"Cannot extract instance ID from template name: {template_name}")
     except Exception as e:
         raise Exception(f"Failed to get source instance ID: {e}")
 
-def get_vpc_info_from_instance(ec2_client, instance_id):
+def get_vpc_info_from_instance(ec2_client, instance_id, snapshot=None):
     """Get VPC and private subnet information from source instance"""
+    snapshot = snapshot or ResourceSnapshot(ec2_client)
     try:
         # Get instance details
-        instance_response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        instance = instance_response['Reservations'][0]['Instances'][0]
+        instance = snapshot.instance(instance_id)
         
         vpc_id = instance['VpcId']
         print(f"Found VPC ID: {vpc_id}")
         
         # Get all subnets in the VPC
-        vpc_subnets_response = ec2_client.describe_subnets(
-            Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]
-        )
+        vpc_subnets = snapshot.subnets_in_vpc(vpc_id)
         
         # Get route tables to identify private subnets
         route_tables_response = ec2_client.describe_route_tables(
@@ -167,7 +207,7 @@ def get_vpc_info_from_instance(ec2_client, instance_id):
                         public_subnets.add(assoc['SubnetId'])
                     elif assoc.get('Main', False):
                         # Main route table applies to subnets without explicit associations
-                        for subnet in vpc_subnets_response['Subnets']:
+                        for subnet in vpc_subnets:
                             # Check if subnet has no explicit route table association
                             subnet_has_explicit_rt = False
                             for check_rt in route_tables_response['RouteTables']:
@@ -181,7 +221,7 @@ def get_vpc_info_from_instance(ec2_client, instance_id):
                                 public_subnets.add(subnet['SubnetId'])
         
         # Collect only private subnets
-        for subnet in vpc_subnets_response['Subnets']:
+        for subnet in vpc_subnets:
             if subnet['SubnetId'] not in public_subnets:
                 private_subnets.append(subnet['SubnetId'])
                 print(f"Found private subnet: {subnet['SubnetId']} in AZ: {subnet['AvailabilityZone']}")
@@ -204,48 +244,63 @@ def get_vpc_info_from_instance(ec2_client, instance_id):
     except Exception as e:
         raise Exception(f"Failed to get VPC info from instance: {e}")
 
-def main():
-    args = parse_arguments()
+def deploy_auto_restart(stack_name, launch_template_ids, notification_email, region, session=None,
+                        source_instance_id=None, primary_template_id=None, vpc_id=None, subnet_ids=None,
+                        descriptions=None, recovery_mode=None, template_file=DEFAULT_TEMPLATE_FILE,
+                        snapshot=None, interactive=True):
+    """Deploy the auto-restart stack from already-resolved data, detecting only what is not provided
+
+    Callers such as the template generator and Launch Wizard pass the instance, VPC and subnets they already
+    know, along with their boto3 session and resource snapshot. With interactive=True, missing descriptions and
+    recovery mode are prompted for and the stack replacement and generated template are confirmed.
+    Returns the action taken ('create', 'update' or 'unchanged'), or None if the user cancelled.
+    """
+    session = session or boto3.Session()
+    ec2_client = session.client('ec2', region_name=region)
+    snapshot = snapshot or ResourceSnapshot(ec2_client)
 
     # Auto-detect source instance ID from primary launch template if not provided
-    if not args.source_instance_id:
+    if not source_instance_id:
         print("Auto-detecting source instance ID from primary launch template...")
         try:
-            ec2_client = boto3.client('ec2', region_name=args.region)
-            
             # Use primary template or first launch template
-            template_for_monitoring = args.primary_template_id or args.launch_template_id[0]
-            source_instance_id = get_source_instance_id(ec2_client, template_for_monitoring)
+            template_for_monitoring = primary_template_id or launch_template_ids[0]
+            source_instance_id = get_source_instance_id(ec2_client, template_for_monitoring, snapshot)
             print(f"Detected Source Instance ID: {source_instance_id}")
-                
         except Exception as e:
+            if not interactive:
+                raise
             print(f"Failed to auto-detect source instance ID: {e}")
             # Prompt user for manual input
             source_instance_id = input("Please enter the source instance ID to monitor: ").strip()
             if not source_instance_id:
-                print("Source instance ID is required.")
-                sys.exit(1)
-    else:
-        source_instance_id = args.source_instance_id
-    
+                raise Exception("Source instance ID is required.")
+
     # Get VPC info from the source instance
-    print("Auto-detecting VPC info from source instance...")
-    try:
-        ec2_client = boto3.client('ec2', region_name=args.region)
-        vpc_info = get_vpc_info_from_instance(ec2_client, source_instance_id)
-        print(f"Detected VPC ID: {vpc_info['vpc_id']}")
-        print(f"Detected Private Subnet IDs: {', '.join(vpc_info['subnet_ids'])}")
-    except Exception as e:
-        print(f"Failed to auto-detect VPC info: {e}")
-        vpc_info = None
+    if not (vpc_id and subnet_ids):
+        print("Auto-detecting VPC info from source instance...")
+        try:
+            vpc_info = get_vpc_info_from_instance(ec2_client, source_instance_id, snapshot)
+            vpc_id, subnet_ids = vpc_info['vpc_id'], vpc_info['subnet_ids']
+            print(f"Detected VPC ID: {vpc_id}")
+            print(f"Detected Private Subnet IDs: {', '.join(subnet_ids)}")
+        except Exception as e:
+            if not interactive:
+                raise
+            print(f"Failed to auto-detect VPC info: {e}")
 
-    launch_template_descriptions = prompt_descriptions(args.launch_template_id, "launch template ID")
+    if not descriptions:
+        if interactive:
+            descriptions = prompt_descriptions(launch_template_ids, "launch template ID")
+        else:
+            descriptions = {template_id: f"Recovery launch template for {source_instance_id}" for template_id in launch_template_ids}
 
     print("Descriptions provided for launch templates:")
-    for template_id, description in launch_template_descriptions.items():
+    for template_id, description in descriptions.items():
         print(f"{template_id}: {description}")
 
-    recovery_mode = prompt_recovery_mode()
+    if not recovery_mode:
+        recovery_mode = prompt_recovery_mode() if interactive else 'automatic'
     print(f"\nSelected recovery mode: {recovery_mode}")
     
     if recovery_mode == 'notification':
@@ -254,65 +309,60 @@ def main():
     else:
         print("Note: Automatic recovery mode will automatically restart instances when outpost fails.")
 
-    client = boto3.client('cloudformation', region_name=args.region)
+    client = session.client('cloudformation', region_name=region)
 
-    if stack_exists(client, args.stack_name) and not prompt_stack_replacement(args.stack_name):
+    if interactive and stack_exists(client, stack_name) and not prompt_stack_replacement(stack_name):
         print("Operation cancelled by user.")
-        sys.exit(0)
+        return None
 
-    template_body = generate_template_body(args.template_file, launch_template_descriptions, recovery_mode)
+    template_body = generate_template_body(template_file, descriptions, recovery_mode)
 
-    print(f"Generated CloudFormation Template ({'Notification-Only' if recovery_mode == 'notification' else 'Automatic Recovery'} Mode):")
-    print(template_body)
+    if interactive:
+        print(f"Generated CloudFormation Template ({'Notification-Only' if recovery_mode == 'notification' else 'Automatic Recovery'} Mode):")
+        print(template_body)
 
-    if not prompt_template_confirmation():
-        print("Operation cancelled by user.")
-        sys.exit(0)
+        if not prompt_template_confirmation():
+            print("Operation cancelled by user.")
+            return None
 
-    parameters = [
-        {
-            'ParameterKey': 'StackName',
-            'ParameterValue': args.stack_name
-        },
-        {
-            'ParameterKey': 'SourceInstanceId',
-            'ParameterValue': source_instance_id
-        },
-        {
-            'ParameterKey': 'NotificationEmail',
-            'ParameterValue': args.notification_email
-        }
-    ]
-    
-    # Add VPC parameters if detected
-    if vpc_info:
-        parameters.extend([
-            {
-                'ParameterKey': 'VpcId',
-                'ParameterValue': vpc_info['vpc_id']
-            },
-            {
-                'ParameterKey': 'SubnetIds',
-                'ParameterValue': ','.join(vpc_info['subnet_ids'])
-            }
-        ])
-    else:
-        # Prompt for VPC info if not auto-detected
+    # Prompt for VPC info if not auto-detected
+    if not (vpc_id and subnet_ids):
+        if not interactive:
+            raise Exception("VPC ID and subnet IDs are required.")
         vpc_id = input("Enter VPC ID for Lambda function: ").strip()
         subnet_ids = input("Enter comma-separated subnet IDs for Lambda function: ").strip()
-        
-        parameters.extend([
-            {
-                'ParameterKey': 'VpcId',
-                'ParameterValue': vpc_id
-            },
-            {
-                'ParameterKey': 'SubnetIds',
-                'ParameterValue': subnet_ids
-            }
-        ])
 
-    create_or_update_stack(client, args.stack_name, template_body, parameters)
+    parameters = build_stack_parameters(stack_name, source_instance_id, notification_email, vpc_id, subnet_ids)
+
+    return create_or_update_stack(client, stack_name, template_body, parameters, exit_on_error=False)
+
+
+def main():
+    args = parse_arguments()
+
+    # Reuse the resources the template generator already described in this run
+    ec2_client = boto3.client('ec2', region_name=args.region)
+    snapshot = ResourceSnapshot(ec2_client)
+    if args.resource_snapshot:
+        try:
+            snapshot = ResourceSnapshot.load(ec2_client, args.resource_snapshot)
+        except (OSError, ValueError) as e:
+            print(f"Could not load resource snapshot, describing resources again: {e}")
+
+    try:
+        deploy_auto_restart(
+            args.stack_name,
+            args.launch_template_id,
+            args.notification_email,
+            args.region,
+            source_instance_id=args.source_instance_id,
+            primary_template_id=args.primary_template_id,
+            template_file=args.template_file,
+            snapshot=snapshot
+        )
+    except Exception as e:
+        print(f"Auto-restart setup failed: {e}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -2,95 +2,338 @@
 
 import argparse
 import boto3
+import json
+import re
 import sys
+import uuid
+from datetime import datetime, timedelta, timezone
 from botocore.exceptions import ClientError
 
+ALARM_NAME_PREFIX = "InstanceStatusCheckAlarm-"
+
+# DescribeAlarms, EnableAlarmActions and DisableAlarmActions accept at most 100 alarm names per call
+MAX_ALARM_NAMES_PER_CALL = 100
+
+# The Resource Groups Tagging API accepts at most 20 ARNs per TagResources/UntagResources call
+MAX_TAGGED_ARNS_PER_CALL = 20
+
+# Alarm tag recording when a maintenance lease expires (ISO 8601, UTC)
+LEASE_TAG_KEY = "AutoRestartMaintenanceLeaseExpiry"
+LEASE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+DURATION_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Enable/disable maintenance mode for autorestart CloudWatch alarms')
-    parser.add_argument('--stack-name', type=str, required=True, help='CloudFormation stack name')
+    selector = parser.add_mutually_exclusive_group()
+    selector.add_argument('--stack-name', type=str, nargs='+', help='One or more CloudFormation stack names')
+    selector.add_argument('--stack-prefix', type=str, help='Select every autorestart stack whose name starts with this prefix')
+    selector.add_argument('--tag', type=str, help='Select every autorestart stack carrying this stack tag (KEY=VALUE)')
+    selector.add_argument('--outpost-arn', type=str, help='Select every autorestart stack protecting an instance on this Outpost')
     parser.add_argument('--region', type=str, required=True, help='AWS region')
-    parser.add_argument('--action', type=str, choices=['enable', 'disable'], required=True, 
-                       help='enable: disable alarm (maintenance mode), disable: enable alarm (normal mode)')
-    return parser.parse_args()
+    parser.add_argument('--action', type=str, choices=['enable', 'disable', 'sweep'], required=True,
+                       help='enable: disable alarm (maintenance mode), disable: enable alarm (normal mode), '
+                            'sweep: re-enable alarms whose maintenance lease has expired')
+    parser.add_argument('--duration', type=str,
+                       help='Maintenance lease length for --action enable (e.g. 90m, 4h, 2d); alarms are re-enabled once it expires')
+    parser.add_argument('--scheduler-role-arn', type=str,
+                       help='IAM role EventBridge Scheduler assumes to re-enable the alarms when the lease expires')
+    args = parser.parse_args()
+    if args.action != 'sweep' and not (args.stack_name or args.stack_prefix or args.tag or args.outpost_arn):
+        parser.error('one of --stack-name, --stack-prefix, --tag or --outpost-arn is required')
+    if args.tag and '=' not in args.tag:
+        parser.error('--tag must be in KEY=VALUE format')
+    if args.duration and args.action != 'enable':
+        parser.error('--duration can only be used with --action enable')
+    if args.duration and not re.match(r'^\d+[mhd]$', args.duration):
+        parser.error('--duration must be a number followed by m, h or d (e.g. 90m, 4h, 2d)')
+    if args.scheduler_role_arn and not args.duration:
+        parser.error('--scheduler-role-arn requires --duration')
+    return args
 
 def get_alarm_name(stack_name):
-    return f"InstanceStatusCheckAlarm-{stack_name}"
+    return f"{ALARM_NAME_PREFIX}{stack_name}"
+
+def get_stack_name(alarm_name):
+    return alarm_name[len(ALARM_NAME_PREFIX):]
+
+def get_alarm_instance_id(alarm):
+    """Return the instance ID monitored by an alarm, if any"""
+    return next((d['Value'] for d in alarm.get('Dimensions', []) if d['Name'] == 'InstanceId'), None)
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def describe_alarms_by_name(cloudwatch_client, alarm_names):
+    """Describe alarms by name, batching up to the API maximum of names per call"""
+    alarms = []
+    for batch in chunks(list(alarm_names), MAX_ALARM_NAMES_PER_CALL):
+        paginator = cloudwatch_client.get_paginator('describe_alarms')
+        for page in paginator.paginate(AlarmNames=batch, AlarmTypes=['MetricAlarm']):
+            alarms.extend(page['MetricAlarms'])
+    return alarms
+
+def describe_alarms_by_prefix(cloudwatch_client, prefix=ALARM_NAME_PREFIX):
+    """Describe every alarm whose name starts with prefix in one paginated pass"""
+    alarms = []
+    paginator = cloudwatch_client.get_paginator('describe_alarms')
+    for page in paginator.paginate(AlarmNamePrefix=prefix, AlarmTypes=['MetricAlarm'], PaginationConfig={'PageSize': 100}):
+        alarms.extend(page['MetricAlarms'])
+    return alarms
+
+def find_stack_names_by_tag(cloudformation_client, tag):
+    """Return the names of all active stacks carrying the given KEY=VALUE tag"""
+    key, value = tag.split('=', 1)
+    stack_names = []
+    paginator = cloudformation_client.get_paginator('describe_stacks')
+    for page in paginator.paginate():
+        for stack in page['Stacks']:
+            if stack['StackStatus'] == 'DELETE_COMPLETE':
+                continue
+            if any(t['Key'] == key and t['Value'] == value for t in stack.get('Tags', [])):
+                stack_names.append(stack['StackName'])
+    return stack_names
+
+def find_alarms_for_outpost(cloudwatch_client, ec2_client, outpost_arn):
+    """Return the autorestart alarms that monitor instances placed on the given Outpost"""
+    instance_ids = set()
+    paginator = ec2_client.get_paginator('describe_instances')
+    for page in paginator.paginate(Filters=[{'Name': 'outpost-arn', 'Values': [outpost_arn]}]):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                instance_ids.add(instance['InstanceId'])
 
-def enable_maintenance_mode(cloudwatch_client, alarm_name):
-    """Disable the CloudWatch alarm to prevent recovery during maintenance"""
+    if not instance_ids:
+        return []
+    return [alarm for alarm in describe_alarms_by_prefix(cloudwatch_client) if get_alarm_instance_id(alarm) in instance_ids]
+
+def resolve_alarms(args, session):
+    """Resolve the stack selector from the command line into the matching autorestart alarms"""
+    cloudwatch_client = session.client('cloudwatch', region_name=args.region)
+
+    if args.stack_name:
+        alarm_names = [get_alarm_name(stack_name) for stack_name in args.stack_name]
+        alarms = describe_alarms_by_name(cloudwatch_client, alarm_names)
+        found = {alarm['AlarmName'] for alarm in alarms}
+        for alarm_name in alarm_names:
+            if alarm_name not in found:
+                print(f"✗ Alarm {alarm_name} not found")
+        return alarms
+    if args.stack_prefix:
+        return describe_alarms_by_prefix(cloudwatch_client, get_alarm_name(args.stack_prefix))
+    if args.tag:
+        cloudformation_client = session.client('cloudformation', region_name=args.region)
+        stack_names = find_stack_names_by_tag(cloudformation_client, args.tag)
+        return describe_alarms_by_name(cloudwatch_client, [get_alarm_name(name) for name in stack_names])
+
+    ec2_client = session.client('ec2', region_name=args.region)
+    return find_alarms_for_outpost(cloudwatch_client, ec2_client, args.outpost_arn)
+
+def enable_maintenance_mode(cloudwatch_client, alarm_names):
+    """Disable the CloudWatch alarms to prevent recovery during maintenance"""
     try:
-        cloudwatch_client.disable_alarm_actions(AlarmNames=[alarm_name])
-        print(f"✓ Maintenance mode ENABLED - Alarm actions disabled for {alarm_name}")
+        for batch in chunks(list(alarm_names), MAX_ALARM_NAMES_PER_CALL):
+            cloudwatch_client.disable_alarm_actions(AlarmNames=batch)
+        for alarm_name in alarm_names:
+            print(f"✓ Maintenance mode ENABLED - Alarm actions disabled for {alarm_name}")
         print("  Recovery will NOT trigger during maintenance")
         return True
     except ClientError as e:
         print(f"✗ Error enabling maintenance mode: {e}")
         return False
 
-def disable_maintenance_mode(cloudwatch_client, alarm_name):
-    """Enable the CloudWatch alarm to resume normal recovery operations"""
+def disable_maintenance_mode(cloudwatch_client, alarm_names):
+    """Enable the CloudWatch alarms to resume normal recovery operations"""
     try:
-        cloudwatch_client.enable_alarm_actions(AlarmNames=[alarm_name])
-        print(f"✓ Maintenance mode DISABLED - Alarm actions enabled for {alarm_name}")
+        for batch in chunks(list(alarm_names), MAX_ALARM_NAMES_PER_CALL):
+            cloudwatch_client.enable_alarm_actions(AlarmNames=batch)
+        for alarm_name in alarm_names:
+            print(f"✓ Maintenance mode DISABLED - Alarm actions enabled for {alarm_name}")
         print("  Recovery will trigger normally on instance failures")
         return True
     except ClientError as e:
         print(f"✗ Error disabling maintenance mode: {e}")
         return False
 
-def check_alarm_status(cloudwatch_client, alarm_name):
-    """Check current alarm status"""
+def parse_duration(duration):
+    """Convert a duration such as 90m, 4h or 2d into a timedelta"""
+    return timedelta(**{DURATION_UNITS[duration[-1]]: int(duration[:-1])})
+
+def format_lease_expiry(expires_at):
+    return expires_at.strftime(LEASE_TIME_FORMAT)
+
+def parse_lease_expiry(value):
+    return datetime.strptime(value, LEASE_TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+def record_lease(tagging_client, alarm_arns, expires_at):
+    """Tag the alarms with the time their maintenance lease expires"""
+    for batch in chunks(list(alarm_arns), MAX_TAGGED_ARNS_PER_CALL):
+        response = tagging_client.tag_resources(ResourceARNList=batch, Tags={LEASE_TAG_KEY: format_lease_expiry(expires_at)})
+        for arn, failure in response.get('FailedResourcesMap', {}).items():
+            print(f"✗ Could not record maintenance lease on {arn}: {failure.get('ErrorMessage')}")
+
+def clear_lease(tagging_client, alarm_arns):
+    """Remove the maintenance lease tag from the alarms"""
+    for batch in chunks(list(alarm_arns), MAX_TAGGED_ARNS_PER_CALL):
+        tagging_client.untag_resources(ResourceARNList=batch, TagKeys=[LEASE_TAG_KEY])
+
+def clear_existing_leases(tagging_client, alarm_arns):
+    """Remove the maintenance lease tag from those alarms that carry one"""
     try:
-        response = cloudwatch_client.describe_alarms(AlarmNames=[alarm_name])
-        if not response['MetricAlarms']:
-            print(f"✗ Alarm {alarm_name} not found")
-            return False
-        
-        alarm = response['MetricAlarms'][0]
-        actions_enabled = alarm['ActionsEnabled']
-        state = alarm['StateValue']
-        
-        print(f"Current alarm status:")
-        print(f"  Alarm Name: {alarm_name}")
-        print(f"  State: {state}")
-        print(f"  Actions Enabled: {actions_enabled}")
-        print(f"  Maintenance Mode: {'DISABLED' if actions_enabled else 'ENABLED'}")
-        
-        return True
+        leases = get_leases(tagging_client)
     except ClientError as e:
-        print(f"✗ Error checking alarm status: {e}")
+        # Without tag:GetResources there is no way to tell; plain enable/disable must keep working without it
+        print(f"  Could not check for maintenance leases: {e}")
+        return
+    leased = [arn for arn in alarm_arns if arn in leases]
+    if leased:
+        clear_lease(tagging_client, leased)
+        print(f"  Cleared the maintenance lease of {len(leased)} alarm(s)")
+
+def get_leases(tagging_client):
+    """Return {alarm ARN: lease expiry} for every leased alarm in one paginated pass"""
+    leases = {}
+    paginator = tagging_client.get_paginator('get_resources')
+    for page in paginator.paginate(TagFilters=[{'Key': LEASE_TAG_KEY}], ResourceTypeFilters=['cloudwatch:alarm']):
+        for resource in page['ResourceTagMappingList']:
+            value = next((t['Value'] for t in resource.get('Tags', []) if t['Key'] == LEASE_TAG_KEY), None)
+            try:
+                leases[resource['ResourceARN']] = parse_lease_expiry(value)
+            except (TypeError, ValueError):
+                print(f"✗ Ignoring malformed maintenance lease on {resource['ResourceARN']}: {value}")
+    return leases
+
+def schedule_lease_expiry(scheduler_client, alarm_names, expires_at, role_arn):
+    """Create one-time EventBridge Scheduler schedules that re-enable the alarms when the lease expires"""
+    schedule_names = []
+    run_id = uuid.uuid4().hex[:8]
+    for index, batch in enumerate(chunks(list(alarm_names), MAX_ALARM_NAMES_PER_CALL), start=1):
+        schedule_name = f"autorestart-lease-{expires_at.strftime('%Y%m%d%H%M%S')}-{run_id}-{index}"
+        scheduler_client.create_schedule(
+            Name=schedule_name,
+            Description='Re-enable autorestart alarm actions when the maintenance lease expires',
+            ScheduleExpression=f"at({expires_at.strftime('%Y-%m-%dT%H:%M:%S')})",
+            ScheduleExpressionTimezone='UTC',
+            FlexibleTimeWindow={'Mode': 'OFF'},
+            ActionAfterCompletion='DELETE',
+            Target={
+                'Arn': 'arn:aws:scheduler:::aws-sdk:cloudwatch:enableAlarmActions',
+                'RoleArn': role_arn,
+                'Input': json.dumps({'AlarmNames': batch})
+            }
+        )
+        schedule_names.append(schedule_name)
+    return schedule_names
+
+def sweep_expired_leases(session, region, alarms=None):
+    """Re-enable alarms whose maintenance lease expired and clear stale lease tags"""
+    cloudwatch_client = session.client('cloudwatch', region_name=region)
+    tagging_client = session.client('resourcegroupstaggingapi', region_name=region)
+
+    if alarms is None:
+        alarms = describe_alarms_by_prefix(cloudwatch_client)
+    leases = get_leases(tagging_client)
+    now = datetime.now(timezone.utc)
+
+    expired = []
+    stale = []
+    for alarm in alarms:
+        expires_at = leases.get(alarm['AlarmArn'])
+        if expires_at is None:
+            continue
+        if alarm['ActionsEnabled']:
+            # Recovery was already resumed (manually or by a schedule); the lease is no longer relevant
+            stale.append(alarm)
+        elif expires_at <= now:
+            print(f"Maintenance lease for {alarm['AlarmName']} expired at {format_lease_expiry(expires_at)}")
+            expired.append(alarm)
+        else:
+            print(f"Maintenance lease for {alarm['AlarmName']} is active until {format_lease_expiry(expires_at)}")
+
+    if expired and not disable_maintenance_mode(cloudwatch_client, [alarm['AlarmName'] for alarm in expired]):
         return False
+    clear_lease(tagging_client, [alarm['AlarmArn'] for alarm in expired + stale])
+
+    print(f"Sweep complete: {len(expired)} alarm(s) re-enabled, {len(stale)} stale lease(s) cleared")
+    return True
+
+def check_alarm_status(alarms):
+    """Print the current status of already-described alarms"""
+    if not alarms:
+        print("✗ No matching alarms found")
+        return False
+
+    print(f"Current alarm status:")
+    for alarm in alarms:
+        actions_enabled = alarm['ActionsEnabled']
+        print(f"  Alarm Name: {alarm['AlarmName']}")
+        print(f"    State: {alarm['StateValue']}")
+        print(f"    Actions Enabled: {actions_enabled}")
+        print(f"    Maintenance Mode: {'DISABLED' if actions_enabled else 'ENABLED'}")
+
+    return True
 
 def main():
     args = parse_arguments()
-    
+
     try:
-        cloudwatch_client = boto3.client('cloudwatch', region_name=args.region)
-        alarm_name = get_alarm_name(args.stack_name)
-        
-        print(f"Managing maintenance mode for stack: {args.stack_name}")
-        print(f"Region: {args.region}")
-        print(f"Alarm: {alarm_name}")
+        session = boto3.Session()
+        cloudwatch_client = session.client('cloudwatch', region_name=args.region)
+
+        print(f"Managing maintenance mode in region: {args.region}")
         print("-" * 50)
-        
-        # Check current status
-        if not check_alarm_status(cloudwatch_client, alarm_name):
+
+        if args.action == 'sweep':
+            alarms = resolve_alarms(args, session) if (args.stack_name or args.stack_prefix or args.tag or args.outpost_arn) else None
+            if not sweep_expired_leases(session, args.region, alarms):
+                sys.exit(1)
+            return
+
+        # Check current status with as few DescribeAlarms calls as possible
+        alarms = resolve_alarms(args, session)
+        if not check_alarm_status(alarms):
             sys.exit(1)
-        
+
         print("-" * 50)
-        
+
+        # Only touch alarms that are not already in the requested state
+        want_actions_enabled = args.action == 'disable'
+        pending = [alarm['AlarmName'] for alarm in alarms if alarm['ActionsEnabled'] != want_actions_enabled]
+
         # Perform requested action
-        if args.action == 'enable':
-            success = enable_maintenance_mode(cloudwatch_client, alarm_name)
+        if not pending:
+            print(f"All {len(alarms)} alarm(s) are already in the requested state")
+            success = True
+        elif args.action == 'enable':
+            success = enable_maintenance_mode(cloudwatch_client, pending)
         else:
-            success = disable_maintenance_mode(cloudwatch_client, alarm_name)
-        
+            success = disable_maintenance_mode(cloudwatch_client, pending)
+
         if not success:
             sys.exit(1)
-            
+
+        tagging_client = session.client('resourcegroupstaggingapi', region_name=args.region)
+        alarm_arns = [alarm['AlarmArn'] for alarm in alarms]
+        if args.duration:
+            expires_at = datetime.now(timezone.utc).replace(microsecond=0) + parse_duration(args.duration)
+            record_lease(tagging_client, alarm_arns, expires_at)
+            print(f"  Maintenance lease expires at {format_lease_expiry(expires_at)}")
+            if args.scheduler_role_arn:
+                scheduler_client = session.client('scheduler', region_name=args.region)
+                alarm_names = [alarm['AlarmName'] for alarm in alarms]
+                for schedule_name in schedule_lease_expiry(scheduler_client, alarm_names, expires_at, args.scheduler_role_arn):
+                    print(f"  Scheduled automatic re-enable: {schedule_name}")
+            else:
+                print("  Run this script with --action sweep (e.g. from cron) to re-enable alarms once the lease expires")
+        else:
+            # A lease left from an earlier --duration would otherwise let a later sweep re-enable alarms the
+            # operator now means to leave disabled, or linger on alarms that were re-enabled by hand
+            clear_existing_leases(tagging_client, alarm_arns)
+
     except Exception as e:
         print(f"✗ Unexpected error: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+
+from init import DEFAULT_TEMPLATE_FILE, deploy_auto_restart
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Deploy the auto-restart CloudFormation stack to many regions and accounts in parallel.')
+    parser.add_argument('--manifest', type=str, required=True, help='Path to the rollout manifest (JSON)')
+    parser.add_argument('--template-file', type=str, default=DEFAULT_TEMPLATE_FILE, help='Path to the CloudFormation template file')
+    parser.add_argument('--assume-role-name', type=str, help='IAM role name to assume in target accounts that only specify an account_id')
+    parser.add_argument('--max-workers', type=int, default=8, help='Maximum number of stacks deployed at the same time (default: 8)')
+    parser.add_argument('--max-per-region', type=int, default=2, help='Maximum number of concurrent stack deployments per region (default: 2)')
+    parser.add_argument('--report-file', type=str, help='Write the aggregated rollout report to this JSON file')
+    return parser.parse_args()
+
+
+def load_manifest(manifest_path):
+    """Load the rollout manifest and merge defaults into every target"""
+    with open(manifest_path, 'r') as file:
+        manifest = json.load(file)
+
+    defaults = manifest.get('defaults', {})
+    targets = []
+    for index, target in enumerate(manifest.get('targets', []), start=1):
+        merged = dict(defaults)
+        merged.update(target)
+        for key in ('region', 'stack_name', 'launch_template_ids', 'notification_email'):
+            if not merged.get(key):
+                raise Exception(f"Target #{index} in {manifest_path} is missing '{key}'")
+        targets.append(merged)
+
+    if not targets:
+        raise Exception(f"No targets found in {manifest_path}")
+    return targets
+
+
+class SessionProvider:
+    """Hands out one boto3 session per target account, assuming roles at most once"""
+
+    def __init__(self, assume_role_name=None):
+        self.assume_role_name = assume_role_name
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, target):
+        role_arn = target.get('role_arn')
+        if not role_arn and target.get('account_id') and self.assume_role_name:
+            role_arn = f"arn:aws:iam::{target['account_id']}:role/{self.assume_role_name}"
+
+        with self._lock:
+            if role_arn not in self._sessions:
+                self._sessions[role_arn] = self._create_session(role_arn)
+            return self._sessions[role_arn]
+
+    def _create_session(self, role_arn):
+        if not role_arn:
+            return boto3.Session()
+        credentials = boto3.client('sts').assume_role(
+            RoleArn=role_arn,
+            RoleSessionName='autorestart-rollout'
+        )['Credentials']
+        return boto3.Session(
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken']
+        )
+
+
+def get_target_account_id(target):
+    """Return the account a target deploys into, or 'default' for the caller's own credentials"""
+    if target.get('account_id'):
+        return str(target['account_id'])
+    if target.get('role_arn'):
+        return target['role_arn'].split(':')[4]
+    return 'default'
+
+
+def deploy_target(target, template_file, sessions, region_slots):
+    """Deploy the auto-restart stack for one manifest target and return its report entry"""
+    region = target['region']
+    result = {
+        'account_id': get_target_account_id(target),
+        'region': region,
+        'stack_name': target['stack_name'],
+        'status': 'failed',
+        'action': None,
+        'error': None,
+        'duration_seconds': 0
+    }
+
+    with region_slots[region]:
+        start_time = time.time()
+        try:
+            result['action'] = deploy_auto_restart(
+                target['stack_name'],
+                target['launch_template_ids'],
+                target['notification_email'],
+                region,
+                session=sessions.get_session(target),
+                source_instance_id=target.get('source_instance_id'),
+                primary_template_id=target.get('primary_template_id'),
+                vpc_id=target.get('vpc_id'),
+                subnet_ids=target.get('subnet_ids'),
+                descriptions=target.get('descriptions'),
+                recovery_mode=target.get('recovery_mode', 'automatic'),
+                template_file=target.get('template_file', template_file),
+                interactive=False
+            )
+            result['status'] = 'succeeded'
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            result['duration_seconds'] = round(time.time() - start_time, 1)
+
+    return result
+
+
+def rollout(targets, template_file, assume_role_name=None, max_workers=8, max_per_region=2):
+    """Deploy all targets concurrently, capping concurrency per region, and return the aggregated report"""
+    sessions = SessionProvider(assume_role_name)
+    region_slots = {target['region']: threading.BoundedSemaphore(max_per_region) for target in targets}
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(deploy_target, target, template_file, sessions, region_slots) for target in targets]
+        for future in as_completed(futures):
+            result = future.result()
+            marker = '✓' if result['status'] == 'succeeded' else '✗'
+            print(f"{marker} {result['region']} {result['stack_name']}: {result['action'] or result['error']}")
+            results.append(result)
+
+    return sorted(results, key=lambda r: (r['account_id'], r['region'], r['stack_name']))
+
+
+def print_report(results):
+    print("\nRollout Report:")
+    print("-" * 100)
+    print(f"{'Account':<14} {'Region':<16} {'Stack':<40} {'Status':<10} {'Action':<10} {'Time (s)':>8}")
+    print("-" * 100)
+    for result in results:
+        print(f"{result['account_id']:<14} {result['region']:<16} {result['stack_name']:<40} "
+              f"{result['status']:<10} {result['action'] or '-':<10} {result['duration_seconds']:>8}")
+    print("-" * 100)
+
+    failed = [result for result in results if result['status'] != 'succeeded']
+    print(f"{len(results) - len(failed)} succeeded, {len(failed)} failed")
+    for result in failed:
+        print(f"  ✗ {result['region']} {result['stack_name']}: {result['error']}")
+
+
+def main():
+    args = parse_arguments()
+
+    try:
+        targets = load_manifest(args.manifest)
+    except Exception as e:
+        print(f"Failed to load rollout manifest: {e}")
+        sys.exit(1)
+
+    regions = sorted({target['region'] for target in targets})
+    print(f"Rolling out {len(targets)} stack(s) to {len(regions)} region(s): {', '.join(regions)}")
+    print(f"Concurrency: {args.max_workers} total, {args.max_per_region} per region")
+
+    results = rollout(targets, args.template_file, args.assume_role_name, args.max_workers, args.max_per_region)
+    print_report(results)
+
+    if args.report_file:
+        with open(args.report_file, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Report written to {args.report_file}")
+
+    if any(result['status'] != 'succeeded' for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
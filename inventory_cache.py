@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from launch_template_utils import get_instance_userdata
+
+CACHE_DB_PATH = os.environ.get(
+    'OUTPOSTS_INVENTORY_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'outposts-autorestart', 'inventory.db')
+)
+
+# Set OUTPOSTS_INVENTORY_CACHE_DISABLED=1 to always call the AWS APIs directly
+CACHE_DISABLED = os.environ.get('OUTPOSTS_INVENTORY_CACHE_DISABLED', '').lower() in ('1', 'true', 'yes')
+
+# Seconds each resource type stays fresh; instances change most often, Outposts hardly ever
+DEFAULT_TTLS = {
+    'outposts': 3600,
+    'instance_regions': 7 * 24 * 3600,
+    'instance_placements': 24 * 3600,
+    'subnets': 900,
+    'launch_templates': 300,
+    'instances': 60,
+}
+
+
+class InventoryCache:
+    """Read-through cache of AWS describe results shared by every tool in this repository"""
+
+    def __init__(self, path=CACHE_DB_PATH, ttls=None, enabled=not CACHE_DISABLED):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.enabled = enabled
+        if self.enabled:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with self._connect() as connection:
+                    connection.execute(
+                        'CREATE TABLE IF NOT EXISTS inventory ('
+                        'resource_type TEXT NOT NULL, cache_key TEXT NOT NULL, value TEXT NOT NULL, '
+                        'fetched_at REAL NOT NULL, PRIMARY KEY (resource_type, cache_key))'
+                    )
+            except (OSError, sqlite3.Error):
+                # The cache is an optimisation only; run uncached if the database is unusable
+                self.enabled = False
+
+    def _connect(self):
+        # One short-lived connection per operation keeps the cache safe to use from worker threads
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, resource_type, key):
+        """Return the cached value, or None if it is missing or older than the resource type's TTL"""
+        if not self.enabled:
+            return None
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    'SELECT value, fetched_at FROM inventory WHERE resource_type = ? AND cache_key = ?',
+                    (resource_type, key)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not row or time.time() - row[1] > self.ttls.get(resource_type, 0):
+            return None
+        return json.loads(row[0])
+
+    def put(self, resource_type, key, value):
+        if not self.enabled:
+            return
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO inventory (resource_type, cache_key, value, fetched_at) VALUES (?, ?, ?, ?)',
+                    (resource_type, key, json.dumps(value, default=str), time.time())
+                )
+        except sqlite3.Error:
+            pass
+
+    def invalidate(self, resource_type=None, key=None):
+        """Drop cached entries after a mutation; with no arguments the whole cache is cleared"""
+        if not self.enabled:
+            return
+        query = 'DELETE FROM inventory'
+        conditions = []
+        params = []
+        if resource_type:
+            conditions.append('resource_type = ?')
+            params.append(resource_type)
+        if key:
+            conditions.append('cache_key = ?')
+            params.append(key)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        try:
+            with self._connect() as connection:
+                connection.execute(query, params)
+        except sqlite3.Error:
+            pass
+
+    def cached(self, resource_type, key, loader):
+        """Return the cached value for key, calling loader() and caching its result on a miss
+
+        Values are stored as JSON, so timestamps come back as strings whether or not the cache was hit.
+        """
+        value = self.get(resource_type, key)
+        if value is None:
+            value = loader()
+            self.put(resource_type, key, value)
+            # Round-tripped even when the cache is disabled, so callers see the same types either way
+            value = json.loads(json.dumps(value, default=str))
+        return value
+
+
+_default_cache = None
+
+
+def get_inventory_cache():
+    """Return the process-wide inventory cache"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = InventoryCache()
+    return _default_cache
+
+
+def get_account_scope(session=None):
+    """Identify the caller's credentials without an API call so account-wide listings are not shared across accounts"""
+    credentials = (session or boto3.Session()).get_credentials()
+    access_key = credentials.access_key if credentials else 'anonymous'
+    return hashlib.sha256(access_key.encode()).hexdigest()[:16]
+
+
+def get_resource_key(client, resource_id):
+    """Scope a cache key to the caller's credentials and the client's region, so one cache serves many accounts"""
+    return f"{get_account_scope()}:{client.meta.region_name}:{resource_id}"
+
+
+def get_outpost_arn(instance):
+    """Return the Outpost ARN from an instance description, or '' for instances not on an Outpost"""
+    # DescribeInstances reports it as a top-level field; older callers looked under Placement
+    return instance.get('OutpostArn') or instance.get('Placement', {}).get('OutpostArn', '')
+
+
+def index_instance_placements(instances):
+    """Record the Outpost ARN of each instance ('' for instances not on an Outpost)"""
+    cache = get_inventory_cache()
+    for instance in instances:
+        cache.put('instance_placements', instance['InstanceId'], get_outpost_arn(instance))
+
+
+def describe_instance(ec2_client, instance_id):
+    """Return the description of a single instance"""
+    def load():
+        response = ec2_client.describe_instances(InstanceIds=[instance_id])
+        instance = response['Reservations'][0]['Instances'][0]
+        index_instance_placements([instance])
+        return instance
+    return get_inventory_cache().cached('instances', get_resource_key(ec2_client, instance_id), load)
+
+
+def get_instance_outpost_arn(ec2_client, instance_id):
+    """Return the ARN of the Outpost an instance is placed on, or '' if it is not on an Outpost"""
+    outpost_arn = get_inventory_cache().get('instance_placements', instance_id)
+    if outpost_arn is None:
+        outpost_arn = get_outpost_arn(describe_instance(ec2_client, instance_id))
+    return outpost_arn
+
+
+def describe_running_instances(ec2_client, filters=None):
+    """Return every running instance in the client's region matching the optional extra filters"""
+    filters = [{'Name': 'instance-state-name', 'Values': ['running']}] + list(filters or [])
+    key = get_resource_key(ec2_client, json.dumps(filters, sort_keys=True))
+
+    def load():
+        instances = []
+        paginator = ec2_client.get_paginator('describe_instances')
+        for page in paginator.paginate(Filters=filters):
+            for reservation in page['Reservations']:
+                instances.extend(reservation['Instances'])
+        index_instance_placements(instances)
+        return instances
+    return get_inventory_cache().cached('instances', key, load)
+
+
+def describe_subnets_in_vpc(ec2_client, vpc_id):
+    """Return every subnet in the VPC"""
+    def load():
+        subnets = []
+        paginator = ec2_client.get_paginator('describe_subnets')
+        for page in paginator.paginate(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]):
+            subnets.extend(page['Subnets'])
+        return subnets
+    return get_inventory_cache().cached('subnets', get_resource_key(ec2_client, vpc_id), load)
+
+
+def describe_subnet(ec2_client, subnet_id):
+    """Return the description of a single subnet"""
+    def load():
+        return ec2_client.describe_subnets(SubnetIds=[subnet_id])['Subnets'][0]
+    return get_inventory_cache().cached('subnets', get_resource_key(ec2_client, subnet_id), load)
+
+
+def describe_launch_template(ec2_client, launch_template_id):
+    """Return the description of a single launch template"""
+    def load():
+        return ec2_client.describe_launch_templates(LaunchTemplateIds=[launch_template_id])['LaunchTemplates'][0]
+    return get_inventory_cache().cached('launch_templates', get_resource_key(ec2_client, launch_template_id), load)
+
+
+def invalidate_launch_template(ec2_client, launch_template_id):
+    """Drop a launch template's cached description after creating it or changing its versions"""
+    get_inventory_cache().invalidate('launch_templates', get_resource_key(ec2_client, launch_template_id))
+
+
+def list_outposts(outposts_client, life_cycle_statuses=None, availability_zones=None):
+    """Return every Outpost visible in the client's region, filtered server side by lifecycle status and AZ"""
+    filters = {}
+    if life_cycle_statuses:
+        filters['LifeCycleStatusFilter'] = sorted(life_cycle_statuses)
+    if availability_zones:
+        filters['AvailabilityZoneFilter'] = sorted(availability_zones)
+    key = get_resource_key(outposts_client, json.dumps(filters, sort_keys=True))
+
+    def load():
+        outposts = []
+        paginator = outposts_client.get_paginator('list_outposts')
+        for page in paginator.paginate(**filters):
+            outposts.extend(page['Outposts'])
+        return outposts
+    return get_inventory_cache().cached('outposts', key, load)
+
+
+class ResourceSnapshot:
+    """Run-scoped memo of describe results so each instance, subnet and launch template is fetched once per run
+
+    Lookups read through the inventory cache; results stay fixed for the rest of the run even after the cache TTL
+    expires. A snapshot can be saved to a file and loaded by a child process to carry on the same run.
+    User data is memoized for the run only and is never written to the inventory cache or a saved snapshot.
+    """
+
+    def __init__(self, ec2_client, data=None, max_workers=8):
+        self.ec2_client = ec2_client
+        self._data = {'instances': {}, 'vpc_subnets': {}, 'launch_templates': {}, 'userdata': {}}
+        for kind, values in (data or {}).items():
+            self._data.setdefault(kind, {}).update(values)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.max_workers = max_workers
+        self._executor = None
+
+    def _memo(self, kind, key, loader):
+        with self._lock:
+            if key in self._data[kind]:
+                return self._data[kind][key]
+            key_lock = self._key_locks.setdefault((kind, key), threading.Lock())
+        # Concurrent lookups of the same resource wait for the first one instead of calling the API again
+        with key_lock:
+            if key not in self._data[kind]:
+                value = loader()
+                with self._lock:
+                    self._data[kind][key] = value
+            return self._data[kind][key]
+
+    def add(self, kind, key, value):
+        """Record a resource the caller already has, e.g. from a create call or a batch describe"""
+        with self._lock:
+            self._data[kind][key] = value
+
+    def instance(self, instance_id):
+        return self._memo('instances', instance_id, lambda: describe_instance(self.ec2_client, instance_id))
+
+    def subnets_in_vpc(self, vpc_id):
+        return self._memo('vpc_subnets', vpc_id, lambda: describe_subnets_in_vpc(self.ec2_client, vpc_id))
+
+    def launch_template(self, launch_template_id):
+        return self._memo(
+            'launch_templates', launch_template_id, lambda: describe_launch_template(self.ec2_client, launch_template_id)
+        )
+
+    def userdata(self, instance_id):
+        return self._memo('userdata', instance_id, lambda: get_instance_userdata(self.ec2_client, instance_id))
+
+    def prefetch_userdata(self, instance_ids):
+        """Start fetching user data for the instances in the background and return without waiting
+
+        DescribeInstanceAttribute takes one instance per call, so the calls run on a pool of max_workers threads;
+        a later userdata() call for an instance still being fetched waits for that fetch instead of repeating it.
+        User data is the only per-instance lookup left: DescribeInstances already returns each network interface
+        with its groups and attachment, and templates built from an instance do not copy its volumes.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='userdata-prefetch')
+            pending = [instance_id for instance_id in dict.fromkeys(instance_ids) if instance_id not in self._data['userdata']]
+        for instance_id in pending:
+            self._executor.submit(self.userdata, instance_id)
+
+    def save(self, path):
+        with self._lock:
+            data = json.dumps({kind: values for kind, values in self._data.items() if kind != 'userdata'}, default=str)
+        with open(path, 'w') as file:
+            file.write(data)
+
+    @classmethod
+    def load(cls, ec2_client, path):
+        with open(path, 'r') as file:
+            return cls(ec2_client, json.load(file))
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+import base64
+import hashlib
+import json
+import re
+from botocore.exceptions import ClientError
+
+# Metadata options that launch templates accept from an instance description
+VALID_METADATA_KEYS = ['HttpTokens', 'HttpPutResponseHopLimit', 'HttpEndpoint', 'HttpProtocolIpv6', 'InstanceMetadataTags']
+
+# Bump when the template spec layout changes; older specs keep loading
+SPEC_VERSION = 1
+
+def get_instance_userdata(ec2_client, instance_id):
+    """Return the base64 user data of an instance, or '' if it has none or cannot be read"""
+    try:
+        userdata_response = ec2_client.describe_instance_attribute(
+            InstanceId=instance_id,
+            Attribute='userData'
+        )
+        return userdata_response.get('UserData', {}).get('Value', '')
+    except ClientError as e:
+        print(f"  Could not retrieve UserData for {instance_id}: {e.response['Error']['Code']} - {e.response['Error']['Message']}")
+        print(f"  Note: Ensure your IAM user/role has ec2:DescribeInstanceAttribute permission")
+        return ''
+
+def build_launch_template_data(instance, subnet_id, userdata=''):
+    """Build launch template data that recreates the instance in the given subnet"""
+    template_data = {
+        'ImageId': instance['ImageId'],
+        'InstanceType': instance['InstanceType'],
+        'TagSpecifications': [{
+            'ResourceType': 'instance',
+            'Tags': instance.get('Tags', [])
+        }]
+    }
+    
+    # Add optional fields if they exist
+    if instance.get('KeyName'):
+        template_data['KeyName'] = instance['KeyName']
+        
+    # Only add SecurityGroupIds if not using NetworkInterfaces
+    if instance['SecurityGroups'] and len(instance.get('NetworkInterfaces', [])) <= 1:
+        template_data['SecurityGroupIds'] = [sg['GroupId'] for sg in instance['SecurityGroups']]
+        
+    if userdata:
+        template_data['UserData'] = userdata
+        
+    if instance.get('MetadataOptions'):
+        metadata_options = {k: v for k, v in instance['MetadataOptions'].items() if k in VALID_METADATA_KEYS}
+        if metadata_options:
+            template_data['MetadataOptions'] = metadata_options
+        
+    # Include network interfaces - use selected subnet for both ENIs
+    network_interfaces = instance.get('NetworkInterfaces', [])
+    if len(network_interfaces) > 1:
+        eni_configs = []
+        for eni in sorted(network_interfaces, key=lambda x: x['Attachment']['DeviceIndex']):
+            eni_config = {
+                'DeviceIndex': eni['Attachment']['DeviceIndex'],
+                'SubnetId': subnet_id,  # Use selected subnet
+                'Groups': [sg['GroupId'] for sg in eni['Groups']]
+            }
+            eni_configs.append(eni_config)
+        template_data['NetworkInterfaces'] = eni_configs
+    else:
+        # Single ENI - add subnet configuration
+        template_data['NetworkInterfaces'] = [{
+            'DeviceIndex': 0,
+            'SubnetId': subnet_id,
+            'Groups': [sg['GroupId'] for sg in instance['SecurityGroups']]
+        }]
+        # Remove SecurityGroupIds since we're using NetworkInterfaces
+        template_data.pop('SecurityGroupIds', None)
+    
+    # Remove None values but keep empty strings for UserData
+    return {k: v for k, v in template_data.items() if v is not None and (k == 'UserData' or v != '')}
+
+def hash_userdata(userdata):
+    """Return a SHA-256 of the decoded user data so encodings of the same script compare equal"""
+    if not userdata:
+        return None
+    try:
+        raw = base64.b64decode(userdata)
+    except ValueError:
+        raw = userdata.encode()
+    return hashlib.sha256(raw).hexdigest()
+
+def normalize_template_data(template_data):
+    """Reduce launch template data to the fields compared for drift"""
+    network_interfaces = sorted(
+        (
+            eni.get('DeviceIndex', 0),
+            eni.get('SubnetId'),
+            tuple(sorted(eni.get('Groups', [])))
+        )
+        for eni in template_data.get('NetworkInterfaces', [])
+    )
+    tags = sorted(
+        (tag['Key'], tag['Value'])
+        for spec in template_data.get('TagSpecifications', []) if spec.get('ResourceType') == 'instance'
+        for tag in spec.get('Tags', [])
+    )
+    metadata_options = {k: v for k, v in template_data.get('MetadataOptions', {}).items() if k in VALID_METADATA_KEYS}
+    return {
+        'ImageId': template_data.get('ImageId'),
+        'InstanceType': template_data.get('InstanceType'),
+        'KeyName': template_data.get('KeyName'),
+        'SecurityGroupIds': sorted(template_data.get('SecurityGroupIds', [])),
+        'NetworkInterfaces': network_interfaces,
+        'UserDataHash': hash_userdata(template_data.get('UserData')),
+        'MetadataOptions': metadata_options,
+        'Tags': tags
+    }
+
+def diff_template_data(current, desired):
+    """Return the names of the fields that differ between two sets of launch template data"""
+    current = normalize_template_data(current)
+    desired = normalize_template_data(desired)
+    return [field for field in desired if current[field] != desired[field]]
+
+def canonicalize_template_value(value):
+    """Return a JSON-comparable form of a launch template value that ignores key and list order"""
+    if isinstance(value, dict):
+        return {key: canonicalize_template_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        items = [canonicalize_template_value(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+    return value
+
+def diff_full_template_data(current, desired):
+    """Return the top-level fields that differ anywhere between two sets of launch template data
+
+    Unlike diff_template_data this covers every field, e.g. block device mappings or the instance profile,
+    so it suits template specs that carry whole template versions. User data is compared decoded.
+    """
+    def canonical(template_data, field):
+        value = template_data.get(field)
+        if field == 'UserData':
+            return hash_userdata(value)
+        return json.dumps(canonicalize_template_value(value), sort_keys=True, default=str)
+    return [field for field in sorted(set(current) | set(desired)) if canonical(current, field) != canonical(desired, field)]
+
+def get_template_subnet_id(template_data):
+    """Return the subnet of the primary network interface in launch template data"""
+    network_interfaces = sorted(template_data.get('NetworkInterfaces', []), key=lambda eni: eni.get('DeviceIndex', 0))
+    return network_interfaces[0].get('SubnetId') if network_interfaces else None
+
+def get_template_source_instance_id(template_name):
+    """Return the source instance ID from an lt-<name>-<instance-id>[-recovery] template name, or None"""
+    match = re.search(r'-(i-[0-9a-f]{8,17})(?:-recovery)?$', template_name or '')
+    return match.group(1) if match else None
+
+def find_launch_template(ec2_client, template_name):
+    """Return the launch template with the given name, or None if it does not exist"""
+    try:
+        response = ec2_client.describe_launch_templates(LaunchTemplateNames=[template_name])
+        return response['LaunchTemplates'][0]
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('InvalidLaunchTemplateName.NotFoundException', 'InvalidLaunchTemplateName.NotFound'):
+            return None
+        raise
+
+def get_latest_template_version(ec2_client, template_id):
+    """Return the latest version of a launch template"""
+    response = ec2_client.describe_launch_template_versions(LaunchTemplateId=template_id, Versions=['$Latest'])
+    return response['LaunchTemplateVersions'][0]
+
+def update_launch_template(ec2_client, template_id, template_data, drifted_fields):
+    """Create a new launch template version and make it the default; return the new version number"""
+    response = ec2_client.create_launch_template_version(
+        LaunchTemplateId=template_id,
+        VersionDescription=f"Drift update: {', '.join(drifted_fields)}"[:255],
+        LaunchTemplateData=template_data
+    )
+    version_number = response['LaunchTemplateVersion']['VersionNumber']
+    ec2_client.modify_launch_template(LaunchTemplateId=template_id, DefaultVersion=str(version_number))
+    invalidate_cached_template(ec2_client, template_id)
+    return version_number
+
+def invalidate_cached_template(ec2_client, template_id):
+    """Drop the inventory cache entry of a launch template that was just written"""
+    # Imported here to avoid a circular import: inventory_cache uses get_instance_userdata from this module
+    from inventory_cache import invalidate_launch_template
+    invalidate_launch_template(ec2_client, template_id)
+
+def find_launch_templates(ec2_client, template_names):
+    """Return {name: launch template} for the names that exist, looking them up 200 at a time"""
+    templates = {}
+    names = sorted(set(template_names))
+    paginator = ec2_client.get_paginator('describe_launch_templates')
+    for start in range(0, len(names), 200):
+        # Unknown names fail the whole call, so filter on the name instead of passing LaunchTemplateNames
+        filters = [{'Name': 'launch-template-name', 'Values': names[start:start + 200]}]
+        for page in paginator.paginate(Filters=filters):
+            for template in page['LaunchTemplates']:
+                templates[template['LaunchTemplateName']] = template
+    return templates
+
+def ensure_launch_template(ec2_client, template_name, template_data, known_templates=None, compare_all_fields=False):
+    """Create the launch template, or add a default version only if the latest version drifted
+
+    known_templates is an optional {name: template} lookup from find_launch_templates, saving a describe call.
+    By default only the fields an instance can drift in are compared; compare_all_fields compares every field.
+    Returns (template_id, action, drifted_fields) where action is 'created', 'updated' or 'unchanged'.
+    """
+    if known_templates is not None:
+        template = known_templates.get(template_name)
+    else:
+        template = find_launch_template(ec2_client, template_name)
+    if template is None:
+        try:
+            response = ec2_client.create_launch_template(LaunchTemplateName=template_name, LaunchTemplateData=template_data)
+            template_id = response['LaunchTemplate']['LaunchTemplateId']
+            invalidate_cached_template(ec2_client, template_id)
+            return template_id, 'created', []
+        except ClientError as e:
+            # Created by someone else since the lookup; fall through to the drift check
+            if e.response['Error']['Code'] != 'InvalidLaunchTemplateName.AlreadyExistsException':
+                raise
+            template = find_launch_template(ec2_client, template_name)
+
+    template_id = template['LaunchTemplateId']
+    latest = get_latest_template_version(ec2_client, template_id)
+    diff = diff_full_template_data if compare_all_fields else diff_template_data
+    drifted_fields = diff(latest['LaunchTemplateData'], template_data)
+    if not drifted_fields:
+        return template_id, 'unchanged', []
+
+    update_launch_template(ec2_client, template_id, template_data, drifted_fields)
+    return template_id, 'updated', drifted_fields
+
+def build_template_spec(name, template_data, source=None, overrides=None):
+    """Build a template spec: launch template data plus the metadata needed to review and re-apply it"""
+    return {
+        'spec_version': SPEC_VERSION,
+        'name': name,
+        'source': source or {},
+        'launch_template_data': template_data,
+        'overrides': overrides or {}
+    }
+
+def validate_template_spec(spec):
+    """Raise ValueError if a template spec cannot be applied"""
+    if not isinstance(spec, dict):
+        raise ValueError("Template spec must be a JSON object")
+    spec_version = spec.get('spec_version')
+    if not isinstance(spec_version, int) or not 1 <= spec_version <= SPEC_VERSION:
+        raise ValueError(f"Unsupported spec_version {spec_version!r} (supported: 1-{SPEC_VERSION})")
+    name = spec.get('name')
+    if not name or not re.match(r'^[a-zA-Z0-9().\-/_]{3,128}$', name):
+        raise ValueError(f"Invalid launch template name {name!r}")
+    if not isinstance(spec.get('launch_template_data'), dict) or not spec['launch_template_data']:
+        raise ValueError(f"Template spec {name} has no launch_template_data")
+    if not isinstance(spec.get('overrides', {}), dict):
+        raise ValueError(f"Template spec {name} overrides must be a JSON object")
+
+def load_template_spec(path):
+    """Load and validate a template spec file"""
+    with open(path, 'r') as file:
+        spec = json.load(file)
+    try:
+        validate_template_spec(spec)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}")
+    return spec
+
+def write_template_spec(path, spec):
+    """Write a template spec with stable key order and indentation so changes diff cleanly"""
+    with open(path, 'w') as file:
+        json.dump(spec, file, indent=2, sort_keys=True, default=str)
+        file.write('\n')
+
+def resolve_template_spec(spec, region, account_id=None):
+    """Return the spec's launch template data with the overrides for the target account and region applied
+
+    Overrides are keyed by 'ACCOUNT_ID/REGION' or 'REGION' and replace top-level launch template fields; the
+    special key SubnetId moves every network interface to that subnet.
+    """
+    template_data = json.loads(json.dumps(spec['launch_template_data']))
+    overrides = spec.get('overrides', {})
+    for key in (region, f"{account_id}/{region}"):
+        for field, value in overrides.get(key, {}).items():
+            if field == 'SubnetId':
+                for eni in template_data.get('NetworkInterfaces', []):
+                    eni['SubnetId'] = value
+            else:
+                template_data[field] = value
+    return template_data
@@ -1,15 +1,27 @@
 #!/usr/bin/env python3
 
 import boto3
-from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from inventory_cache import get_instance_outpost_arn, get_inventory_cache, list_outposts
 
-def get_outpost_info(instance_id=None, region=None):
+# Keep a single slow or unreachable region from holding up the scan
+REGION_SCAN_CONFIG = Config(connect_timeout=5, read_timeout=10, retries={'max_attempts': 2})
+
+def get_outpost_info(instance_id=None, region=None, outpost_id=None, site_id=None, availability_zone=None,
+                     life_cycle_status=None, hardware_type=None):
     """
     Automatically retrieve outpost ID and owner account ID.
     
     Args:
         instance_id: Optional EC2 instance ID to get outpost info from
         region: Optional AWS region, will auto-detect if not provided
+        outpost_id: Optional Outpost ID or ARN to select from the catalog
+        site_id: Optional site ID to narrow the catalog
+        availability_zone: Optional availability zone to narrow the catalog
+        life_cycle_status: Optional lifecycle status (e.g. ACTIVE) to narrow the catalog
+        hardware_type: Optional hardware type (RACK or SERVER) to narrow the catalog
     
     Returns:
         dict: {'outpost_id': str, 'owner_account_id': str, 'region': str}
@@ -22,57 +34,108 @@ def get_outpost_info(instance_id=None, region=None):
         region = boto3.Session().region_name or 'us-east-1'
     
     try:
-        outposts_client = boto3.client('outposts', region_name=region)
-        
-        # If instance_id provided, get outpost from instance
+        # If instance_id provided, resolve the outpost from the cached instance placement index
         if instance_id:
             ec2_client = boto3.client('ec2', region_name=region)
-            response = ec2_client.describe_instances(InstanceIds=[instance_id])
+            outpost_arn = get_instance_outpost_arn(ec2_client, instance_id)
             
-            for reservation in response['Reservations']:
-                for instance in reservation['Instances']:
-                    placement = instance.get('Placement', {})
-                    outpost_arn = placement.get('OutpostArn')
-                    
-                    if outpost_arn:
-                        outpost_id = outpost_arn.split('/')[-1]
-                        owner_account_id = outpost_arn.split(':')[4]
-                        return {
-                            'outpost_id': outpost_id,
-                            'owner_account_id': owner_account_id,
-                            'region': region
-                        }
+            if outpost_arn:
+                outpost_id = outpost_arn.split('/')[-1]
+                owner_account_id = outpost_arn.split(':')[4]
+                return {
+                    'outpost_id': outpost_id,
+                    'owner_account_id': owner_account_id,
+                    'region': region
+                }
         
-        # Otherwise, list available outposts and use first one
-        response = outposts_client.list_outposts()
-        outposts = response.get('Outposts', [])
-        
-        if outposts:
-            outpost = outposts[0]  # Use first available outpost
-            outpost_id = outpost['OutpostId']
-            owner_account_id = outpost['OwnerId']
-            
-            return {
-                'outpost_id': outpost_id,
-                'owner_account_id': owner_account_id,
-                'region': region
-            }
+        # Otherwise, select exactly one outpost from the filtered catalog
+        outposts = list_outpost_catalog(
+            region,
+            site_id=site_id,
+            availability_zone=availability_zone,
+            life_cycle_status=life_cycle_status,
+            hardware_type=hardware_type
+        )
+        outpost = select_outpost(outposts, outpost_id)
         
-        raise Exception("No outposts found in the account")
+        return {
+            'outpost_id': outpost['OutpostId'],
+            'owner_account_id': outpost['OwnerId'],
+            'region': region
+        }
         
     except ClientError as e:
         raise Exception(f"Failed to retrieve outpost information: {e}")
 
-def find_instance_region(instance_id):
-    """Find which region contains the instance"""
-    session = boto3.Session()
-    regions = session.get_available_regions('ec2')
+def list_outpost_catalog(region, site_id=None, availability_zone=None, life_cycle_status=None, hardware_type=None):
+    """Return the Outposts in a region matching the filters, sorted by site, name and ID"""
+    outposts_client = boto3.client('outposts', region_name=region)
+    # Lifecycle status and availability zone are filtered by ListOutposts; site and hardware type are not supported there
+    outposts = list_outposts(
+        outposts_client,
+        life_cycle_statuses=[life_cycle_status] if life_cycle_status else None,
+        availability_zones=[availability_zone] if availability_zone else None
+    )
+    if site_id:
+        outposts = [outpost for outpost in outposts if outpost.get('SiteId') == site_id]
+    if hardware_type:
+        outposts = [outpost for outpost in outposts if outpost.get('SupportedHardwareType') == hardware_type]
+    return sorted(outposts, key=lambda outpost: (outpost.get('SiteId', ''), outpost.get('Name', ''), outpost['OutpostId']))
+
+def select_outpost(outposts, outpost_id=None):
+    """Select one Outpost from a catalog by ID or ARN; without one, the match with the lowest ID is used"""
+    if outpost_id:
+        for outpost in outposts:
+            if outpost_id in (outpost['OutpostId'], outpost.get('OutpostArn')):
+                return outpost
+        raise Exception(f"Outpost {outpost_id} not found among the {len(outposts)} matching outpost(s)")
     
-    for region in regions:
-        try:
-            ec2_client = boto3.client('ec2', region_name=region)
-            ec2_client.describe_instances(InstanceIds=[instance_id])
-            return region
-        except ClientError:
-            continue
+    if not outposts:
+        raise Exception("No outposts found in the account")
+    # Non-interactive callers rely on getting an Outpost, so ambiguity picks a stable default instead of failing
+    outpost = min(outposts, key=lambda outpost: outpost['OutpostId'])
+    if len(outposts) > 1:
+        candidates = ', '.join(f"{outpost['OutpostId']} ({outpost.get('Name', '')}, site {outpost.get('SiteId', '')})" for outpost in outposts)
+        print(f"⚠ {len(outposts)} outposts match, using {outpost['OutpostId']}; specify one by ID or narrow the filters: {candidates}")
+    return outpost
+
+def get_enabled_regions(session=None):
+    """Return the EC2 regions enabled for the account, falling back to botocore's static list"""
+    session = session or boto3.Session()
+    try:
+        ec2_client = session.client('ec2', region_name=session.region_name or 'us-east-1')
+        return [region['RegionName'] for region in ec2_client.describe_regions()['Regions']]
+    except (ClientError, BotoCoreError):
+        return session.get_available_regions('ec2')
+
+def instance_exists_in_region(instance_id, region):
+    try:
+        ec2_client = boto3.Session().client('ec2', region_name=region, config=REGION_SCAN_CONFIG)
+        ec2_client.describe_instances(InstanceIds=[instance_id])
+        return True
+    except (ClientError, BotoCoreError):
+        return False
+
+def find_instance_region(instance_id, use_cache=True, max_workers=16):
+    """Find which region contains the instance, scanning enabled regions concurrently"""
+    if use_cache:
+        cached_region = get_inventory_cache().get('instance_regions', instance_id)
+        if cached_region:
+            return cached_region
+
+    regions = get_enabled_regions()
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(regions)) or 1)
+    futures = {}
+    try:
+        futures = {executor.submit(instance_exists_in_region, instance_id, region): region for region in regions}
+        for future in as_completed(futures):
+            if future.result():
+                region = futures[future]
+                get_inventory_cache().put('instance_regions', instance_id, region)
+                return region
+    finally:
+        # Return on the first hit without waiting for the remaining regions
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
     return None
@@ -11,7 +11,9 @@ from rich.panel import Panel
 from rich.pretty import Pretty
 
 from launch_wizard.aws.iam import get_available_instance_profile_names
+from launch_wizard.aws.inventory import account_scoped_key, cached_describe, invalidate
 from launch_wizard.aws.pagination import paginate_aws_response
+from launch_wizard.aws.recovery import create_recovery_templates
 from launch_wizard.common.constants import DEFAULT_MINIMUM_ROOT_VOLUME_SIZE, VERIFIED_AMIS
 from launch_wizard.common.enums import EBSVolumeType, FeatureName, OperationSystemType, OutpostHardwareType
 from launch_wizard.common.error_codes import (
@@ -153,6 +155,7 @@ def validate_network(ec2_client: boto3.client, subnet_id: str, outpost_hardware_
                 ):
                     # Enable LNI at the specified device index
                     ec2_client.modify_subnet_attribute(SubnetId=subnet_id, EnableLniAtDeviceIndex=1)
+                    invalidate("subnets", account_scoped_key(ec2_client, subnet_id))
                     # Update the subnet with the new data
                     describe_subnets_response = ec2_client.describe_subnets(SubnetIds=[subnet_id])
                     subnet = describe_subnets_response["Subnets"][0]
@@ -480,8 +483,12 @@ def get_available_subnets_for_outposts(ec2_client: boto3.client) -> List[Dict[st
         typer.Exit: If no Outpost subnets are found or if an AWS error occurs.
     """
 
-    # Use the paginate function to get all subnets
-    available_subnets = paginate_aws_response(ec2_client.describe_subnets, "Subnets")
+    # Use the paginate function to get all subnets, reusing a recent listing from the inventory cache
+    available_subnets = cached_describe(
+        "subnets",
+        account_scoped_key(ec2_client, "all"),
+        lambda: paginate_aws_response(ec2_client.describe_subnets, "Subnets"),
+    )
 
     subnets_for_outposts = [subnet for subnet in available_subnets if "OutpostArn" in subnet]
 
@@ -593,14 +600,18 @@ def get_vpc_id(ec2_client: boto3.client, subnet_id: str) -> str:
     """
 
     try:
-        describe_subnets_response = ec2_client.describe_subnets(SubnetIds=[subnet_id])
+        subnet = cached_describe(
+            "subnets",
+            account_scoped_key(ec2_client, subnet_id),
+            lambda: next(iter(ec2_client.describe_subnets(SubnetIds=[subnet_id])["Subnets"]), None),
+        )
 
-        if not describe_subnets_response["Subnets"]:
+        if not subnet:
             error_and_exit(
                 f"No subnet found with ID {style_var(subnet_id, color='yellow')}.", code=ERR_AWS_SUBNET_NOT_FOUND
             )
 
-        return describe_subnets_response["Subnets"][0]["VpcId"]
+        return subnet["VpcId"]
     except ClientError as e:
         error_and_exit(str(e), code=ERR_AWS_CLIENT)
 
@@ -821,6 +832,8 @@ def launch_instance(
         Console().print("Launching the EC2 instance...")
         # Launch the instance
         run_instances_response = ec2_client.run_instances(**instance_params)
+        # Cached instance listings no longer include the new instance
+        invalidate("instances")
 
         #  Launch instance response
         Console().print(Pretty(run_instances_response))
@@ -855,6 +868,7 @@ def launch_instance_helper_nvme(
     guest_os_scripts: Optional[List[Dict[str, str]]],
     save_user_data_path: Optional[str],
     save_user_data_only: Optional[bool],
+    session: Optional[boto3.Session] = None,
 ) -> None:
     """
     Launch an EC2 instance configured for NVMe storage connectivity.
@@ -885,6 +899,7 @@ def launch_instance_helper_nvme(
         guest_os_scripts: List of additional guest OS scripts to include in user data (optional).
         save_user_data_path: File path to save the generated user data script (optional).
         save_user_data_only: If True, only generate and save user data without launching instance (optional).
+        session: The boto3 session the EC2 client was created from, shared with the launch template tooling (optional).
 
     Raises:
         typer.Exit: If the user cancels the operation or if the instance launch fails.
@@ -916,6 +931,7 @@ def launch_instance_helper_nvme(
         root_volume_type=root_volume_type,
         save_user_data_path=save_user_data_path,
         save_user_data_only=save_user_data_only,
+        session=session,
     )
 
 
@@ -940,6 +956,7 @@ def launch_instance_helper_iscsi(
     guest_os_scripts: Optional[List[Dict[str, str]]],
     save_user_data_path: Optional[str],
     save_user_data_only: Optional[bool],
+    session: Optional[boto3.Session] = None,
 ) -> None:
     """
     Launch an EC2 instance configured for iSCSI storage connectivity.
@@ -970,6 +987,7 @@ def launch_instance_helper_iscsi(
         guest_os_scripts: List of additional guest OS scripts to include in user data (optional).
         save_user_data_path: File path to save the generated user data script (optional).
         save_user_data_only: If True, only generate and save user data without launching instance (optional).
+        session: The boto3 session the EC2 client was created from, shared with the launch template tooling (optional).
 
     Raises:
         typer.Exit: If the user cancels the operation or if the instance launch fails.
@@ -1002,6 +1020,7 @@ def launch_instance_helper_iscsi(
         root_volume_type=root_volume_type,
         save_user_data_path=save_user_data_path,
         save_user_data_only=save_user_data_only,
+        session=session,
     )
 
 
@@ -1021,10 +1040,8 @@ def launch_instance_helper(
     root_volume_type: Optional[EBSVolumeType],
     save_user_data_path: Optional[str],
     save_user_data_only: Optional[bool],
+    session: Optional[boto3.Session] = None,
 ) -> None:
-    import subprocess
-    import os
-    
     # Print out the generated user data script
     Console().print(Panel(user_data, title="User Data Script", style="cyan"))
 
@@ -1066,27 +1083,13 @@ def launch_instance_helper(
         Console().print(f"Instance {style_var(instance_id)} is now running.")
     
     # Ask user if they want to create a launch template
-    if auto_confirm("Would you like to create a launch template for this instance (including a launch template to recover on a secondary Outpost Server)?"):
+    if run_instances_response and auto_confirm(
+        "Would you like to create a launch template for this instance (including a launch template to recover on a secondary Outpost Server)?"
+    ):
         try:
-            # Find the path to template_generator/init.py
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
-            init_script_path = os.path.join(project_root, "template_generator", "init.py")
-            
-            if os.path.exists(init_script_path):
-                Console().print(f"Running launch template creation script: {style_var(init_script_path)}")
-                python_cmd = "python" if os.name == "nt" else "python3"
-                region = ec2_client.meta.region_name
-                
-                # Validate region format to prevent command injection
-                import re
-                if not region or not re.match(r'^[a-z0-9-]+$', region):
-                    raise ValueError(f"Invalid region format: {region}")
-                
-                subprocess.run([python_cmd, init_script_path, "--region", region], check=True)
-            else:
-                Console().print(f"Launch template script not found at: {style_var(init_script_path, color='red')}")
-        except subprocess.CalledProcessError as e:
-            Console().print(f"Error running launch template script: {style_var(str(e), color='red')}")
+            # Run the template generator in this process with the same session instead of a new Python process
+            create_recovery_templates(
+                session or boto3.Session(), ec2_client.meta.region_name, run_instances_response["Instances"][0]["InstanceId"]
+            )
         except Exception as e:
-            Console().print(f"Unexpected error: {style_var(str(e), color='red')}")
+            Console().print(f"Error creating launch templates: {style_var(str(e), color='red')}")
@@ -0,0 +1,73 @@
+"""
+Optional read-through access to the repository-wide inventory cache.
+
+The cache lives in ``inventory_cache.py`` at the root of the repository and is shared with the template
+generator and auto-restart tools. When Launch Wizard is used outside of the repository checkout, the cache
+is not available and every lookup goes straight to the AWS APIs.
+"""
+
+import os
+import sys
+from typing import Any, Callable, Optional, TypeVar
+
+import boto3
+
+# The repository root is three levels above this package (launch_wizard/aws -> launch_wizard -> sample dir -> root)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+if os.path.exists(os.path.join(_PROJECT_ROOT, "inventory_cache.py")) and _PROJECT_ROOT not in sys.path:
+    sys.path.append(_PROJECT_ROOT)
+
+try:
+    import inventory_cache
+except ImportError:
+    inventory_cache = None  # type: ignore[assignment]
+
+T = TypeVar("T")
+
+
+def cached_describe(resource_type: str, key: str, loader: Callable[[], T]) -> T:
+    """
+    Return a cached describe result, calling the loader on a cache miss.
+
+    Args:
+        resource_type: The inventory resource type, which selects the TTL (e.g. "subnets" or "instances").
+        key: The cache key within the resource type.
+        loader: A callable that performs the AWS API call and returns a JSON-serializable result.
+
+    Returns:
+        The cached or freshly loaded result.
+    """
+
+    if inventory_cache is None:
+        return loader()
+    return inventory_cache.get_inventory_cache().cached(resource_type, key, loader)
+
+
+def invalidate(resource_type: str, key: Optional[str] = None) -> None:
+    """
+    Drop cached entries after a mutation so later lookups see the change.
+
+    Args:
+        resource_type: The inventory resource type to invalidate.
+        key: The cache key to invalidate. If None, every entry of the resource type is dropped.
+    """
+
+    if inventory_cache is not None:
+        inventory_cache.get_inventory_cache().invalidate(resource_type, key)
+
+
+def account_scoped_key(client: Any, name: str) -> str:
+    """
+    Build a cache key for a resource or an account-wide listing in the client's region.
+
+    Args:
+        client: The boto3 client used for the lookup.
+        name: A resource ID or a name identifying the listing.
+
+    Returns:
+        A cache key that is unique per set of credentials, region and resource or listing.
+    """
+
+    scope = inventory_cache.get_account_scope(boto3.Session()) if inventory_cache is not None else "default"
+    return f"{scope}:{client.meta.region_name}:{name}"
@@ -0,0 +1,62 @@
+"""
+In-process access to the repository's template generator and auto-restart tooling.
+
+The template generator lives in ``template_generator/init.py`` at the root of the repository. It is loaded by
+path, because its module name clashes with the auto-restart tool's, and called with Launch Wizard's session so
+the launch template and auto-restart setup reuse the same credentials and the resources already described.
+"""
+
+import importlib.util
+import os
+from types import ModuleType
+from typing import List, Optional
+
+import boto3
+
+# The repository root is three levels above this package (launch_wizard/aws -> launch_wizard -> sample dir -> root)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+TEMPLATE_GENERATOR_PATH = os.path.join(_PROJECT_ROOT, "template_generator", "init.py")
+
+
+def load_template_generator() -> Optional[ModuleType]:
+    """
+    Import the template generator module from the repository checkout.
+
+    Returns:
+        The template generator module, or None if Launch Wizard is used outside of the repository checkout or
+        the module cannot be loaded.
+    """
+
+    if not os.path.exists(TEMPLATE_GENERATOR_PATH):
+        return None
+    spec = importlib.util.spec_from_file_location("template_generator_init", TEMPLATE_GENERATOR_PATH)
+    if spec is None or spec.loader is None:
+        return None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_recovery_templates(session: boto3.Session, region: str, instance_id: str) -> List[str]:
+    """
+    Create the primary and recovery launch templates for an instance and offer to set up automated recovery.
+
+    Args:
+        session: The boto3 session used to launch the instance.
+        region: The AWS region of the instance.
+        instance_id: The ID of the instance to create launch templates from.
+
+    Returns:
+        The IDs of the launch templates created, or an empty list if none were created.
+
+    Raises:
+        FileNotFoundError: If the template generator is not available.
+    """
+
+    template_generator = load_template_generator()
+    if template_generator is None:
+        raise FileNotFoundError(f"Launch template generator not found at: {TEMPLATE_GENERATOR_PATH}")
+
+    ec2_client = session.client("ec2", region_name=region)
+    return template_generator.run_interactive(ec2_client, instance_id, session=session)
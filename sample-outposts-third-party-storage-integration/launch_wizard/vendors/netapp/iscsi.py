@@ -212,4 +212,5 @@ def iscsi(
         guest_os_scripts=ctx.obj["guest_os_scripts"],
         save_user_data_path=ctx.obj["save_user_data_path"],
         save_user_data_only=ctx.obj["save_user_data_only"],
+        session=aws_client.session,
     )
@@ -0,0 +1,217 @@
+"""Tests for the batch import pipeline and its import task scheduling."""
+
+import queue
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Set
+
+import pytest
+from botocore.exceptions import ClientError
+
+from vmie.aws import task_monitor
+from vmie.core import batch_import
+from vmie.core.batch_import import BatchImage, BatchImporter
+
+PREPARE_SECONDS = 10
+# Task statuses reported by successive describe calls, until the task completes
+TASK_STEPS = [("active", "pending", None), ("active", "converting", "40")]
+
+
+class FakeClock:
+    """A monotonic clock that only moves when something sleeps or advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self._lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        with self._lock:
+            self.now += seconds
+
+
+class FakeEC2:
+    """Describes import tasks, each completing on its third describe call."""
+
+    def __init__(self):
+        self.describes: Dict[str, int] = {}
+        self.describe_calls: List[List[str]] = []
+
+    def describe_import_image_tasks(self, ImportTaskIds):
+        self.describe_calls.append(list(ImportTaskIds))
+        tasks = []
+        for task_id in ImportTaskIds:
+            step = self.describes.get(task_id, 0)
+            self.describes[task_id] = step + 1
+            if step < len(TASK_STEPS):
+                status, message, progress = TASK_STEPS[step]
+                task = {"ImportTaskId": task_id, "Status": status, "StatusMessage": message}
+                if progress:
+                    task["Progress"] = progress
+            else:
+                task = {"ImportTaskId": task_id, "Status": "completed", "ImageId": f"ami-{task_id}"}
+            tasks.append(task)
+        return {"ImportImageTasks": tasks}
+
+
+class FakeAWSClient:
+    """Starts import tasks against an account-wide quota, recording how many ran at once."""
+
+    def __init__(self, quota: int = 20):
+        self.ec2 = FakeEC2()
+        self.quota = quota
+        self.started: List[str] = []
+        self.rejected: List[str] = []
+        self.max_running = 0
+
+    def running(self) -> Set[str]:
+        return {task_id for task_id in self.started if self.ec2.describes.get(task_id, 0) <= len(TASK_STEPS)}
+
+    def start_import_task(self, disk_containers, description, license_type=None, usage_operation=None):
+        source = disk_containers[0]["Url"]
+        if len(self.running()) >= self.quota:
+            self.rejected.append(source)
+            raise ClientError({"Error": {"Code": "ResourceCountLimitExceeded", "Message": "quota"}}, "ImportImage")
+        if "reject" in source:
+            raise ClientError({"Error": {"Code": "InvalidParameter", "Message": "bad disk"}}, "ImportImage")
+        task_id = f"import-{len(self.started) + 1}"
+        self.started.append(task_id)
+        self.max_running = max(self.max_running, len(self.running()))
+        return task_id
+
+    def create_s3_bucket(self, bucket_name):
+        return True
+
+    def setup_vmimport_role(self, bucket_name):
+        pass
+
+
+class FakeVMIECore:
+    """Stages images instantly on the fake clock, failing those named "fail" or "exit"."""
+
+    def __init__(self, clock: FakeClock, aws_client: FakeAWSClient, temp_dir: Path):
+        self.clock = clock
+        self.aws_client = aws_client
+        self.bucket_name = "bucket"
+        self.temp_dir = temp_dir
+        self.license_type: Optional[str] = None
+        self.usage_operation: Optional[str] = None
+
+    def stage_image(self, source):
+        self.clock.advance(PREPARE_SECONDS)
+        if source.startswith("fail"):
+            raise RuntimeError("download failed")
+        if source.startswith("exit"):
+            raise SystemExit(2)
+        return f"s3://bucket/{source}", source
+
+    def get_import_request(self, import_source, filename):
+        return [{"Format": "RAW", "Url": import_source}], f"Import of {filename}"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(batch_import, "time", clock)
+    monkeypatch.setattr(
+        task_monitor,
+        "time",
+        SimpleNamespace(monotonic=clock.monotonic, time=time.time, strftime=time.strftime, localtime=time.localtime),
+    )
+    return clock
+
+
+def make_importer(clock, tmp_path, max_concurrent_imports=2, quota=20):
+    vmie = FakeVMIECore(clock, FakeAWSClient(quota), tmp_path / "temp")
+    return BatchImporter(vmie, max_concurrent_imports)  # type: ignore[arg-type]
+
+
+def prepare(importer: BatchImporter, sources: List[str]) -> "tuple[List[BatchImage], queue.Queue]":
+    """Prepare every image up front, so scheduling runs on the fake clock alone."""
+    batch = [BatchImage(number, source) for number, source in enumerate(sources, start=1)]
+    prepared: "queue.Queue[Optional[BatchImage]]" = queue.Queue()
+    importer._prepare_images(batch, prepared)
+    return batch, prepared
+
+
+def test_no_more_than_max_concurrent_imports_run(clock, tmp_path):
+    importer = make_importer(clock, tmp_path, max_concurrent_imports=2)
+    batch, prepared = prepare(importer, [f"disk{number}.raw" for number in range(1, 6)])
+
+    importer._schedule_imports(prepared)
+
+    aws = importer.aws_client
+    assert [image.ami_id for image in batch] == [f"ami-import-{number}" for number in range(1, 6)]
+    assert aws.max_running == 2 and not aws.rejected
+    # Every poll describes all running tasks at once
+    assert ["import-1", "import-2"] in aws.ec2.describe_calls
+    assert all(len(task_ids) <= 2 for task_ids in aws.ec2.describe_calls)
+    assert not importer.monitor.tasks
+
+
+def test_quota_exceeded_requeues_the_image(clock, tmp_path):
+    # Other imports in the account leave room for one task, below the batch's own limit
+    importer = make_importer(clock, tmp_path, max_concurrent_imports=3, quota=1)
+    batch, prepared = prepare(importer, ["disk1.raw", "disk2.raw", "disk3.raw"])
+
+    importer._schedule_imports(prepared)
+
+    aws = importer.aws_client
+    assert [image.error for image in batch] == [None, None, None]
+    assert [image.ami_id for image in batch] == ["ami-import-1", "ami-import-2", "ami-import-3"]
+    assert aws.max_running == 1
+    assert "s3://bucket/disk2.raw" in aws.rejected and "s3://bucket/disk3.raw" in aws.rejected
+    # Images keep their manifest order through the retries
+    assert [image.task_id for image in batch] == aws.started
+
+
+def test_start_failure_fails_only_that_image(clock, tmp_path):
+    importer = make_importer(clock, tmp_path)
+    batch, prepared = prepare(importer, ["disk1.raw", "reject.raw", "disk3.raw"])
+
+    importer._schedule_imports(prepared)
+
+    assert batch[1].error is not None and batch[1].error.startswith("queue failed:")
+    assert "bad disk" in batch[1].error
+    assert [batch[0].ami_id, batch[2].ami_id] == ["ami-import-1", "ami-import-2"]
+
+
+def test_failed_stage_does_not_stop_later_images(clock, tmp_path):
+    importer = make_importer(clock, tmp_path)
+    manifest = [{"source": source} for source in ["disk1.raw", "fail.raw", "exit.raw", "disk4.raw"]]
+
+    batch = importer.run(manifest)
+
+    assert [image.error for image in batch] == [
+        None,
+        "prepare failed: download failed",
+        "prepare failed: exit code 2",
+        None,
+    ]
+    assert [batch[0].ami_id, batch[3].ami_id] == ["ami-import-1", "ami-import-2"]
+    assert importer.aws_client.started == ["import-1", "import-2"]
+    # Failed images never reach the import queue
+    assert BatchImage.QUEUE not in batch[1].timings and BatchImage.QUEUE not in batch[2].timings
+
+
+def test_phase_timings(clock, tmp_path):
+    importer = make_importer(clock, tmp_path, max_concurrent_imports=2)
+    batch, prepared = prepare(importer, ["disk1.raw", "disk2.raw", "disk3.raw"])
+
+    importer._schedule_imports(prepared)
+
+    timings = [image.timings for image in batch]
+    assert [timing[BatchImage.PREPARE] for timing in timings] == [PREPARE_SECONDS] * 3
+    # Queued while the later images were prepared; image 3 then waits for a free import slot
+    assert timings[0][BatchImage.QUEUE] == 2 * PREPARE_SECONDS
+    assert timings[1][BatchImage.QUEUE] == PREPARE_SECONDS
+    assert timings[2][BatchImage.QUEUE] == pytest.approx(timings[0][BatchImage.IMPORT])
+    assert all(timing[BatchImage.IMPORT] > 0 for timing in timings)
+    assert all(image.phase is None for image in batch)
@@ -0,0 +1,370 @@
+"""Tests for converting qcow2 and raw images to stream-optimized VMDK."""
+
+import errno
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+from vmie.common import VMDK_GRAIN_SIZE
+from vmie.core import image_conversion
+from vmie.core.image_conversion import Qcow2Image, RawImage, StreamOptimizedVmdkWriter
+
+CLUSTER_BITS = 12
+CLUSTER_SIZE = 1 << CLUSTER_BITS
+GRAIN_SECTORS = VMDK_GRAIN_SIZE // 512
+
+
+def pattern(seed: int, size: int = CLUSTER_SIZE) -> bytes:
+    """Return non-zero data that differs per seed."""
+    return bytes((seed * 31 + i) % 251 + 1 for i in range(size))
+
+
+def build_qcow2(path: Path, virtual_size: int, clusters: Dict[int, Tuple[str, bytes]], version: int = 3) -> None:
+    """
+    Write a qcow2 image with 4 KiB clusters and a single L2 table.
+
+    :param clusters: {guest cluster index: (kind, data)} where kind is "data", "compressed" or "zero"; a zero
+        cluster keeps a host cluster holding garbage, so reading it instead of skipping it would be noticed
+    """
+    l2_entries = CLUSTER_SIZE // 8
+    assert virtual_size <= l2_entries * CLUSTER_SIZE
+    l1_offset, l2_offset = CLUSTER_SIZE, 2 * CLUSTER_SIZE
+    body = bytearray()
+    next_host = 3 * CLUSTER_SIZE
+    l2 = [0] * l2_entries
+    compressed_offset_bits = 62 - (CLUSTER_BITS - 8)
+
+    for index, (kind, data) in sorted(clusters.items()):
+        if kind == "compressed":
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+            # Not sector-aligned, as qemu packs compressed clusters
+            host = next_host + 100
+            sectors = -(-(host % 512 + len(payload)) // 512)
+            l2[index] = 1 << 62 | (sectors - 1) << compressed_offset_bits | host
+            body += bytes(100) + payload
+            next_host += 100 + len(payload)
+        else:
+            host = -(-next_host // CLUSTER_SIZE) * CLUSTER_SIZE
+            body += bytes(host - next_host)
+            if kind == "zero":
+                l2[index] = host | 1
+                body += b"\xee" * CLUSTER_SIZE
+            else:
+                l2[index] = host
+                body += data.ljust(CLUSTER_SIZE, b"\0")
+            next_host = host + CLUSTER_SIZE
+
+    header = struct.pack(
+        ">4sIQIIQIIQQIIQ", b"QFI\xfb", version, 0, 0, CLUSTER_BITS, virtual_size, 0, 1, l1_offset, 0, 0, 0, 0
+    )
+    if version == 3:
+        header += struct.pack(">QQQII", 0, 0, 0, 4, 104)
+    with open(path, "wb") as f:
+        f.write(header.ljust(CLUSTER_SIZE, b"\0"))
+        f.write(struct.pack(">Q", 1 << 63 | l2_offset).ljust(CLUSTER_SIZE, b"\0"))
+        f.write(struct.pack(f">{l2_entries}Q", *l2))
+        f.write(body)
+
+
+def write_vmdk(path: Path, capacity: int, extents) -> StreamOptimizedVmdkWriter:
+    writer = StreamOptimizedVmdkWriter(capacity, path.name, workers=2)
+    with open(path, "wb") as f:
+        for chunk in writer.iter_chunks(extents):
+            f.write(chunk)
+    return writer
+
+
+def parse_vmdk(path: Path) -> Tuple[dict, List[int], Dict[int, bytes]]:
+    """
+    Parse a stream-optimized VMDK back, checking its markers on the way.
+
+    :return: Header fields, grain directory and {grain index: grain data}
+    """
+    vmdk = path.read_bytes()
+    assert len(vmdk) % 512 == 0
+
+    fields = struct.unpack_from("<IIIQQQQIQQQ", vmdk)
+    keys = ["magic", "version", "flags", "capacity", "grain_size", "descriptor_offset", "descriptor_size"]
+    keys += ["gt_entries", "rgd_offset", "gd_offset", "overhead"]
+    header = dict(zip(keys, fields))
+    assert header["magic"] == 0x564D444B and header["version"] == 3
+    assert header["gd_offset"] == 0xFFFFFFFFFFFFFFFF
+    descriptor = vmdk[512 : 512 * (1 + header["descriptor_size"])].rstrip(b"\0").decode()
+    assert f"RW {header['capacity']} SPARSE" in descriptor
+
+    # End-of-stream marker, preceded by the footer and its marker
+    assert vmdk[-512:] == bytes(512)
+    footer = dict(zip(keys, struct.unpack_from("<IIIQQQQIQQQ", vmdk, len(vmdk) - 1024)))
+    assert struct.unpack_from("<QII", vmdk, len(vmdk) - 1536) == (1, 0, 3)
+    assert {k: v for k, v in footer.items() if k != "gd_offset"} == {
+        k: v for k, v in header.items() if k != "gd_offset"
+    }
+
+    total_grains = -(-header["capacity"] // header["grain_size"])
+    gd_sector = footer["gd_offset"]
+    gd_length = -(-total_grains // header["gt_entries"])
+    assert struct.unpack_from("<QII", vmdk, (gd_sector - 1) * 512) == (-(-gd_length * 4 // 512), 0, 2)
+    directory = list(struct.unpack_from(f"<{gd_length}I", vmdk, gd_sector * 512))
+
+    grains = {}
+    for table_index, gt_sector in enumerate(directory):
+        if not gt_sector:
+            continue
+        assert struct.unpack_from("<QII", vmdk, (gt_sector - 1) * 512) == (4, 0, 1)
+        table = struct.unpack_from(f"<{header['gt_entries']}I", vmdk, gt_sector * 512)
+        for entry_index, grain_sector in enumerate(table):
+            if not grain_sector:
+                continue
+            grain_index = table_index * header["gt_entries"] + entry_index
+            lba, size = struct.unpack_from("<QI", vmdk, grain_sector * 512)
+            assert lba == grain_index * header["grain_size"]
+            data = zlib.decompress(vmdk[grain_sector * 512 + 12 : grain_sector * 512 + 12 + size])
+            assert len(data) == VMDK_GRAIN_SIZE
+            grains[grain_index] = data
+    return header, directory, grains
+
+
+def assemble(capacity: int, grains: Dict[int, bytes]) -> bytes:
+    disk = bytearray(-(-capacity // VMDK_GRAIN_SIZE) * VMDK_GRAIN_SIZE)
+    for index, data in grains.items():
+        disk[index * VMDK_GRAIN_SIZE : (index + 1) * VMDK_GRAIN_SIZE] = data
+    return bytes(disk[:capacity])
+
+
+# Guest clusters of the sample image; 16 clusters make up one grain
+QCOW2_CLUSTERS = {
+    0: ("data", pattern(0)),
+    1: ("data", pattern(1)),  # contiguous with cluster 0, read together
+    # 2: unallocated
+    3: ("zero", b""),
+    4: ("compressed", pattern(4)),
+    5: ("data", pattern(5)),
+    20: ("data", pattern(20)),  # grain 1
+    # grain 2 is empty
+    48: ("data", pattern(48)),  # grain 3, cut short by the virtual size
+}
+QCOW2_VIRTUAL_SIZE = 48 * CLUSTER_SIZE + 1024
+
+
+def expected_disk() -> bytes:
+    disk = bytearray(QCOW2_VIRTUAL_SIZE)
+    for index, (kind, data) in QCOW2_CLUSTERS.items():
+        if kind != "zero":
+            start = index * CLUSTER_SIZE
+            disk[start : start + CLUSTER_SIZE] = data[: QCOW2_VIRTUAL_SIZE - start]
+    return bytes(disk)
+
+
+@pytest.fixture
+def qcow2_path(tmp_path):
+    path = tmp_path / "disk.qcow2"
+    build_qcow2(path, QCOW2_VIRTUAL_SIZE, QCOW2_CLUSTERS)
+    return path
+
+
+def test_qcow2_yields_only_allocated_clusters(qcow2_path):
+    with Qcow2Image(qcow2_path) as image:
+        assert image.virtual_size == QCOW2_VIRTUAL_SIZE
+        extents = list(image.iter_data())
+
+    assert [(offset // CLUSTER_SIZE, len(data)) for offset, data in extents] == [
+        (0, 2 * CLUSTER_SIZE),
+        (4, CLUSTER_SIZE),
+        (5, CLUSTER_SIZE),
+        (20, CLUSTER_SIZE),
+        (48, 1024),
+    ]
+    disk = bytearray(QCOW2_VIRTUAL_SIZE)
+    for offset, data in extents:
+        disk[offset : offset + len(data)] = data
+    assert bytes(disk) == expected_disk()
+
+
+def test_qcow2_contiguous_runs_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_conversion, "CONVERT_READ_SIZE", 2 * CLUSTER_SIZE)
+    path = tmp_path / "run.qcow2"
+    build_qcow2(path, 8 * CLUSTER_SIZE, {index: ("data", pattern(index)) for index in range(5)})
+
+    with Qcow2Image(path) as image:
+        extents = list(image.iter_data())
+
+    assert [(offset // CLUSTER_SIZE, len(data) // CLUSTER_SIZE) for offset, data in extents] == [(0, 2), (2, 2), (4, 1)]
+    assert b"".join(data for _, data in extents) == b"".join(pattern(index) for index in range(5))
+
+
+def test_qcow2_version_2_is_read(tmp_path):
+    path = tmp_path / "v2.qcow2"
+    build_qcow2(path, 2 * CLUSTER_SIZE, {1: ("data", pattern(1))}, version=2)
+
+    with Qcow2Image(path) as image:
+        assert list(image.iter_data()) == [(CLUSTER_SIZE, pattern(1))]
+
+
+@pytest.mark.parametrize(
+    "features, message",
+    [(1 << 1, "marked corrupt"), (1 << 3, "non-zlib compression"), (1 << 4, "extended L2 entries")],
+)
+def test_qcow2_unsupported_features_are_rejected(tmp_path, features, message):
+    path = tmp_path / "feature.qcow2"
+    build_qcow2(path, CLUSTER_SIZE, {})
+    with open(path, "r+b") as f:
+        f.seek(72)
+        f.write(struct.pack(">Q", features))
+
+    with pytest.raises(ValueError, match=message):
+        Qcow2Image(path)
+
+
+def test_qcow2_round_trips_through_vmdk(qcow2_path, tmp_path):
+    vmdk_path = tmp_path / "disk.vmdk"
+    with Qcow2Image(qcow2_path) as image:
+        writer = write_vmdk(vmdk_path, image.virtual_size, image.iter_data())
+
+    header, directory, grains = parse_vmdk(vmdk_path)
+    assert header["capacity"] == -(-QCOW2_VIRTUAL_SIZE // 512)
+    assert header["grain_size"] == GRAIN_SECTORS
+    assert header["overhead"] % GRAIN_SECTORS == 0
+    assert len(directory) == 1 and directory[0]
+    assert sorted(grains) == [0, 1, 3]
+    assert (writer.data_grains, writer.zero_grains) == (3, 0)
+    assert writer.bytes_written == vmdk_path.stat().st_size
+    assert assemble(QCOW2_VIRTUAL_SIZE, grains) == expected_disk()
+
+    if shutil.which("qemu-img"):
+        raw_path = tmp_path / "expected.raw"
+        raw_path.write_bytes(expected_disk())
+        subprocess.run(["qemu-img", "check", "-f", "vmdk", str(vmdk_path)], check=True, capture_output=True)
+        subprocess.run(
+            ["qemu-img", "compare", "-f", "raw", "-F", "vmdk", str(raw_path), str(vmdk_path)],
+            check=True,
+            capture_output=True,
+        )
+
+
+def test_vmdk_grain_tables_span_the_directory(tmp_path):
+    # A grain in the second grain table leaves the first grain directory entry empty
+    capacity = 600 * VMDK_GRAIN_SIZE
+    grain_index = 550
+    vmdk_path = tmp_path / "wide.vmdk"
+    write_vmdk(vmdk_path, capacity, [(grain_index * VMDK_GRAIN_SIZE + 10, b"\x01" * 20)])
+
+    header, directory, grains = parse_vmdk(vmdk_path)
+    assert header["capacity"] == capacity // 512
+    assert len(directory) == 2 and directory[0] == 0 and directory[1]
+    assert list(grains) == [grain_index]
+    assert grains[grain_index] == bytes(10) + b"\x01" * 20 + bytes(VMDK_GRAIN_SIZE - 30)
+
+
+def test_vmdk_output_is_deterministic(qcow2_path, tmp_path):
+    outputs = []
+    for name in ("a", "b"):
+        vmdk_path = tmp_path / name / "disk.vmdk"
+        vmdk_path.parent.mkdir()
+        with Qcow2Image(qcow2_path) as image:
+            write_vmdk(vmdk_path, image.virtual_size, image.iter_data())
+        outputs.append(vmdk_path.read_bytes())
+    assert outputs[0] == outputs[1]
+
+
+RAW_SIZE = 5 * VMDK_GRAIN_SIZE + 4096  # not a multiple of the grain size
+
+
+@pytest.fixture
+def sparse_raw(tmp_path):
+    """A sparse raw image with data in grain 1 and in the partial last grain, holes elsewhere."""
+    path = tmp_path / "disk.raw"
+    with open(path, "wb") as f:
+        f.truncate(RAW_SIZE)
+        f.seek(VMDK_GRAIN_SIZE + 8192)
+        f.write(pattern(1))
+        f.seek(5 * VMDK_GRAIN_SIZE)
+        f.write(pattern(5))
+    return path
+
+
+def supports_seek_data(directory: Path) -> bool:
+    """Check whether the file system reports the holes of a sparse file in the directory."""
+    if not hasattr(os, "SEEK_DATA"):
+        return False
+    probe = directory / "probe"
+    with open(probe, "wb") as f:
+        f.truncate(4 * VMDK_GRAIN_SIZE)
+        f.seek(2 * VMDK_GRAIN_SIZE)
+        f.write(b"\x01")
+    fd = os.open(probe, os.O_RDONLY)
+    try:
+        return os.lseek(fd, 0, os.SEEK_DATA) > 0
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+        probe.unlink()
+
+
+def convert_raw(path: Path, vmdk_path: Path) -> Tuple[StreamOptimizedVmdkWriter, List[Tuple[int, int]]]:
+    with RawImage(path) as image:
+        extents = list(image.iter_data())
+        writer = write_vmdk(vmdk_path, image.virtual_size, extents)
+    return writer, [(offset, len(data)) for offset, data in extents]
+
+
+def check_sparse_raw_vmdk(path: Path, vmdk_path: Path) -> None:
+    header, directory, grains = parse_vmdk(vmdk_path)
+    assert header["capacity"] * 512 == RAW_SIZE
+    assert sorted(grains) == [1, 5]
+    assert assemble(RAW_SIZE, grains) == path.read_bytes()
+
+
+def test_raw_holes_are_skipped_with_seek_data(sparse_raw, tmp_path):
+    if not supports_seek_data(tmp_path):
+        pytest.skip("the file system does not report holes")
+
+    writer, extents = convert_raw(sparse_raw, tmp_path / "disk.vmdk")
+
+    # Only the file system blocks holding data are read, so no zero grain is even looked at
+    assert extents[0][0] >= VMDK_GRAIN_SIZE
+    assert sum(length for _, length in extents) < 2 * VMDK_GRAIN_SIZE
+    assert (writer.data_grains, writer.zero_grains) == (2, 0)
+    check_sparse_raw_vmdk(sparse_raw, tmp_path / "disk.vmdk")
+
+
+@pytest.mark.parametrize("unsupported", ["platform", "file system"])
+def test_raw_zero_grains_are_dropped_without_seek_data(sparse_raw, tmp_path, monkeypatch, unsupported):
+    if unsupported == "platform":
+        monkeypatch.delattr(os, "SEEK_DATA", raising=False)
+    else:
+
+        def lseek(fd, offset, whence):
+            raise OSError(errno.EINVAL, "Invalid argument")
+
+        monkeypatch.setattr(image_conversion.os, "lseek", lseek)
+
+    writer, extents = convert_raw(sparse_raw, tmp_path / "disk.vmdk")
+
+    # The whole file is read and the all-zero grains are dropped by the writer
+    assert extents == [(0, RAW_SIZE)]
+    assert (writer.data_grains, writer.zero_grains) == (2, 4)
+    check_sparse_raw_vmdk(sparse_raw, tmp_path / "disk.vmdk")
+
+
+def test_raw_all_hole_image_has_no_grains(tmp_path):
+    path = tmp_path / "empty.raw"
+    with open(path, "wb") as f:
+        f.truncate(RAW_SIZE)
+    vmdk_path = tmp_path / "empty.vmdk"
+
+    writer, extents = convert_raw(path, vmdk_path)
+
+    # Nothing is read where holes are reported; otherwise every grain is read and dropped as zeros
+    assert extents == ([] if supports_seek_data(tmp_path) else [(0, RAW_SIZE)])
+    assert writer.data_grains == 0
+    header, directory, grains = parse_vmdk(vmdk_path)
+    assert header["capacity"] * 512 == RAW_SIZE
+    assert directory == [0] and grains == {}
@@ -0,0 +1,221 @@
+"""Tests for resumable and streaming S3 multipart uploads."""
+
+import base64
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import pytest
+from botocore.exceptions import ClientError
+
+from vmie.aws import multipart_upload
+from vmie.aws.multipart_upload import MultipartUploader, UploadSettings
+from vmie.common import MIB
+
+PART_SIZE = 5 * MIB
+
+
+class FakeS3:
+    """Thread-safe in-memory stand-in for the multipart upload calls of an S3 client."""
+
+    def __init__(self):
+        self.uploads: Dict[str, Dict[int, dict]] = {}
+        self.objects: Dict[str, bytes] = {}
+        self.created: List[str] = []
+        self.uploaded_parts: List[int] = []
+        self.completed_parts: List[dict] = []
+        self.aborted: List[str] = []
+        self.fail_part: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _error(code: str, operation: str) -> ClientError:
+        return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        with self._lock:
+            upload_id = f"upload-{len(self.created) + 1}"
+            self.created.append(upload_id)
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ChecksumSHA256=None):
+        if PartNumber == self.fail_part:
+            raise self._error("InternalError", "UploadPart")
+        if ChecksumSHA256 is not None:
+            assert ChecksumSHA256 == base64.b64encode(hashlib.sha256(Body).digest()).decode()
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        with self._lock:
+            if UploadId not in self.uploads:
+                raise self._error("NoSuchUpload", "UploadPart")
+            self.uploads[UploadId][PartNumber] = {"ETag": etag, "Body": Body, "ChecksumSHA256": ChecksumSHA256}
+            self.uploaded_parts.append(PartNumber)
+        return {"ETag": etag}
+
+    def get_paginator(self, operation_name):
+        assert operation_name == "list_parts"
+        return self
+
+    def paginate(self, Bucket, Key, UploadId):
+        if UploadId not in self.uploads:
+            raise self._error("NoSuchUpload", "ListParts")
+        parts = [
+            {"PartNumber": number, "ETag": part["ETag"], "Size": len(part["Body"])}
+            for number, part in sorted(self.uploads[UploadId].items())
+        ]
+        # Two pages, as list_parts returns at most 1,000 parts per call
+        yield {"Parts": parts[:1]}
+        yield {"Parts": parts[1:]}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = MultipartUpload["Parts"]
+        stored = self.uploads.pop(UploadId)
+        assert [part["PartNumber"] for part in parts] == list(range(1, len(parts) + 1))
+        for part in parts:
+            assert part["ETag"] == stored[part["PartNumber"]]["ETag"]
+            if "ChecksumSHA256" in part:
+                assert part["ChecksumSHA256"] == stored[part["PartNumber"]]["ChecksumSHA256"]
+        self.completed_parts = parts
+        self.objects[f"{Bucket}/{Key}"] = b"".join(stored[part["PartNumber"]]["Body"] for part in parts)
+        return {"ETag": '"final"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+        self.uploads.pop(UploadId, None)
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    path = tmp_path / "checkpoints"
+    monkeypatch.setattr(multipart_upload, "UPLOAD_CHECKPOINT_DIR", path)
+    return path
+
+
+@pytest.fixture
+def s3():
+    return FakeS3()
+
+
+@pytest.fixture
+def image(tmp_path):
+    """A 12.5 MiB file: two full parts and a shorter final part."""
+    path = tmp_path / "disk.raw"
+    path.write_bytes(bytes(range(256)) * (PART_SIZE * 5 // 2 // 256))
+    return path
+
+
+def uploader(s3: FakeS3, concurrency: int = 1) -> MultipartUploader:
+    return MultipartUploader(s3, UploadSettings(part_size_mb=PART_SIZE // MIB, concurrency=concurrency))
+
+
+def test_interrupted_upload_resumes_missing_parts(s3, image):
+    s3.fail_part = 2
+    with pytest.raises(ClientError):
+        uploader(s3).upload_file(image, "bucket", "disk.raw")
+    assert s3.uploaded_parts == [1]
+
+    s3.fail_part = None
+    s3.uploaded_parts = []
+    stats = uploader(s3, concurrency=2).upload_file(image, "bucket", "disk.raw")
+
+    data = image.read_bytes()
+    assert s3.created == ["upload-1"]
+    assert sorted(s3.uploaded_parts) == [2, 3]
+    assert s3.objects["bucket/disk.raw"] == data
+    assert (stats["bytes_resumed"], stats["bytes_uploaded"]) == (PART_SIZE, len(data) - PART_SIZE)
+    # Resumed parts are read back so the digest still covers the whole file
+    assert stats["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_part_uploaded_after_last_checkpoint_is_trusted_only_with_expected_size(s3, image):
+    s3.fail_part = 3
+    with pytest.raises(ClientError):
+        uploader(s3).upload_file(image, "bucket", "disk.raw")
+    # Part 2 landed but the checkpoint write was lost; a short part 3 from elsewhere must not be reused
+    checkpoint_path = next(multipart_upload.UPLOAD_CHECKPOINT_DIR.glob("*.json"))
+    checkpoint_path.write_text(checkpoint_path.read_text().replace(', "2": ', ', "x": '))
+    s3.uploads["upload-1"][3] = {"ETag": '"short"', "Body": b"short", "ChecksumSHA256": None}
+
+    s3.fail_part = None
+    s3.uploaded_parts = []
+    uploader(s3).upload_file(image, "bucket", "disk.raw")
+
+    assert s3.uploaded_parts == [3]
+    assert s3.objects["bucket/disk.raw"] == image.read_bytes()
+
+
+def test_upload_that_no_longer_exists_restarts(s3, image):
+    s3.fail_part = 2
+    with pytest.raises(ClientError):
+        uploader(s3).upload_file(image, "bucket", "disk.raw")
+    # Aborted by a lifecycle rule, for instance
+    del s3.uploads["upload-1"]
+
+    s3.fail_part = None
+    s3.uploaded_parts = []
+    stats = uploader(s3).upload_file(image, "bucket", "disk.raw")
+
+    assert s3.created == ["upload-1", "upload-2"]
+    assert s3.uploaded_parts == [1, 2, 3]
+    assert stats["bytes_resumed"] == 0
+    assert s3.objects["bucket/disk.raw"] == image.read_bytes()
+
+
+def test_changed_source_does_not_reuse_checkpoint(s3, image, checkpoint_dir):
+    s3.fail_part = 2
+    with pytest.raises(ClientError):
+        uploader(s3).upload_file(image, "bucket", "disk.raw")
+    image.write_bytes(b"\x01" * (PART_SIZE + 100))
+
+    s3.fail_part = None
+    s3.uploaded_parts = []
+    uploader(s3).upload_file(image, "bucket", "disk.raw")
+
+    assert s3.created == ["upload-1", "upload-2"]
+    assert s3.uploaded_parts == [1, 2]
+    assert s3.objects["bucket/disk.raw"] == image.read_bytes()
+    # The finished upload drops its checkpoint; the stale one stays until its upload is resumed or expires
+    assert len(list(checkpoint_dir.glob("*.json"))) == 1
+
+
+def test_resume_disabled_starts_a_new_upload(s3, image):
+    s3.fail_part = 2
+    with pytest.raises(ClientError):
+        uploader(s3).upload_file(image, "bucket", "disk.raw")
+
+    s3.fail_part = None
+    settings = UploadSettings(part_size_mb=PART_SIZE // MIB, resume=False)
+    MultipartUploader(s3, settings).upload_file(image, "bucket", "disk.raw")
+
+    assert s3.created == ["upload-1", "upload-2"]
+
+
+def test_final_part_is_shorter_and_completed_in_order(s3, image):
+    stats = uploader(s3, concurrency=3).upload_file(image, "bucket", "disk.raw")
+
+    size = image.stat().st_size
+    assert [part["PartNumber"] for part in s3.completed_parts] == [1, 2, 3]
+    assert s3.objects["bucket/disk.raw"] == image.read_bytes() and len(s3.completed_parts) == -(-size // PART_SIZE)
+    assert stats["parts"] == 3 and stats["etag"] == '"final"'
+    assert not list(multipart_upload.UPLOAD_CHECKPOINT_DIR.glob("*.json"))
+
+
+def test_stream_parts_carry_checksums_and_final_part_is_short(s3):
+    data = bytes(range(256)) * ((2 * PART_SIZE + 12345) // 256) + b"tail"
+    chunks = [data[i : i + 1000003] for i in range(0, len(data), 1000003)]
+
+    stats = uploader(s3, concurrency=2).upload_stream(chunks, "disk.vmdk", "bucket", "disk.vmdk", len(data))
+
+    assert s3.objects["bucket/disk.vmdk"] == data
+    assert [part["PartNumber"] for part in s3.completed_parts] == [1, 2, 3]
+    final_part = data[2 * PART_SIZE :]
+    assert s3.completed_parts[-1]["ChecksumSHA256"] == base64.b64encode(hashlib.sha256(final_part).digest()).decode()
+    assert stats["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_stream_shorter_than_expected_is_aborted(s3):
+    with pytest.raises(IOError, match="Stream ended"):
+        uploader(s3).upload_stream([b"x" * 100], "disk.vmdk", "bucket", "disk.vmdk", total_size=200)
+
+    assert s3.aborted == ["upload-1"]
+    assert "bucket/disk.vmdk" not in s3.objects
@@ -0,0 +1,214 @@
+"""Tests for segmented HTTP downloads against a local HTTP server."""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+import requests  # type: ignore
+
+from vmie.common import DOWNLOAD_RETRIES
+from vmie.core import ranged_download
+from vmie.core.ranged_download import RangedDownloader
+
+DATA = bytes(range(256)) * 14 + b"tail"  # 3588 bytes
+SEGMENT_SIZE = 1000  # four segments, the last one short
+
+
+class FakeSource:
+    """State of the file served by the test server, and the requests it received."""
+
+    def __init__(self):
+        self.data = DATA
+        self.etag: Optional[str] = '"v1"'
+        self.ranges = True
+        self.requests: List[Dict[str, str]] = []
+        # {range start: [behaviour per request]}, consumed in order: "short", "cut" or an HTTP status
+        self.faults: Dict[int, List] = {}
+        self.lock = threading.Lock()
+
+    def ranges_requested(self) -> List[Tuple[int, int]]:
+        ranges = []
+        for headers in self.requests:
+            start, end = headers["Range"][len("bytes=") :].split("-")
+            ranges.append((int(start), int(end)))
+        return ranges
+
+
+@pytest.fixture
+def source():
+    return FakeSource()
+
+
+@pytest.fixture
+def url(source):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with source.lock:
+                source.requests.append(dict(self.headers))
+            data = source.data
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if not (source.ranges and range_header) or (if_range and if_range != source.etag):
+                return self._send(200, data, {})
+
+            start, end = (int(value) for value in range_header[len("bytes=") :].split("-"))
+            end = min(end, len(data) - 1)
+            with source.lock:
+                faults = source.faults.get(start) or []
+                fault = faults.pop(0) if faults else None
+            if isinstance(fault, int):
+                return self._send(fault, b"", {})
+            body = data[start : end + 1]
+            headers = {"Content-Range": f"bytes {start}-{end}/{len(data)}"}
+            if fault == "short":
+                # A well-formed response that holds less than the requested range
+                return self._send(206, body[: len(body) // 2], headers)
+            if fault == "cut":
+                # The connection drops partway through the body
+                return self._send(206, body[: len(body) // 2], headers, length=len(body))
+            return self._send(206, body, headers)
+
+        def _send(self, status, body, headers, length=None):
+            self.send_response(status)
+            if source.etag:
+                self.send_header("ETag", source.etag)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body) if length is None else length))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/images/disk.raw"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ranged_download, "time", SimpleNamespace(sleep=lambda seconds: None, monotonic=time.monotonic))
+
+
+def segment_ranges(indexes) -> List[Tuple[int, int]]:
+    return [(index * SEGMENT_SIZE, min((index + 1) * SEGMENT_SIZE, len(DATA)) - 1) for index in indexes]
+
+
+def test_probe_reports_size_validator_and_range_support(source, url):
+    assert RangedDownloader().probe(url) == (url, len(DATA), '"v1"', True)
+    source.ranges = False
+    assert RangedDownloader().probe(url) == (url, len(DATA), '"v1"', False)
+
+
+def test_segments_cover_the_file(source, url, tmp_path):
+    output = tmp_path / "disk.raw"
+
+    stats = RangedDownloader(connections=3, segment_size=SEGMENT_SIZE).download(url, output)
+
+    assert output.read_bytes() == DATA
+    assert sorted(source.ranges_requested()[1:]) == segment_ranges(range(4))
+    assert all(headers["If-Range"] == '"v1"' for headers in source.requests[1:])
+    assert (stats["bytes"], stats["bytes_downloaded"], stats["connections"]) == (len(DATA), len(DATA), 3)
+    assert not (tmp_path / "disk.raw.part").exists()
+
+
+@pytest.mark.parametrize(
+    "fault, retry_start",
+    [
+        # The retry asks only for the half of segment 1 that did not arrive
+        ("short", SEGMENT_SIZE + SEGMENT_SIZE // 2),
+        # A dropped connection loses the chunk being read, so nothing of the segment was written
+        ("cut", SEGMENT_SIZE),
+    ],
+)
+def test_incomplete_segment_is_retried_from_the_last_byte_written(source, url, tmp_path, fault, retry_start):
+    source.faults[SEGMENT_SIZE] = [fault]
+    output = tmp_path / "disk.raw"
+
+    RangedDownloader(connections=1, segment_size=SEGMENT_SIZE).download(url, output)
+
+    assert output.read_bytes() == DATA
+    segment_requests = [request for request in source.ranges_requested()[1:] if request[1] == 2 * SEGMENT_SIZE - 1]
+    assert segment_requests == [(SEGMENT_SIZE, 2 * SEGMENT_SIZE - 1), (retry_start, 2 * SEGMENT_SIZE - 1)]
+
+
+def test_segment_failing_every_attempt_fails_the_download(source, url, tmp_path):
+    source.faults[SEGMENT_SIZE] = [503] * DOWNLOAD_RETRIES
+
+    with pytest.raises(requests.HTTPError):
+        RangedDownloader(connections=1, segment_size=SEGMENT_SIZE).download(url, tmp_path / "disk.raw")
+
+    assert [start for start, _ in source.ranges_requested()].count(SEGMENT_SIZE) == DOWNLOAD_RETRIES
+
+
+def test_source_changed_after_probe_aborts(source, url, tmp_path, monkeypatch):
+    downloader = RangedDownloader(connections=2, segment_size=SEGMENT_SIZE)
+    probe = downloader.probe
+
+    def probe_then_change(probe_url):
+        result = probe(probe_url)
+        source.etag, source.data = '"v2"', DATA[::-1]
+        return result
+
+    monkeypatch.setattr(downloader, "probe", probe_then_change)
+    output = tmp_path / "disk.raw"
+
+    # If-Range no longer matches, so the server answers with the whole new file
+    with pytest.raises(RuntimeError, match="Source changed"):
+        downloader.download(url, output)
+    assert not output.exists()
+
+
+def test_resumed_download_fetches_only_missing_segments(source, url, tmp_path):
+    output = tmp_path / "disk.raw"
+    # The last segment fails, so no other segment can still be in flight when the download stops
+    source.faults[3 * SEGMENT_SIZE] = [500] * DOWNLOAD_RETRIES
+    with pytest.raises(requests.HTTPError):
+        RangedDownloader(connections=1, segment_size=SEGMENT_SIZE).download(url, output)
+    assert not output.exists()
+
+    source.requests = []
+    stats = RangedDownloader(connections=2, segment_size=SEGMENT_SIZE).download(url, output)
+
+    assert output.read_bytes() == DATA
+    assert source.ranges_requested()[1:] == segment_ranges([3])
+    assert stats["bytes_resumed"] == 3 * SEGMENT_SIZE
+    assert stats["bytes_downloaded"] == len(DATA) - 3 * SEGMENT_SIZE
+
+    # A complete download is reused without fetching anything but the probe
+    source.requests = []
+    stats = RangedDownloader(segment_size=SEGMENT_SIZE).download(url, output)
+    assert len(source.requests) == 1 and stats["bytes_resumed"] == len(DATA)
+
+
+def test_changed_source_discards_the_resume_map(source, url, tmp_path):
+    output = tmp_path / "disk.raw"
+    source.faults[2 * SEGMENT_SIZE] = [500] * DOWNLOAD_RETRIES
+    with pytest.raises(requests.HTTPError):
+        RangedDownloader(connections=1, segment_size=SEGMENT_SIZE).download(url, output)
+
+    source.etag, source.data = '"v2"', DATA[::-1]
+    source.requests = []
+    RangedDownloader(connections=1, segment_size=SEGMENT_SIZE).download(url, output)
+
+    assert output.read_bytes() == DATA[::-1]
+    assert source.ranges_requested()[1:] == segment_ranges(range(4))
+
+
+def test_server_without_range_support_downloads_over_one_connection(source, url, tmp_path):
+    source.ranges = False
+    output = tmp_path / "disk.raw"
+
+    stats = RangedDownloader(connections=4, segment_size=SEGMENT_SIZE).download(url, output)
+
+    assert output.read_bytes() == DATA
+    assert stats["connections"] == 1
+    assert len(source.requests) == 2 and "Range" not in source.requests[1]
+    assert (tmp_path / "disk.raw.download.json").exists()
@@ -0,0 +1,162 @@
+"""Tests for adaptive task polling intervals and batched task status checks."""
+
+import time
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from vmie.aws import task_monitor
+from vmie.aws.task_monitor import TaskMonitor, TaskState
+from vmie.common import TASK_POLL_FINAL_STAGE_SECONDS, TASK_POLL_MAX_SECONDS, TASK_POLL_MIN_SECONDS
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        task_monitor,
+        "time",
+        SimpleNamespace(monotonic=lambda: clock.now, time=time.time, strftime=time.strftime, localtime=time.localtime),
+    )
+    return clock
+
+
+def report(state: TaskState, progress=None, status="active", message="converting", **fields):
+    task = {"Status": status, "StatusMessage": message, **fields}
+    if progress is not None:
+        task["Progress"] = str(progress)
+    state.update(task, "import")
+
+
+def test_backs_off_until_progress_is_reported(clock):
+    state = TaskState("import-1")
+    report(state, message="pending")
+
+    intervals = [state.next_interval() for _ in range(6)]
+
+    assert intervals == [TASK_POLL_MIN_SECONDS, 10, 20, 40, TASK_POLL_MAX_SECONDS, TASK_POLL_MAX_SECONDS]
+    assert state.eta_seconds is None
+
+
+def test_checks_about_four_times_over_the_remaining_time(clock):
+    state = TaskState("import-1")
+    report(state, progress=10)
+    # The first report is only the baseline for the rate
+    assert state.eta_seconds is None
+
+    clock.now += 100
+    report(state, progress=60)
+    # 50% in 100s leaves 80s for the remaining 40%
+    assert state.eta_seconds == pytest.approx(80)
+    assert state.next_interval() == pytest.approx(20)
+
+    clock.now += 40
+    report(state, progress=80)
+    assert state.eta_seconds == pytest.approx(40)
+    assert state.next_interval() == pytest.approx(10)
+
+
+def test_interval_is_clamped_to_the_polling_bounds(clock):
+    state = TaskState("import-1")
+    report(state, progress=1)
+    clock.now += 1000
+    report(state, progress=2)
+    assert state.next_interval() == TASK_POLL_MAX_SECONDS
+
+    fast = TaskState("import-2")
+    report(fast, progress=10)
+    clock.now += 1
+    report(fast, progress=80)
+    assert fast.eta_seconds < TASK_POLL_MIN_SECONDS
+    assert fast.next_interval() == TASK_POLL_MIN_SECONDS
+
+
+@pytest.mark.parametrize(
+    "progress, message",
+    [
+        (None, "booting"),
+        (40, "Preparing AMI"),
+        (90, "converting"),
+    ],
+)
+def test_final_stage_is_checked_often(clock, progress, message):
+    state = TaskState("import-1")
+    # Back off first, so the clamp is what brings the interval down
+    for _ in range(5):
+        state.next_interval()
+
+    report(state, progress=progress, message=message)
+
+    assert state.next_interval() == TASK_POLL_FINAL_STAGE_SECONDS
+
+
+def test_completed_and_failed_tasks(clock):
+    imported = TaskState("import-1")
+    report(imported, status="completed", message="", ImageId="ami-1")
+    assert imported.completed and imported.progress == 100 and imported.result == "ami-1"
+
+    exported = TaskState("export-1")
+    location = {"S3Bucket": "bucket", "S3Prefix": "exports/"}
+    exported.update({"Status": "completed", "S3ExportLocation": location}, "export")
+    assert exported.result == "s3://bucket/exports/export-1.raw"
+
+    deleted = TaskState("import-2")
+    report(deleted, status="deleted", message="ClientError: disk is not valid")
+    assert deleted.failed and not deleted.completed
+    assert deleted.describe() == "deleted, ClientError: disk is not valid"
+
+
+class FakeEC2:
+    def __init__(self, tasks: List[dict]):
+        self.tasks = tasks
+        self.calls: List[List[str]] = []
+
+    def describe_import_image_tasks(self, ImportTaskIds):
+        self.calls.append(ImportTaskIds)
+        return {"ImportImageTasks": [task for task in self.tasks if task["ImportTaskId"] in ImportTaskIds]}
+
+
+def test_one_describe_call_for_all_tracked_tasks(clock):
+    ec2 = FakeEC2(
+        [
+            {"ImportTaskId": "import-1", "Status": "active", "StatusMessage": "converting", "Progress": "30"},
+            {"ImportTaskId": "import-2", "Status": "completed", "ImageId": "ami-2"},
+            {"ImportTaskId": "import-9", "Status": "active", "StatusMessage": "converting", "Progress": "70"},
+        ]
+    )
+    monitor = TaskMonitor(ec2, "import")
+    for task_id in ["import-1", "import-2", "import-3"]:
+        monitor.track(task_id)
+
+    tasks = monitor.poll()
+
+    assert ec2.calls == [["import-1", "import-2", "import-3"]]
+    assert (tasks["import-1"].status, tasks["import-1"].progress) == ("active", 30)
+    assert tasks["import-2"].result == "ami-2"
+    # A task missing from the response, e.g. not yet visible, stays pending
+    assert (tasks["import-3"].status, tasks["import-3"].progress) == ("pending", 0)
+    # Untracked tasks in the response are ignored
+    assert "import-9" not in tasks
+
+    monitor.untrack("import-2")
+    monitor.poll()
+    assert ec2.calls[-1] == ["import-1", "import-3"]
+
+
+def test_monitor_follows_the_task_that_needs_checking_soonest(clock):
+    ec2 = FakeEC2([])
+    monitor = TaskMonitor(ec2, "import")
+    assert monitor.next_interval() == TASK_POLL_MAX_SECONDS
+
+    slow, booting = monitor.track("import-1"), monitor.track("import-2")
+    for _ in range(5):
+        slow.next_interval()
+        booting.next_interval()
+    report(booting, message="booting")
+
+    assert monitor.next_interval() == TASK_POLL_FINAL_STAGE_SECONDS
+    # Nothing is described while no task is tracked
+    monitor.untrack("import-1")
+    monitor.untrack("import-2")
+    assert monitor.poll() == {} and not ec2.calls
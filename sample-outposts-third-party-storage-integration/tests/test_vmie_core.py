@@ -0,0 +1,46 @@
+"""Tests for staging image sources in VMIECore."""
+
+from pathlib import Path
+
+import pytest
+
+from vmie.common import ImageFormat
+from vmie.core import VMIECore
+from vmie.utils import cleanup_temp_directory
+
+
+@pytest.fixture
+def core(monkeypatch):
+    vmie = VMIECore("us-east-1", "bucket")
+    monkeypatch.setattr(vmie.source_processor, "get_url_source_id", lambda url: "etag")
+    monkeypatch.setattr(vmie, "_find_uploaded_copy", lambda source_id, filename: None)
+    yield vmie
+    cleanup_temp_directory(vmie.temp_dir)
+
+
+def test_url_source_to_convert_is_staged_under_converted_name(core, monkeypatch):
+    downloaded = core.temp_dir / "disk.qcow2"
+    downloaded.write_bytes(b"QFI\xfb")
+    uploads = []
+    monkeypatch.setattr(core, "_download_from_url", lambda url: downloaded)
+    monkeypatch.setattr(
+        core, "_upload_converted_image", lambda path, source_id: uploads.append(path) or "s3://bucket/disk.vmdk"
+    )
+
+    import_source, filename = core.stage_image("https://example.com/images/disk.qcow2")
+
+    assert uploads == [downloaded]
+    assert (import_source, filename) == ("s3://bucket/disk.vmdk", "disk.vmdk")
+    containers, description = core.get_import_request(import_source, filename)
+    assert containers[0]["Format"] == ImageFormat.VMDK.value.upper()
+    assert description == "disk imported via vmie script"
+
+
+def test_url_source_without_conversion_keeps_downloaded_name(core, monkeypatch):
+    core.stage_to_disk = True
+    downloaded = core.temp_dir / "disk.raw"
+    downloaded.write_bytes(b"\0" * 512)
+    monkeypatch.setattr(core, "_download_from_url", lambda url: downloaded)
+    monkeypatch.setattr(core, "_upload_to_s3", lambda path, source_id: f"s3://bucket/{Path(path).name}")
+
+    assert core.stage_image("https://example.com/images/disk.raw") == ("s3://bucket/disk.raw", "disk.raw")
@@ -2,5 +2,17 @@
 
 from .aws_client import AWSClient
 from .aws_waiter import AWSWaiter
+from .digest_index import DigestIndex
+from .multipart_upload import BandwidthLimiter, MultipartUploader, UploadSettings
+from .task_monitor import TaskMonitor, TaskState
 
-__all__ = ["AWSClient", "AWSWaiter"]
+__all__ = [
+    "AWSClient",
+    "AWSWaiter",
+    "MultipartUploader",
+    "UploadSettings",
+    "BandwidthLimiter",
+    "DigestIndex",
+    "TaskMonitor",
+    "TaskState",
+]
@@ -3,15 +3,20 @@
 import json
 import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
 from rich.rule import Rule
 
 from vmie.aws.aws_waiter import AWSWaiter
+from vmie.aws.digest_index import DigestIndex
+from vmie.aws.multipart_upload import MultipartUploader, UploadSettings
 from vmie.common import (
     DEFAULT_INSTANCE_PROFILE,
+    DIGEST_TAG_KEY,
     EC2_TRUST_POLICY,
     ERR_AWS_AMI_CREATE_FAILED,
     ERR_AWS_AMI_FETCH_FAILED,
@@ -52,9 +57,16 @@ class AWSClient:
         try:
             self.session = boto3.Session()
             self.ec2 = self.session.client("ec2", region_name=region)
-            self.s3 = self.session.client("s3", region_name=region)
+            # Enough pooled connections for parallel part uploads, with retries that back off on throttling
+            self.s3 = self.session.client(
+                "s3",
+                region_name=region,
+                config=Config(max_pool_connections=64, retries={"mode": "adaptive", "max_attempts": 10}),
+            )
             self.iam = self.session.client("iam")
             self.ssm = self.session.client("ssm", region_name=region)
+            self._s3_clients = {region: self.s3}
+            self.digest_index = DigestIndex()
 
             # Initialize waiter with clients
             self.waiter = AWSWaiter(self.ec2, self.ssm, self.iam)
@@ -155,21 +167,30 @@ class AWSClient:
                 code=ERR_AWS_S3_BUCKET_CREATE_FAILED,
             )
 
-    def upload_to_s3(self, local_file: str, bucket: str, key: str) -> str:
-        """Upload file to S3 and return S3 URL."""
+    def upload_to_s3(
+        self,
+        local_file: str,
+        bucket: str,
+        key: str,
+        upload_settings: Optional[UploadSettings] = None,
+        source_id: Optional[str] = None,
+    ) -> str:
+        """
+        Upload file to S3 as a parallel multipart upload and return S3 URL.
+
+        An interrupted upload of the same file to the same key resumes from its last checkpoint on the next run.
+
+        :param local_file: Path of the file to upload
+        :param bucket: Destination bucket
+        :param key: Destination key
+        :param upload_settings: Part size, concurrency, bandwidth cap and resume settings
+        :param source_id: Digest index id of the image source, to skip the upload next time (see find_uploaded_copy)
+        :return: S3 URL of the uploaded object
+        """
         try:
-            self.s3.upload_file(
-                local_file,
-                bucket,
-                key,
-                ExtraArgs={
-                    "StorageClass": "STANDARD_IA",
-                    "Metadata": {
-                        "uploaded-by": "vmie-script",
-                        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                    },
-                },
-            )
+            uploader = MultipartUploader(self.s3, upload_settings)
+            stats = uploader.upload_file(Path(local_file), bucket, key, extra_args=self._get_upload_extra_args())
+            self._record_upload(source_id, stats["sha256"], bucket, key, stats["etag"], stats["bytes"])
 
             s3_url = f"s3://{bucket}/{key}"
             log_message(LogLevel.SUCCESS, f"File uploaded to S3: {s3_url}")
@@ -177,11 +198,175 @@ class AWSClient:
         except Exception as e:
             error_and_exit(
                 f"Failed to upload file to S3: {bucket}/{key}",
+                "Uploaded parts were checkpointed; run the same command again to resume the upload",
                 Rule(),
                 str(e),
                 code=ERR_AWS_S3_UPLOAD_FAILED,
             )
 
+    def upload_stream_to_s3(
+        self,
+        chunks: Iterable[bytes],
+        name: str,
+        bucket: str,
+        key: str,
+        total_size: Optional[int] = None,
+        upload_settings: Optional[UploadSettings] = None,
+        source_id: Optional[str] = None,
+    ) -> str:
+        """
+        Upload a stream of byte chunks to S3 as a parallel multipart upload and return S3 URL.
+
+        :param chunks: Iterable of byte chunks, e.g. an HTTP response body
+        :param name: Name shown in the progress bar
+        :param bucket: Destination bucket
+        :param key: Destination key
+        :param total_size: Expected size in bytes, if known
+        :param upload_settings: Part size, concurrency and bandwidth cap settings
+        :param source_id: Digest index id of the image source, to skip the upload next time (see find_uploaded_copy)
+        :return: S3 URL of the uploaded object
+        """
+        try:
+            uploader = MultipartUploader(self.s3, upload_settings)
+            stats = uploader.upload_stream(
+                chunks, name, bucket, key, total_size, extra_args=self._get_upload_extra_args()
+            )
+            self._record_upload(source_id, stats["sha256"], bucket, key, stats["etag"], stats["bytes"])
+
+            s3_url = f"s3://{bucket}/{key}"
+            log_message(LogLevel.SUCCESS, f"Stream uploaded to S3: {s3_url}")
+            return s3_url
+        except Exception as e:
+            error_and_exit(
+                f"Failed to stream upload to S3: {bucket}/{key}",
+                "Retry the command, or use --stage-to-disk to download the image before uploading it",
+                Rule(),
+                str(e),
+                code=ERR_AWS_S3_UPLOAD_FAILED,
+            )
+
+    def find_uploaded_copy(
+        self, source_id: Optional[str], bucket: str, key: str, upload_settings: Optional[UploadSettings] = None
+    ) -> Optional[str]:
+        """
+        Reuse a previous upload of identical content instead of uploading an image again.
+
+        Looks up the SHA-256 recorded for the source in the local digest index. If the destination object
+        already holds that content, nothing is transferred; if another bucket or region does, the object
+        is copied server-side without reading the image again. Recorded objects are confirmed with
+        head_object first, and ones that were deleted or overwritten since are dropped from the index.
+
+        :param source_id: Digest index id of the image source (see DigestIndex), or None
+        :param bucket: Destination bucket
+        :param key: Destination key
+        :param upload_settings: Part size and concurrency used for a server-side copy
+        :return: S3 URL of the destination object, or None if the image has to be uploaded
+        """
+        digest = self.digest_index.get_digest(source_id)
+        if not digest:
+            return None
+
+        destination = (self.region, bucket, key)
+        # Check the destination itself first: a re-run of a failed import finds its image already there
+        locations = sorted(
+            self.digest_index.get_objects(digest),
+            key=lambda location: (location["region"], location["bucket"], location["key"]) != destination,
+        )
+        for location in locations:
+            source_url = f"s3://{location['bucket']}/{location['key']}"
+            try:
+                head = self._get_s3_client(location["region"]).head_object(
+                    Bucket=location["bucket"], Key=location["key"]
+                )
+            except (BotoCoreError, ClientError) as e:
+                log_message(LogLevel.DEBUG, f"Previous upload {source_url} is not available: {e}")
+                self.digest_index.forget(digest, location)
+                continue
+            if (head["ETag"], head["ContentLength"]) != (location["etag"], location["size"]):
+                log_message(LogLevel.DEBUG, f"Previous upload {source_url} was overwritten since")
+                self.digest_index.forget(digest, location)
+                continue
+
+            s3_url = f"s3://{bucket}/{key}"
+            if (location["region"], location["bucket"], location["key"]) == destination:
+                log_message(LogLevel.SUCCESS, f"Identical image already uploaded, skipping upload: {s3_url}")
+                return s3_url
+
+            try:
+                self._copy_object(location, digest, bucket, key, upload_settings or UploadSettings())
+            except Exception as e:
+                log_message(LogLevel.WARN, f"Server-side copy from {source_url} failed, uploading instead: {e}")
+                return None
+            log_message(LogLevel.SUCCESS, f"Identical image copied server-side from {source_url} to {s3_url}")
+            return s3_url
+        return None
+
+    def _copy_object(
+        self, location: Dict[str, Any], digest: str, bucket: str, key: str, upload_settings: UploadSettings
+    ) -> None:
+        """Copy a recorded object server-side to bucket/key and record the copy in the digest index."""
+        log_message(
+            LogLevel.INFO,
+            f"Copying identical image server-side from s3://{location['bucket']}/{location['key']} "
+            f"({location['region']})",
+        )
+        extra_args = {
+            **self._get_upload_extra_args(),
+            "MetadataDirective": "REPLACE",
+            "Tagging": f"{DIGEST_TAG_KEY}={digest}",
+            "TaggingDirective": "REPLACE",
+            # Fails the copy if the source changed after it was checked
+            "CopySourceIfMatch": location["etag"],
+        }
+        self.s3.copy(
+            {"Bucket": location["bucket"], "Key": location["key"]},
+            bucket,
+            key,
+            ExtraArgs=extra_args,
+            SourceClient=self._get_s3_client(location["region"]),
+            Config=TransferConfig(
+                multipart_chunksize=upload_settings.part_size, max_concurrency=upload_settings.concurrency
+            ),
+        )
+        head = self.s3.head_object(Bucket=bucket, Key=key)
+        self.digest_index.record(
+            None, digest, self._get_object_location(bucket, key, head["ETag"], head["ContentLength"])
+        )
+
+    def _record_upload(
+        self, source_id: Optional[str], digest: str, bucket: str, key: str, etag: str, size: int
+    ) -> None:
+        """Tag an uploaded object with its SHA-256 and record it in the digest index."""
+        try:
+            self.s3.put_object_tagging(
+                Bucket=bucket, Key=key, Tagging={"TagSet": [{"Key": DIGEST_TAG_KEY, "Value": digest}]}
+            )
+        except ClientError as e:
+            # The tag only documents the content; the local index is what later runs rely on
+            log_message(LogLevel.WARN, f"Failed to tag s3://{bucket}/{key} with its SHA-256: {e}")
+        self.digest_index.record(source_id, digest, self._get_object_location(bucket, key, etag, size))
+        log_message(LogLevel.DEBUG, f"SHA-256 of s3://{bucket}/{key}: {digest}")
+
+    def _get_object_location(self, bucket: str, key: str, etag: str, size: int) -> Dict[str, Any]:
+        return {"region": self.region, "bucket": bucket, "key": key, "etag": etag, "size": size}
+
+    def _get_s3_client(self, region: str) -> Any:
+        """Return an S3 client for a region, reusing this client's own for its region."""
+        if region not in self._s3_clients:
+            self._s3_clients[region] = self.session.client("s3", region_name=region)
+        return self._s3_clients[region]
+
+    @staticmethod
+    def _get_upload_extra_args() -> Dict[str, Any]:
+        """Return the storage class and metadata applied to uploaded images."""
+        return {
+            "StorageClass": "STANDARD_IA",
+            "Metadata": {
+                "uploaded-by": "vmie-script",
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+        }
+
     def setup_vmimport_role(self, bucket_name: str) -> None:
         """Set up vmimport IAM role for VM import operations."""
         try:
@@ -220,6 +405,39 @@ class AWSClient:
                 code=ERR_AWS_VMIMPORT_ROLE_SETUP_FAILED,
             )
 
+    def start_import_task(
+        self,
+        disk_containers: List[Dict],
+        description: str,
+        license_type: Optional[str] = None,
+        usage_operation: Optional[str] = None,
+    ) -> str:
+        """
+        Start an image import task and return its task ID without waiting for it to finish.
+
+        Errors are raised rather than exiting, so callers running several imports can handle them per image.
+
+        :param disk_containers: List of disk container configurations
+        :param description: Description of the import task
+        :param license_type: License type to be used for the AMI (AWS or BYOL)
+        :param usage_operation: Usage operation value for the AMI
+        :return: Import task ID
+        """
+        # Build the import parameters
+        import_params = {"Description": description, "DiskContainers": disk_containers}
+
+        # Add optional parameters if provided
+        if license_type:
+            import_params["LicenseType"] = license_type
+
+        if usage_operation:
+            import_params["UsageOperation"] = usage_operation
+
+        response = self.ec2.import_image(**import_params)
+        task_id = response["ImportTaskId"]
+        log_message(LogLevel.SUCCESS, f"Import task started: {task_id}")
+        return task_id
+
     def _execute_import_task(
         self,
         disk_containers: List[Dict],
@@ -237,19 +455,7 @@ class AWSClient:
         :return: AMI ID
         """
         try:
-            # Build the import parameters
-            import_params = {"Description": description, "DiskContainers": disk_containers}
-
-            # Add optional parameters if provided
-            if license_type:
-                import_params["LicenseType"] = license_type
-
-            if usage_operation:
-                import_params["UsageOperation"] = usage_operation
-
-            response = self.ec2.import_image(**import_params)
-            task_id = response["ImportTaskId"]
-            log_message(LogLevel.SUCCESS, f"Import task started: {task_id}")
+            task_id = self.start_import_task(disk_containers, description, license_type, usage_operation)
             ami_id = self.waiter.wait_for_import(task_id, IMPORT_TIMEOUT_MINUTES)
             return ami_id
         except Exception as e:
@@ -278,15 +484,20 @@ class AWSClient:
         :param usage_operation: Usage operation value for the AMI
         :return: AMI ID
         """
+        disk_containers = self.get_s3_disk_containers(s3_url, description, format_type)
+        return self._execute_import_task(disk_containers, description, license_type, usage_operation)
+
+    @staticmethod
+    def get_s3_disk_containers(s3_url: str, description: str, format_type: str) -> List[Dict]:
+        """Return the import disk containers for a single image in S3."""
         bucket, key = s3_url.replace("s3://", "").split("/", 1)
-        disk_containers = [
+        return [
             {
                 "Description": description,
                 "Format": format_type.upper(),
                 "UserBucket": {"S3Bucket": bucket, "S3Key": key},
             }
         ]
-        return self._execute_import_task(disk_containers, description, license_type, usage_operation)
 
     def import_image_from_disk_containers(
         self,
@@ -5,6 +5,7 @@ from typing import Dict
 
 from rich.rule import Rule
 
+from vmie.aws.task_monitor import TaskMonitor
 from vmie.common import (
     ERR_AWS_AMI_NOT_FOUND,
     ERR_AWS_AMI_STATUS_CHECK_FAILED,
@@ -39,6 +40,9 @@ class AWSWaiter:
         """
         Generic wait function for both import and export tasks.
 
+        The task is checked through a TaskMonitor, so the interval between checks adapts to the
+        reported progress and the progress display includes an estimated completion time.
+
         Args:
             task_id: The ID of the task to wait for
             operation_type: Either 'import' or 'export'
@@ -47,65 +51,22 @@ class AWSWaiter:
         Returns:
             str: AMI ID for imports, S3 URL for exports
         """
-        # Define operation-specific parameters
-        if operation_type == "import":
-            describe_method = self.ec2.describe_import_image_tasks
-            task_id_param = {"ImportTaskIds": [task_id]}
-            tasks_key = "ImportImageTasks"
-            result_key = "ImageId"
-        elif operation_type == "export":
-            describe_method = self.ec2.describe_export_image_tasks
-            task_id_param = {"ExportImageTaskIds": [task_id]}
-            tasks_key = "ExportImageTasks"
-            result_key = "S3ExportLocation"
-        else:
+        if operation_type not in ["import", "export"]:
             error_and_exit(
                 f"Invalid operation type: {operation_type}",
                 "Supported types: import, export",
                 code=ERR_GENERAL_OPERATION_FAILED,
             )
 
+        monitor = TaskMonitor(self.ec2, operation_type)
+        monitor.track(task_id)
         description = f"Waiting for {operation_type} task {task_id}"
         result = None
 
         def check_task_status() -> Dict:
             nonlocal result
             try:
-                response = describe_method(**task_id_param)
-                task = response[tasks_key][0]
-                status = task["Status"]
-
-                if status == "completed":
-                    if operation_type == "import":
-                        result = task[result_key]
-                    else:  # export
-                        s3_location = task[result_key]
-                        bucket = s3_location["S3Bucket"]
-                        prefix = s3_location["S3Prefix"]
-                        result = f"s3://{bucket}/{prefix}{task_id}.raw"
-                    return {
-                        "completed": True,
-                        "progress": 100,
-                        "description": f"{operation_type.capitalize()} completed",
-                    }
-
-                elif status in ["cancelled", "deleted"]:
-                    error_and_exit(
-                        f"{operation_type.capitalize()} task {status}: {task_id}", code=ERR_AWS_TASK_STATUS_CHECK_FAILED
-                    )
-
-                progress_value = task.get("Progress", 0)
-                # Handle both string and numeric progress values
-                if isinstance(progress_value, str):
-                    try:
-                        progress_value = int(progress_value) if progress_value != "unknown" else 0
-                    except ValueError:
-                        progress_value = 0
-
-                progress_desc = f"Waiting for {operation_type} task {task_id} (Status: {status})"
-
-                return {"completed": False, "progress": progress_value, "description": progress_desc}
-
+                task = monitor.poll()[task_id]
             except Exception as e:
                 error_and_exit(
                     f"Failed to check {operation_type} status",
@@ -114,11 +75,32 @@ class AWSWaiter:
                     code=ERR_AWS_TASK_STATUS_CHECK_FAILED,
                 )
 
+            if task.completed:
+                result = task.result
+                return {
+                    "completed": True,
+                    "progress": 100,
+                    "description": f"{operation_type.capitalize()} completed",
+                }
+
+            if task.failed:
+                error_and_exit(
+                    f"{operation_type.capitalize()} task {task.status}: {task_id}",
+                    task.status_message,
+                    code=ERR_AWS_TASK_STATUS_CHECK_FAILED,
+                )
+
+            return {
+                "completed": False,
+                "progress": 0,
+                "description": f"Waiting for {operation_type} task {task_id} ({task.describe()})",
+                "interval": monitor.next_interval(),
+            }
+
         success = wait_with_progress(
             description=description,
             check_function=check_task_status,
             timeout_seconds=timeout_minutes * 60,
-            check_interval=30,
         )
 
         if not success:
@@ -0,0 +1,89 @@
+"""Local index of uploaded image digests, used to skip re-uploading identical content."""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from vmie.common import DIGEST_INDEX_PATH
+
+
+class DigestIndex:
+    """
+    Maps image sources to the SHA-256 of their (decompressed) content, and digests to the S3 objects holding it.
+
+    Sources are identified without reading them: local files by path, size and modification time, URLs by
+    their ETag or Last-Modified header. The index is a hint only; callers confirm an object still matches
+    with head_object before relying on it.
+    """
+
+    def __init__(self, path: Path = DIGEST_INDEX_PATH):
+        """Initialize the index stored at path; it is created on the first recorded upload."""
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_file_source_id(path: Path) -> str:
+        """Return the source id of a local file; it changes whenever the file is modified."""
+        stat = path.stat()
+        return f"file:{path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    @staticmethod
+    def get_url_source_id(url: str, validator: Optional[str]) -> Optional[str]:
+        """Return the source id of a URL, or None if the server gives no validator to detect changes with."""
+        return f"url:{url}|{validator}" if validator else None
+
+    def get_digest(self, source_id: Optional[str]) -> Optional[str]:
+        """Return the recorded SHA-256 of a source's content, or None if unknown."""
+        if not source_id:
+            return None
+        return self._load()["sources"].get(source_id)
+
+    def get_objects(self, digest: str) -> List[Dict[str, Any]]:
+        """Return the recorded S3 objects (region, bucket, key, etag, size) holding content with a digest."""
+        return list(self._load()["objects"].get(digest, []))
+
+    def record(self, source_id: Optional[str], digest: str, location: Dict[str, Any]) -> None:
+        """Record a source's digest and an S3 object holding its content, replacing any entry for that object."""
+        with self._lock:
+            index = self._load()
+            if source_id:
+                index["sources"][source_id] = digest
+            self._remove_location(index, location)
+            index["objects"].setdefault(digest, []).append(location)
+            self._save(index)
+
+    def forget(self, digest: str, location: Dict[str, Any]) -> None:
+        """Drop an S3 object that was deleted or overwritten since it was recorded."""
+        with self._lock:
+            index = self._load()
+            self._remove_location(index, location)
+            self._save(index)
+
+    @staticmethod
+    def _remove_location(index: Dict[str, Any], location: Dict[str, Any]) -> None:
+        # An object holds one content at a time, so an overwritten key is dropped from every digest
+        target = (location["region"], location["bucket"], location["key"])
+        for digest, locations in list(index["objects"].items()):
+            locations[:] = [entry for entry in locations if (entry["region"], entry["bucket"], entry["key"]) != target]
+            if not locations:
+                del index["objects"][digest]
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("sources", {})
+        index.setdefault("objects", {})
+        return index
+
+    def _save(self, index: Dict[str, Any]) -> None:
+        # Written to a temporary file first so an interrupted write never leaves a corrupt index
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        temp_path.replace(self.path)
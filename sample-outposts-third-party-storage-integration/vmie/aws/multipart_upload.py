@@ -0,0 +1,440 @@
+"""Parallel S3 multipart uploads of files and streams, with bandwidth limiting and resumable checkpoints."""
+
+import base64
+import hashlib
+import json
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from botocore.exceptions import ClientError
+from rich.progress import BarColumn, DownloadColumn, Progress, TextColumn, TimeRemainingColumn, TransferSpeedColumn
+
+from vmie.common import (
+    DEFAULT_UPLOAD_CONCURRENCY,
+    DEFAULT_UPLOAD_PART_SIZE_MB,
+    MIB,
+    S3_MAX_PART_SIZE,
+    S3_MAX_PARTS,
+    S3_MIN_PART_SIZE,
+    UPLOAD_CHECKPOINT_DIR,
+    LogLevel,
+)
+from vmie.utils import format_bytes, log_message
+
+
+class UploadSettings:
+    """Tuning options for multipart uploads."""
+
+    def __init__(
+        self,
+        part_size_mb: int = DEFAULT_UPLOAD_PART_SIZE_MB,
+        concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+        max_bandwidth_mbps: Optional[float] = None,
+        resume: bool = True,
+    ):
+        """
+        Initialize upload settings.
+
+        :param part_size_mb: Part size in MiB; raised automatically if the file would need more than 10,000 parts
+        :param concurrency: Number of parts uploaded at the same time
+        :param max_bandwidth_mbps: Upload bandwidth cap in MiB/s, or None for no cap
+        :param resume: Resume an interrupted upload of the same file from its checkpoint
+        """
+        self.part_size = max(part_size_mb * MIB, S3_MIN_PART_SIZE)
+        self.concurrency = max(concurrency, 1)
+        self.max_bandwidth = max_bandwidth_mbps * MIB if max_bandwidth_mbps else None
+        self.resume = resume
+
+
+class BandwidthLimiter:
+    """Paces byte transfers across threads so their combined rate stays under a cap."""
+
+    def __init__(self, bytes_per_second: Optional[float]):
+        """Initialize the limiter; a rate of None disables limiting."""
+        self.bytes_per_second = bytes_per_second
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, byte_count: int) -> None:
+        """Block until byte_count bytes may be sent without exceeding the rate."""
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + byte_count / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+class MultipartUploader:
+    """Uploads large files to S3 as parallel multipart uploads that survive interruptions."""
+
+    def __init__(self, s3_client: Any, settings: Optional[UploadSettings] = None):
+        """Initialize the uploader with an S3 client and upload settings."""
+        self.s3 = s3_client
+        self.settings = settings or UploadSettings()
+        self.limiter = BandwidthLimiter(self.settings.max_bandwidth)
+
+    def get_part_size(self, total_size: int) -> int:
+        """Return the part size for a file, keeping within the S3 limit of 10,000 parts."""
+        minimum = math.ceil(total_size / S3_MAX_PARTS / MIB) * MIB
+        return min(max(self.settings.part_size, minimum), S3_MAX_PART_SIZE)
+
+    def upload_file(self, local_file: Path, bucket: str, key: str, extra_args: Optional[Dict[str, Any]] = None) -> Dict:
+        """
+        Upload a file with parallel part uploads, resuming a previous interrupted upload when possible.
+
+        :param local_file: Path of the file to upload
+        :param bucket: Destination bucket
+        :param key: Destination key
+        :param extra_args: Extra CreateMultipartUpload arguments, e.g. StorageClass and Metadata
+        :return: Upload statistics: bytes, bytes_uploaded, bytes_resumed, parts, seconds, throughput (bytes/s),
+            sha256 (hex digest of the whole file) and etag (of the uploaded object)
+        """
+        stat = local_file.stat()
+        total_size = stat.st_size
+        checkpoint_path = self._get_checkpoint_path(local_file, bucket, key, stat.st_size, stat.st_mtime_ns)
+
+        checkpoint = self._load_checkpoint(checkpoint_path) if self.settings.resume else None
+        completed: Dict[int, str] = {}
+        if checkpoint:
+            uploaded = self._get_uploaded_parts(bucket, key, checkpoint)
+            if uploaded is None:
+                checkpoint = None
+            else:
+                completed = uploaded
+                log_message(
+                    LogLevel.INFO,
+                    f"Resuming upload {checkpoint['upload_id']}: {len(completed)} part(s) already uploaded",
+                )
+
+        if not checkpoint:
+            part_size = self.get_part_size(total_size)
+            response = self.s3.create_multipart_upload(Bucket=bucket, Key=key, **(extra_args or {}))
+            checkpoint = {
+                "bucket": bucket,
+                "key": key,
+                "source": str(local_file.resolve()),
+                "size": total_size,
+                "part_size": part_size,
+                "upload_id": response["UploadId"],
+                "parts": {},
+            }
+            self._save_checkpoint(checkpoint_path, checkpoint)
+
+        part_size = checkpoint["part_size"]
+        part_count = max(math.ceil(total_size / part_size), 1)
+        pending = [number for number in range(1, part_count + 1) if number not in completed]
+        bytes_resumed = sum(min(part_size, total_size - (number - 1) * part_size) for number in completed)
+
+        log_message(
+            LogLevel.INFO,
+            f"Multipart upload: {part_count} part(s) of {format_bytes(part_size)}, "
+            f"{self.settings.concurrency} concurrent"
+            + (
+                f", capped at {format_bytes(int(self.settings.max_bandwidth))}/s" if self.settings.max_bandwidth else ""
+            ),
+        )
+
+        start_time = time.monotonic()
+        checkpoint_lock = threading.Lock()
+
+        # The whole-file digest is built from the parts in order while they are read for upload, so the file
+        # is read only once; parts resumed from a previous run are read back just for the digest
+        digest = hashlib.sha256()
+        hash_turn = threading.Condition()
+        next_to_hash = [1]
+        hash_aborted = [False]
+        resumed = set(completed)
+
+        def read_part(part_number: int) -> bytes:
+            with open(local_file, "rb") as f:
+                f.seek((part_number - 1) * part_size)
+                return f.read(part_size)
+
+        def hash_resumed_parts() -> None:
+            while next_to_hash[0] in resumed:
+                digest.update(read_part(next_to_hash[0]))
+                next_to_hash[0] += 1
+
+        def abort_hashing() -> None:
+            with hash_turn:
+                hash_aborted[0] = True
+                hash_turn.notify_all()
+
+        with self._create_progress() as progress:
+            task = progress.add_task("upload", filename=local_file.name, total=total_size, completed=bytes_resumed)
+
+            def upload_part(part_number: int) -> None:
+                try:
+                    # Each worker reads its own part, so memory stays bounded by concurrency x part size
+                    data = read_part(part_number)
+                    with hash_turn:
+                        hash_turn.wait_for(lambda: next_to_hash[0] == part_number or hash_aborted[0])
+                        if hash_aborted[0]:
+                            return
+                        digest.update(data)
+                        next_to_hash[0] += 1
+                        hash_resumed_parts()
+                        hash_turn.notify_all()
+                except BaseException:
+                    # Parts waiting for their turn to be hashed would otherwise wait forever
+                    abort_hashing()
+                    raise
+                etag = self._upload_part(bucket, key, checkpoint["upload_id"], part_number, data)["ETag"]
+                # Record each ETag as soon as the part lands so an interruption loses at most the parts in flight
+                with checkpoint_lock:
+                    completed[part_number] = etag
+                    checkpoint["parts"][str(part_number)] = etag
+                    self._save_checkpoint(checkpoint_path, checkpoint)
+                progress.update(task, advance=len(data))
+
+            with hash_turn:
+                hash_resumed_parts()
+            with ThreadPoolExecutor(max_workers=self.settings.concurrency) as executor:
+                futures = [executor.submit(upload_part, part_number) for part_number in pending]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    # Stop queued parts from starting; finished parts are already checkpointed
+                    for future in futures:
+                        future.cancel()
+                    abort_hashing()
+                    raise
+
+        etag = self._complete_upload(
+            bucket,
+            key,
+            checkpoint["upload_id"],
+            [{"PartNumber": number, "ETag": completed[number]} for number in sorted(completed)],
+        )
+        checkpoint_path.unlink(missing_ok=True)
+        stats = self._report(total_size, total_size - bytes_resumed, bytes_resumed, part_count, start_time)
+        stats.update(sha256=digest.hexdigest(), etag=etag)
+        return stats
+
+    def upload_stream(
+        self,
+        chunks: Iterable[bytes],
+        name: str,
+        bucket: str,
+        key: str,
+        total_size: Optional[int] = None,
+        extra_args: Optional[Dict[str, Any]] = None,
+    ) -> Dict:
+        """
+        Upload a stream of byte chunks, e.g. an HTTP response body, without staging it on disk.
+
+        Chunks are cut into parts and uploaded while the stream is still being read. At most
+        concurrency + 1 parts are held in memory: reading pauses while every upload slot is busy,
+        so the stream is consumed at the pace S3 accepts it. Each part carries a SHA-256 checksum,
+        computed by the worker that uploads it, which S3 verifies on receipt since there is no local
+        copy to compare against. Streams cannot be resumed, so a failed upload is aborted instead of
+        checkpointed.
+
+        :param chunks: Iterable of byte chunks making up the object
+        :param name: Name shown in the progress bar
+        :param bucket: Destination bucket
+        :param key: Destination key
+        :param total_size: Expected size in bytes if known; used to size parts and verify the stream was complete
+        :param extra_args: Extra CreateMultipartUpload arguments, e.g. StorageClass and Metadata
+        :return: Upload statistics: bytes, bytes_uploaded, bytes_resumed, parts, seconds, throughput (bytes/s),
+            sha256 (hex digest of the whole stream) and etag (of the uploaded object)
+        """
+        part_size = self.get_part_size(total_size) if total_size else self.settings.part_size
+        if not total_size:
+            log_message(
+                LogLevel.WARN,
+                f"Stream size unknown, uploads are limited to {format_bytes(part_size * S3_MAX_PARTS)} "
+                "(raise --part-size for larger images)",
+            )
+        log_message(
+            LogLevel.INFO,
+            f"Streaming multipart upload: parts of {format_bytes(part_size)}, {self.settings.concurrency} concurrent, "
+            f"up to {format_bytes(part_size * (self.settings.concurrency + 1))} buffered",
+        )
+
+        upload_id = self.s3.create_multipart_upload(
+            Bucket=bucket, Key=key, ChecksumAlgorithm="SHA256", **(extra_args or {})
+        )["UploadId"]
+        start_time = time.monotonic()
+        completed: Dict[int, Dict[str, Any]] = {}
+        slots = threading.BoundedSemaphore(self.settings.concurrency)
+        failed = threading.Event()
+        futures: List[Future] = []
+        bytes_read = 0
+        digest = hashlib.sha256()
+
+        try:
+            with self._create_progress() as progress:
+                task = progress.add_task("upload", filename=name, total=total_size)
+
+                def upload_part(part_number: int, data: bytes) -> None:
+                    try:
+                        completed[part_number] = self._upload_part(
+                            bucket, key, upload_id, part_number, data, checksum=True
+                        )
+                        progress.update(task, advance=len(data))
+                    except BaseException:
+                        failed.set()
+                        raise
+                    finally:
+                        slots.release()
+
+                with ThreadPoolExecutor(max_workers=self.settings.concurrency) as executor:
+
+                    def submit(data: bytes) -> None:
+                        part_number = len(futures) + 1
+                        if part_number > S3_MAX_PARTS:
+                            raise ValueError(
+                                f"Stream exceeds {S3_MAX_PARTS} parts of {format_bytes(part_size)}; "
+                                "retry with a larger --part-size"
+                            )
+                        # Blocks while every slot is busy, which applies backpressure to the stream
+                        slots.acquire()
+                        futures.append(executor.submit(upload_part, part_number, data))
+
+                    try:
+                        buffer = bytearray()
+                        for chunk in chunks:
+                            bytes_read += len(chunk)
+                            digest.update(chunk)
+                            buffer += chunk
+                            while len(buffer) >= part_size:
+                                submit(bytes(buffer[:part_size]))
+                                del buffer[:part_size]
+                            if failed.is_set():
+                                break
+                        if not failed.is_set() and (buffer or not futures):
+                            # The last part may be smaller than the part size (or empty for an empty stream)
+                            submit(bytes(buffer))
+                        for future in futures:
+                            future.result()
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+
+            if total_size and bytes_read != total_size:
+                raise IOError(f"Stream ended after {bytes_read} of {total_size} bytes")
+            etag = self._complete_upload(bucket, key, upload_id, [completed[number] for number in sorted(completed)])
+        except BaseException:
+            try:
+                self.s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            except Exception as e:
+                log_message(LogLevel.WARN, f"Failed to abort multipart upload {upload_id}: {e}")
+            raise
+
+        stats = self._report(bytes_read, bytes_read, 0, len(completed), start_time)
+        stats.update(sha256=digest.hexdigest(), etag=etag)
+        return stats
+
+    def _upload_part(
+        self, bucket: str, key: str, upload_id: str, part_number: int, data: bytes, checksum: bool = False
+    ) -> Dict[str, Any]:
+        """Upload one part within the bandwidth cap and return its CompleteMultipartUpload entry."""
+        part: Dict[str, Any] = {"PartNumber": part_number}
+        extra_args = {}
+        if checksum:
+            part["ChecksumSHA256"] = base64.b64encode(hashlib.sha256(data).digest()).decode()
+            extra_args["ChecksumSHA256"] = part["ChecksumSHA256"]
+        self.limiter.acquire(len(data))
+        response = self.s3.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data, **extra_args
+        )
+        part["ETag"] = response["ETag"]
+        return part
+
+    def _complete_upload(self, bucket: str, key: str, upload_id: str, parts: List[Dict[str, Any]]) -> str:
+        """Assemble the uploaded parts, in part number order, into the final object and return its ETag."""
+        response = self.s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+        return response["ETag"]
+
+    @staticmethod
+    def _report(total_size: int, bytes_uploaded: int, bytes_resumed: int, part_count: int, start_time: float) -> Dict:
+        """Log the upload throughput and return the upload statistics."""
+        elapsed = max(time.monotonic() - start_time, 0.001)
+        stats = {
+            "bytes": total_size,
+            "bytes_uploaded": bytes_uploaded,
+            "bytes_resumed": bytes_resumed,
+            "parts": part_count,
+            "seconds": round(elapsed, 1),
+            "throughput": bytes_uploaded / elapsed,
+        }
+        log_message(
+            LogLevel.INFO,
+            f"Uploaded {format_bytes(bytes_uploaded)} in {elapsed:.1f}s ({format_bytes(int(stats['throughput']))}/s)"
+            + (f", {format_bytes(bytes_resumed)} resumed from a previous run" if bytes_resumed else ""),
+        )
+        return stats
+
+    @staticmethod
+    def _create_progress() -> Progress:
+        return Progress(
+            TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
+            BarColumn(bar_width=None),
+            "[progress.percentage]{task.percentage:>3.1f}%",
+            "•",
+            DownloadColumn(),
+            "•",
+            TransferSpeedColumn(),
+            "•",
+            TimeRemainingColumn(),
+        )
+
+    def _get_uploaded_parts(self, bucket: str, key: str, checkpoint: Dict) -> Optional[Dict[int, str]]:
+        """
+        Return {part number: ETag} for the parts S3 already holds for a checkpointed upload.
+
+        Parts are trusted only if S3 lists them with the ETag recorded locally, or if they were uploaded after
+        the last checkpoint write and have the expected size. Returns None if the upload no longer exists.
+        """
+        total_size = checkpoint["size"]
+        part_size = checkpoint["part_size"]
+        recorded = checkpoint.get("parts", {})
+        completed: Dict[int, str] = {}
+        try:
+            paginator = self.s3.get_paginator("list_parts")
+            for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=checkpoint["upload_id"]):
+                for part in page.get("Parts", []):
+                    number = part["PartNumber"]
+                    expected_size = min(part_size, total_size - (number - 1) * part_size)
+                    if recorded.get(str(number), part["ETag"]) == part["ETag"] and part["Size"] == expected_size:
+                        completed[number] = part["ETag"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchUpload", "404"):
+                log_message(LogLevel.WARN, "Previous upload no longer exists in S3, starting over")
+                return None
+            raise
+        return completed
+
+    @staticmethod
+    def _get_checkpoint_path(local_file: Path, bucket: str, key: str, size: int, mtime_ns: int) -> Path:
+        # A changed file gets a new checkpoint, so stale parts are never combined with new content
+        identity = f"{bucket}/{key}|{local_file.resolve()}|{size}|{mtime_ns}"
+        return UPLOAD_CHECKPOINT_DIR / f"{hashlib.sha256(identity.encode()).hexdigest()[:32]}.json"
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_path: Path) -> Optional[Dict]:
+        try:
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_checkpoint(checkpoint_path: Path, checkpoint: Dict) -> None:
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = checkpoint_path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        temp_path.replace(checkpoint_path)
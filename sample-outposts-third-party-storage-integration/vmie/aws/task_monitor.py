@@ -0,0 +1,140 @@
+"""Batched, adaptive status polling for image import and export tasks."""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from vmie.common import (
+    TASK_FINAL_STAGE_MESSAGES,
+    TASK_POLL_FINAL_STAGE_SECONDS,
+    TASK_POLL_MAX_SECONDS,
+    TASK_POLL_MIN_SECONDS,
+)
+
+# describe call, task ID parameter, response key and result key per operation type
+_DESCRIBE_PARAMETERS = {
+    "import": ("describe_import_image_tasks", "ImportTaskIds", "ImportImageTasks", "ImportTaskId"),
+    "export": ("describe_export_image_tasks", "ExportImageTaskIds", "ExportImageTasks", "ExportImageTaskId"),
+}
+
+
+class TaskState:
+    """The latest reported state of an import or export task, with its estimated time to completion."""
+
+    def __init__(self, task_id: str):
+        """Initialize the state of a task that has not been described yet."""
+        self.task_id = task_id
+        self.status = "pending"
+        self.status_message = ""
+        self.progress = 0
+        self.result: Optional[str] = None
+        self.eta_seconds: Optional[float] = None
+        # (time, progress) of the first progress report, the baseline for the completion rate
+        self._first_report: Optional[Tuple[float, int]] = None
+        self._interval = TASK_POLL_MIN_SECONDS
+
+    @property
+    def completed(self) -> bool:
+        return self.status == "completed"
+
+    @property
+    def failed(self) -> bool:
+        return self.status in ["cancelled", "deleted"]
+
+    def describe(self) -> str:
+        """Return a short status line, e.g. "active, converting, 45%, ETA 14:32 (~12m)"."""
+        parts = [self.status] + ([self.status_message] if self.status_message else [])
+        if self.progress:
+            parts.append(f"{self.progress}%")
+        if self.eta_seconds is not None:
+            finish = time.strftime("%H:%M", time.localtime(time.time() + self.eta_seconds))
+            parts.append(f"ETA {finish} (~{max(round(self.eta_seconds / 60), 1)}m)")
+        return ", ".join(parts)
+
+    def update(self, task: Dict[str, Any], operation_type: str) -> None:
+        """Apply a task description from a describe call."""
+        now = time.monotonic()
+        self.status = task.get("Status", self.status)
+        self.status_message = task.get("StatusMessage", "")
+        self.progress = self._parse_progress(task.get("Progress"))
+
+        if self.completed:
+            self.progress = 100
+            if operation_type == "import":
+                self.result = task.get("ImageId")
+            else:
+                location = task["S3ExportLocation"]
+                self.result = f"s3://{location['S3Bucket']}/{location.get('S3Prefix', '')}{self.task_id}.raw"
+            return
+
+        # Estimate the remaining time from the average rate since progress was first reported
+        if self.progress and self._first_report is None:
+            self._first_report = (now, self.progress)
+        elif self._first_report and self.progress > self._first_report[1]:
+            start_time, start_progress = self._first_report
+            rate = (self.progress - start_progress) / (now - start_time)
+            self.eta_seconds = (100 - self.progress) / rate
+
+    def next_interval(self) -> float:
+        """
+        Return the seconds to wait before checking this task again.
+
+        Polls start at the minimum interval so fast failures are caught, then back off while there is
+        no progress to go by. Once a completion rate is known, the task is checked about four times
+        over its remaining time, so checks get more frequent as it nears completion. Tasks in their
+        final stage (e.g. booting) are checked often regardless, as they can finish at any time.
+        """
+        if self.eta_seconds is not None:
+            interval = self.eta_seconds / 4
+        else:
+            interval = self._interval
+            self._interval = min(self._interval * 2, TASK_POLL_MAX_SECONDS)
+        if self.progress >= 90 or self.status_message.lower() in TASK_FINAL_STAGE_MESSAGES:
+            interval = min(interval, TASK_POLL_FINAL_STAGE_SECONDS)
+        return min(max(interval, TASK_POLL_MIN_SECONDS), TASK_POLL_MAX_SECONDS)
+
+    @staticmethod
+    def _parse_progress(progress: Any) -> int:
+        # Progress is reported as a string, e.g. "27", and is missing before a task starts
+        try:
+            return int(progress)
+        except (TypeError, ValueError):
+            return 0
+
+
+class TaskMonitor:
+    """Tracks several import or export tasks, describing all of them with a single API call per poll."""
+
+    def __init__(self, ec2_client: Any, operation_type: str):
+        """
+        Initialize the monitor.
+
+        :param ec2_client: EC2 client used for the describe calls
+        :param operation_type: Either 'import' or 'export'
+        """
+        method, self._id_parameter, self._response_key, self._id_key = _DESCRIBE_PARAMETERS[operation_type]
+        self._describe = getattr(ec2_client, method)
+        self.operation_type = operation_type
+        self.tasks: Dict[str, TaskState] = {}
+
+    def track(self, task_id: str) -> TaskState:
+        """Start tracking a task and return its state."""
+        return self.tasks.setdefault(task_id, TaskState(task_id))
+
+    def untrack(self, task_id: str) -> None:
+        """Stop tracking a task, e.g. once it has finished."""
+        self.tasks.pop(task_id, None)
+
+    def poll(self) -> Dict[str, TaskState]:
+        """Describe all tracked tasks in one call and return their updated states, keyed by task ID."""
+        if self.tasks:
+            response = self._describe(**{self._id_parameter: list(self.tasks)})
+            for task in response[self._response_key]:
+                state = self.tasks.get(task[self._id_key])
+                if state:
+                    state.update(task, self.operation_type)
+        return self.tasks
+
+    def next_interval(self) -> float:
+        """Return the seconds to wait before the next poll, following the task that needs checking soonest."""
+        intervals: List[float] = [state.next_interval() for state in self.tasks.values()]
+        return min(intervals) if intervals else TASK_POLL_MAX_SECONDS
@@ -8,17 +8,25 @@ from rich.console import Console
 from rich.rule import Rule
 from typing_extensions import Annotated
 
+from vmie.aws import UploadSettings
 from vmie.common import (
+    DEFAULT_DOWNLOAD_CONNECTIONS,
     DEFAULT_INSTANCE_PROFILE,
+    DEFAULT_MAX_CONCURRENT_IMPORTS,
+    DEFAULT_UPLOAD_CONCURRENCY,
+    DEFAULT_UPLOAD_PART_SIZE_MB,
     ERR_CONVERT_OPERATION_FAILED,
     ERR_EXPORT_OPERATION_FAILED,
     ERR_IMPORT_OPERATION_FAILED,
     OperationMode,
 )
-from vmie.core import VMIECore
+from vmie.core import BatchImporter, VMIECore
 from vmie.utils import (
     error_and_exit,
+    load_batch_manifest,
+    setup_logging,
     validate_ami_id,
+    validate_batch_manifest,
     validate_image_source,
     validate_license_type,
     validate_usage_operation,
@@ -28,6 +36,18 @@ console = Console()
 app = typer.Typer(name="vmie", help="VM Import/Export Tool for AWS EC2", add_completion=False)
 
 
+@app.callback()
+def main(
+    verbose: Annotated[
+        bool,
+        typer.Option("--verbose", "-v", help="Show debug output, including a decompression benchmark"),
+    ] = False,
+) -> None:
+    """VM Import/Export Tool for AWS EC2."""
+    if verbose:
+        setup_logging("DEBUG")
+
+
 @app.command("import")
 def import_image(
     region: Annotated[str, typer.Option("--region", "-r", help="AWS region (e.g., us-west-2)")],
@@ -61,12 +81,48 @@ def import_image(
             callback=validate_usage_operation,
         ),
     ] = None,
+    part_size: Annotated[
+        int, typer.Option("--part-size", min=5, help="Multipart upload part size in MiB")
+    ] = DEFAULT_UPLOAD_PART_SIZE_MB,
+    upload_concurrency: Annotated[
+        int, typer.Option("--upload-concurrency", min=1, max=64, help="Number of parts uploaded in parallel")
+    ] = DEFAULT_UPLOAD_CONCURRENCY,
+    max_bandwidth: Annotated[
+        Optional[float], typer.Option("--max-bandwidth", min=1, help="Upload bandwidth cap in MiB/s (default: no cap)")
+    ] = None,
+    resume: Annotated[
+        bool, typer.Option("--resume/--no-resume", help="Resume an interrupted upload of the same file")
+    ] = True,
+    stage_to_disk: Annotated[
+        bool,
+        typer.Option(
+            "--stage-to-disk",
+            help="Download URL sources and decompress compressed images to a temporary directory before uploading",
+        ),
+    ] = False,
+    download_connections: Annotated[
+        int,
+        typer.Option(
+            "--download-connections",
+            min=1,
+            max=32,
+            help="Parallel ranged connections for --stage-to-disk downloads from servers that support them",
+        ),
+    ] = DEFAULT_DOWNLOAD_CONNECTIONS,
+    convert_raw: Annotated[
+        bool,
+        typer.Option(
+            "--convert-raw",
+            help="Convert local RAW images to compressed stream-optimized VMDK, uploading only their allocated data",
+        ),
+    ] = False,
 ) -> None:
     """
     Import a VM image to AWS EC2 as an AMI.
 
     This command imports a VM image from various sources and converts it to an AWS EC2 AMI.
-    The image can be in OVA, VMDK, VHD, VHDX, or RAW format. Optionally install sanbootable
+    The image can be in OVA, VMDK, VHD, VHDX, or RAW format, or in QCOW2 format, which is
+    converted to a stream-optimized VMDK before upload. Optionally install sanbootable
     for sanboot support.
 
     The source can be:
@@ -100,6 +156,14 @@ def import_image(
     \b
     # Import with custom usage operation
     python -m vmie import --region us-west-2 --s3-bucket my-bucket --source ./image.ova --usage-operation RunInstances:0010
+
+    \b
+    # Upload a large image with 128 MiB parts, 16 parallel parts and a 200 MiB/s bandwidth cap
+    python -m vmie import --region us-west-2 --s3-bucket my-bucket --source ./image.raw --part-size 128 --upload-concurrency 16 --max-bandwidth 200
+
+    \b
+    # Import a thin-provisioned RAW disk, uploading only its allocated data
+    python -m vmie import --region us-west-2 --s3-bucket my-bucket --source ./disk.raw --convert-raw
     """
     try:
         vmie = VMIECore(
@@ -111,6 +175,10 @@ def import_image(
             install_sanbootable=install_sanbootable,
             license_type=license_type,
             usage_operation=usage_operation,
+            upload_settings=UploadSettings(part_size, upload_concurrency, max_bandwidth, resume),
+            stage_to_disk=stage_to_disk,
+            download_connections=download_connections,
+            convert_raw=convert_raw,
         )
 
         results = vmie.execute()
@@ -125,6 +193,135 @@ def import_image(
         )
 
 
+@app.command("batch")
+def batch_import(
+    region: Annotated[str, typer.Option("--region", "-r", help="AWS region (e.g., us-west-2)")],
+    bucket: Annotated[str, typer.Option("--s3-bucket", "-b", help="S3 bucket name for import operations")],
+    manifest: Annotated[
+        str,
+        typer.Option(
+            "--manifest",
+            "-m",
+            help='JSON file listing the images to import: {"images": [{"source": "..."}, ...]}',
+            callback=validate_batch_manifest,
+        ),
+    ],
+    max_concurrent_imports: Annotated[
+        int,
+        typer.Option(
+            "--max-concurrent-imports",
+            min=1,
+            help="Maximum import tasks running at once; keep within the account's VM Import task quota",
+        ),
+    ] = DEFAULT_MAX_CONCURRENT_IMPORTS,
+    license_type: Annotated[
+        Optional[str],
+        typer.Option(
+            "--license-type",
+            help="Default license type for the AMIs (AWS or BYOL). Cannot be used with --usage-operation.",
+            callback=validate_license_type,
+        ),
+    ] = None,
+    usage_operation: Annotated[
+        Optional[str],
+        typer.Option(
+            "--usage-operation",
+            help="Default usage operation value for the AMIs. Cannot be used with --license-type.",
+            callback=validate_usage_operation,
+        ),
+    ] = None,
+    part_size: Annotated[
+        int, typer.Option("--part-size", min=5, help="Multipart upload part size in MiB")
+    ] = DEFAULT_UPLOAD_PART_SIZE_MB,
+    upload_concurrency: Annotated[
+        int, typer.Option("--upload-concurrency", min=1, max=64, help="Number of parts uploaded in parallel")
+    ] = DEFAULT_UPLOAD_CONCURRENCY,
+    max_bandwidth: Annotated[
+        Optional[float], typer.Option("--max-bandwidth", min=1, help="Upload bandwidth cap in MiB/s (default: no cap)")
+    ] = None,
+    resume: Annotated[
+        bool, typer.Option("--resume/--no-resume", help="Resume an interrupted upload of the same file")
+    ] = True,
+    stage_to_disk: Annotated[
+        bool,
+        typer.Option(
+            "--stage-to-disk",
+            help="Download URL sources and decompress compressed images to a temporary directory before uploading",
+        ),
+    ] = False,
+    download_connections: Annotated[
+        int,
+        typer.Option(
+            "--download-connections",
+            min=1,
+            max=32,
+            help="Parallel ranged connections for --stage-to-disk downloads from servers that support them",
+        ),
+    ] = DEFAULT_DOWNLOAD_CONNECTIONS,
+    convert_raw: Annotated[
+        bool,
+        typer.Option(
+            "--convert-raw",
+            help="Convert local RAW images to compressed stream-optimized VMDK, uploading only their allocated data",
+        ),
+    ] = False,
+) -> None:
+    """
+    Import many VM images to AWS EC2 as AMIs.
+
+    Images listed in the manifest are prepared (downloaded, decompressed and uploaded to S3) one at a
+    time, while the images already in S3 are imported by AWS. At most --max-concurrent-imports import
+    tasks run at once; the rest wait in a queue. A failed image does not stop the batch. Phase timings
+    for every image are shown at the end.
+
+    The manifest is a JSON file with an "images" list. Each image has a "source" (any source accepted
+    by the import command) and optionally a "license_type" or "usage_operation" that replaces the
+    command line options for that image:
+
+    \b
+    {"images": [
+        {"source": "https://example.com/web.raw.xz"},
+        {"source": "./db.vmdk", "license_type": "BYOL"}
+    ]}
+
+    Examples:
+
+    \b
+    # Import every image of a manifest, running up to 5 import tasks at once
+    python -m vmie batch --region us-west-2 --s3-bucket my-bucket --manifest images.json
+
+    \b
+    # Import with up to 10 concurrent import tasks and BYOL licenses by default
+    python -m vmie batch --region us-west-2 --s3-bucket my-bucket --manifest images.json --max-concurrent-imports 10 --license-type BYOL
+    """
+    try:
+        vmie = VMIECore(
+            region=region,
+            bucket_name=bucket,
+            operation_mode=OperationMode.IMPORT_ONLY,
+            license_type=license_type,
+            usage_operation=usage_operation,
+            upload_settings=UploadSettings(part_size, upload_concurrency, max_bandwidth, resume),
+            stage_to_disk=stage_to_disk,
+            download_connections=download_connections,
+            convert_raw=convert_raw,
+        )
+
+        batch = BatchImporter(vmie, max_concurrent_imports).run(load_batch_manifest(manifest))
+        BatchImporter.display_results(batch)
+
+    except Exception as e:
+        error_and_exit(
+            "Batch import operation failed",
+            Rule(),
+            str(e),
+            code=ERR_IMPORT_OPERATION_FAILED,
+        )
+
+    if any(not image.ami_id for image in batch):
+        raise typer.Exit(code=ERR_IMPORT_OPERATION_FAILED)
+
+
 @app.command("export")
 def export_ami(
     region: Annotated[str, typer.Option("--region", "-r", help="AWS region (e.g., us-west-2)")],
@@ -222,6 +419,41 @@ def convert(
             callback=validate_usage_operation,
         ),
     ] = None,
+    part_size: Annotated[
+        int, typer.Option("--part-size", min=5, help="Multipart upload part size in MiB")
+    ] = DEFAULT_UPLOAD_PART_SIZE_MB,
+    upload_concurrency: Annotated[
+        int, typer.Option("--upload-concurrency", min=1, max=64, help="Number of parts uploaded in parallel")
+    ] = DEFAULT_UPLOAD_CONCURRENCY,
+    max_bandwidth: Annotated[
+        Optional[float], typer.Option("--max-bandwidth", min=1, help="Upload bandwidth cap in MiB/s (default: no cap)")
+    ] = None,
+    resume: Annotated[
+        bool, typer.Option("--resume/--no-resume", help="Resume an interrupted upload of the same file")
+    ] = True,
+    stage_to_disk: Annotated[
+        bool,
+        typer.Option(
+            "--stage-to-disk",
+            help="Download URL sources and decompress compressed images to a temporary directory before uploading",
+        ),
+    ] = False,
+    download_connections: Annotated[
+        int,
+        typer.Option(
+            "--download-connections",
+            min=1,
+            max=32,
+            help="Parallel ranged connections for --stage-to-disk downloads from servers that support them",
+        ),
+    ] = DEFAULT_DOWNLOAD_CONNECTIONS,
+    convert_raw: Annotated[
+        bool,
+        typer.Option(
+            "--convert-raw",
+            help="Convert local RAW images to compressed stream-optimized VMDK, uploading only their allocated data",
+        ),
+    ] = False,
 ) -> None:
     """
     Full workflow: Import VM image and export to RAW format.
@@ -272,6 +504,10 @@ def convert(
             export_prefix=export_prefix,
             license_type=license_type,
             usage_operation=usage_operation,
+            upload_settings=UploadSettings(part_size, upload_concurrency, max_bandwidth, resume),
+            stage_to_disk=stage_to_disk,
+            download_connections=download_connections,
+            convert_raw=convert_raw,
         )
 
         results = vmie.execute()
@@ -2,13 +2,41 @@
 
 from .constants import (  # Instance and timeout settings; AWS policies and roles; File formats
     COMPRESSED_EXTENSIONS,
+    CONVERT_READ_SIZE,
+    CONVERTIBLE_FORMATS,
+    DECOMPRESS_BENCHMARK_SAMPLE_SIZE,
+    DECOMPRESS_READ_SIZE,
+    DEFAULT_DOWNLOAD_CONNECTIONS,
     DEFAULT_INSTANCE_PROFILE,
+    DEFAULT_MAX_CONCURRENT_IMPORTS,
     DEFAULT_TIMEOUT_MINUTES,
+    DEFAULT_UPLOAD_CONCURRENCY,
+    DEFAULT_UPLOAD_PART_SIZE_MB,
+    DIGEST_INDEX_PATH,
+    DIGEST_TAG_KEY,
+    DOWNLOAD_DIR,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_SEGMENT_SIZE,
     EC2_TRUST_POLICY,
     EXPORT_TIMEOUT_MINUTES,
     IMPORT_TIMEOUT_MINUTES,
     INSTANCE_TYPE,
+    MIB,
+    PARALLEL_DECOMPRESSORS,
+    PROGRESS_REFRESH_SECONDS,
+    S3_MAX_PART_SIZE,
+    S3_MAX_PARTS,
+    S3_MIN_PART_SIZE,
+    STREAM_CHUNK_SIZE,
     SUPPORTED_FORMATS,
+    TASK_FINAL_STAGE_MESSAGES,
+    TASK_POLL_FINAL_STAGE_SECONDS,
+    TASK_POLL_MAX_SECONDS,
+    TASK_POLL_MIN_SECONDS,
+    UPLOAD_CHECKPOINT_DIR,
+    VMDK_COMPRESSION_LEVEL,
+    VMDK_GRAIN_SIZE,
+    VMIE_STATE_DIR,
     VMIMPORT_EC2_INLINE_POLICY,
     VMIMPORT_ROLE_NAME,
     VMIMPORT_TRUST_POLICY,
@@ -49,6 +77,7 @@ from .error_codes import (
     ERR_AWS_VMIMPORT_ROLE_SETUP_FAILED,
     ERR_CONVERT_OPERATION_FAILED,
     ERR_EXPORT_OPERATION_FAILED,
+    ERR_FILE_CONVERT_FAILED,
     ERR_FILE_DECOMPRESS_BZ2_FAILED,
     ERR_FILE_DECOMPRESS_FAILED,
     ERR_FILE_DECOMPRESS_GZ_FAILED,
@@ -73,13 +102,41 @@ __all__ = [
     "DEFAULT_TIMEOUT_MINUTES",
     "IMPORT_TIMEOUT_MINUTES",
     "EXPORT_TIMEOUT_MINUTES",
+    "DEFAULT_MAX_CONCURRENT_IMPORTS",
+    "TASK_POLL_MIN_SECONDS",
+    "TASK_POLL_MAX_SECONDS",
+    "TASK_POLL_FINAL_STAGE_SECONDS",
+    "TASK_FINAL_STAGE_MESSAGES",
     "VMIMPORT_ROLE_NAME",
     "VMIMPORT_TRUST_POLICY",
     "EC2_TRUST_POLICY",
     "get_vmimport_bucket_inline_policy",
     "SUPPORTED_FORMATS",
+    "CONVERTIBLE_FORMATS",
     "COMPRESSED_EXTENSIONS",
+    "PARALLEL_DECOMPRESSORS",
     "VMIMPORT_EC2_INLINE_POLICY",
+    "VMIE_STATE_DIR",
+    "UPLOAD_CHECKPOINT_DIR",
+    "DOWNLOAD_DIR",
+    "DIGEST_INDEX_PATH",
+    "DIGEST_TAG_KEY",
+    "MIB",
+    "DEFAULT_UPLOAD_PART_SIZE_MB",
+    "DEFAULT_UPLOAD_CONCURRENCY",
+    "S3_MIN_PART_SIZE",
+    "S3_MAX_PART_SIZE",
+    "S3_MAX_PARTS",
+    "DEFAULT_DOWNLOAD_CONNECTIONS",
+    "DOWNLOAD_SEGMENT_SIZE",
+    "DOWNLOAD_RETRIES",
+    "PROGRESS_REFRESH_SECONDS",
+    "STREAM_CHUNK_SIZE",
+    "DECOMPRESS_READ_SIZE",
+    "DECOMPRESS_BENCHMARK_SAMPLE_SIZE",
+    "VMDK_GRAIN_SIZE",
+    "VMDK_COMPRESSION_LEVEL",
+    "CONVERT_READ_SIZE",
     # Enums
     "OperationMode",
     "LogLevel",
@@ -128,6 +185,7 @@ __all__ = [
     "ERR_FILE_DECOMPRESS_GZ_FAILED",
     "ERR_FILE_DECOMPRESS_BZ2_FAILED",
     "ERR_JSON_LOAD_FAILED",
+    "ERR_FILE_CONVERT_FAILED",
     "ERR_SANBOOTABLE_INSTALL_FAILED",
     "ERR_SANBOOTABLE_SCRIPT_NOT_FOUND",
     "ERR_SANBOOTABLE_SCRIPT_INSTALL_FAILED",
@@ -2,6 +2,7 @@
 This module defines project-level constants.
 """
 
+from pathlib import Path
 from typing import Dict, List
 
 # Default values
@@ -11,6 +12,15 @@ DEFAULT_TIMEOUT_MINUTES = 60
 IMPORT_TIMEOUT_MINUTES = 60 * 12
 EXPORT_TIMEOUT_MINUTES = 60 * 12
 
+# Batch imports: import tasks running at once (keep within the account's VM Import quota)
+DEFAULT_MAX_CONCURRENT_IMPORTS = 5
+
+# Import/export task polling: bounds of the adaptive interval, and the cap for tasks in their final stage
+TASK_POLL_MIN_SECONDS = 5
+TASK_POLL_MAX_SECONDS = 60
+TASK_POLL_FINAL_STAGE_SECONDS = 10
+TASK_FINAL_STAGE_MESSAGES = ["booting", "booted", "preparing ami"]
+
 # Supported image formats and their extensions
 SUPPORTED_FORMATS: Dict[str, List[str]] = {
     "ova": [".ova"],
@@ -19,9 +29,58 @@ SUPPORTED_FORMATS: Dict[str, List[str]] = {
     "raw": [".raw", ".img"],
 }
 
+# Formats ImportImage does not accept, converted locally to a stream-optimized VMDK before upload
+CONVERTIBLE_FORMATS: Dict[str, List[str]] = {
+    "qcow2": [".qcow2", ".qcow"],
+}
+
 # Compressed file extensions
 COMPRESSED_EXTENSIONS = [".xz", ".gz", ".bz2"]
 
+# Parallel decompressors by extension, in order of preference; each is used only if installed
+PARALLEL_DECOMPRESSORS = {
+    ".gz": [["pigz", "-dc"]],
+    ".bz2": [["pbzip2", "-dc"], ["lbzip2", "-dc"]],
+    ".xz": [["xz", "-dc", "-T0"], ["pixz", "-d"]],
+}
+
+# Local state kept between runs (upload checkpoints, resumable downloads and uploaded image digests)
+VMIE_STATE_DIR = Path.home() / ".vmie"
+UPLOAD_CHECKPOINT_DIR = VMIE_STATE_DIR / "uploads"
+DOWNLOAD_DIR = VMIE_STATE_DIR / "downloads"
+DIGEST_INDEX_PATH = VMIE_STATE_DIR / "digests.json"
+
+# S3 object tag holding the SHA-256 of an uploaded image
+DIGEST_TAG_KEY = "vmie-sha256"
+
+# S3 multipart upload settings and limits
+MIB = 1024 * 1024
+DEFAULT_UPLOAD_PART_SIZE_MB = 64
+DEFAULT_UPLOAD_CONCURRENCY = 8
+S3_MIN_PART_SIZE = 5 * MIB
+S3_MAX_PART_SIZE = 5 * 1024 * MIB
+S3_MAX_PARTS = 10000
+
+# Segmented HTTP download settings
+DEFAULT_DOWNLOAD_CONNECTIONS = 8
+DOWNLOAD_SEGMENT_SIZE = 64 * MIB
+DOWNLOAD_RETRIES = 3
+
+# Minimum interval between progress bar updates from background transfers
+PROGRESS_REFRESH_SECONDS = 0.25
+
+# Read size when streaming a URL source straight into S3
+STREAM_CHUNK_SIZE = MIB
+
+# Compressed bytes read at a time, and bytes decompressed per backend in the --verbose benchmark
+DECOMPRESS_READ_SIZE = MIB
+DECOMPRESS_BENCHMARK_SAMPLE_SIZE = 32 * MIB
+
+# Stream-optimized VMDK conversion: grain size, zlib level of the grains, and guest data read at a time
+VMDK_GRAIN_SIZE = 64 * 1024
+VMDK_COMPRESSION_LEVEL = 6
+CONVERT_READ_SIZE = 8 * MIB
+
 # EC2 instance trust policy for SSM access
 EC2_TRUST_POLICY = {
     "Version": "2012-10-17",
@@ -56,6 +56,7 @@ ERR_FILE_DECOMPRESS_FAILED = -20204
 ERR_FILE_DECOMPRESS_GZ_FAILED = -20205
 ERR_FILE_DECOMPRESS_BZ2_FAILED = -20206
 ERR_JSON_LOAD_FAILED = -20207
+ERR_FILE_CONVERT_FAILED = -20208
 
 # Sanbootable installation errors (-20300 to -20399)
 ERR_SANBOOTABLE_INSTALL_FAILED = -20300
@@ -1,7 +1,20 @@
 """Core VMIE functionality modules."""
 
+from .batch_import import BatchImage, BatchImporter
+from .image_conversion import Qcow2Image, RawImage, StreamOptimizedVmdkWriter
+from .ranged_download import RangedDownloader
 from .sanbootable import SanbootableInstaller
 from .source_processor import SourceProcessor
 from .vmie_core import VMIECore
 
-__all__ = ["VMIECore", "SourceProcessor", "SanbootableInstaller"]
+__all__ = [
+    "VMIECore",
+    "SourceProcessor",
+    "SanbootableInstaller",
+    "RangedDownloader",
+    "BatchImporter",
+    "BatchImage",
+    "Qcow2Image",
+    "RawImage",
+    "StreamOptimizedVmdkWriter",
+]
@@ -0,0 +1,267 @@
+"""Batch imports of many images, overlapping local preparation with the AWS import tasks of earlier images."""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from vmie.aws import TaskMonitor
+from vmie.common import DEFAULT_MAX_CONCURRENT_IMPORTS, IMPORT_TIMEOUT_MINUTES, TASK_POLL_MAX_SECONDS, LogLevel
+from vmie.utils import cleanup_temp_directory, display_table, log_message, log_section
+
+if TYPE_CHECKING:
+    from vmie.core.vmie_core import VMIECore
+
+
+class BatchImage:
+    """An image of a batch import, with its outcome and the time spent in each phase."""
+
+    PREPARE = "prepare"
+    QUEUE = "queue"
+    IMPORT = "import"
+
+    def __init__(
+        self, number: int, source: str, license_type: Optional[str] = None, usage_operation: Optional[str] = None
+    ):
+        """Initialize a pending batch image; number is its position in the manifest, starting at 1."""
+        self.number = number
+        self.source = source
+        self.license_type = license_type
+        self.usage_operation = usage_operation
+        self.import_source: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.task_id: Optional[str] = None
+        self.ami_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.phase: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.last_report: Optional[Tuple[str, str, int]] = None
+        self._phase_start = 0.0
+
+    def start_phase(self, phase: str) -> None:
+        """End the current phase, if any, and start timing the next one."""
+        self.end_phase()
+        self.phase = phase
+        self._phase_start = time.monotonic()
+
+    def end_phase(self) -> None:
+        if self.phase:
+            self.timings[self.phase] = time.monotonic() - self._phase_start
+            self.phase = None
+
+    def fail(self, error: str) -> None:
+        failed_phase = self.phase
+        self.end_phase()
+        self.error = f"{failed_phase} failed: {error}" if failed_phase else error
+        log_message(LogLevel.ERROR, f"Image {self.number} ({self.source}) {self.error}")
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the current phase started."""
+        return time.monotonic() - self._phase_start
+
+
+class BatchImporter:
+    """
+    Imports the images of a manifest, pipelining local work with AWS import tasks.
+
+    Images are prepared (downloaded, decompressed and uploaded to S3) one after another in a background
+    thread, so local bandwidth goes to one image at a time, while the images already in S3 are imported.
+    ImportImage tasks are started from a queue, at most max_concurrent_imports at a time, and all running
+    tasks are checked with one describe call per poll, at the adaptive interval of a TaskMonitor. A failed
+    image is reported at the end without stopping the rest of the batch.
+    """
+
+    def __init__(self, vmie: "VMIECore", max_concurrent_imports: int = DEFAULT_MAX_CONCURRENT_IMPORTS):
+        """
+        Initialize the batch importer.
+
+        :param vmie: Core used to stage images; its bucket, upload settings and license options apply to every image
+        :param max_concurrent_imports: Maximum number of ImportImage tasks running at the same time
+        """
+        self.vmie = vmie
+        self.aws_client = vmie.aws_client
+        self.max_concurrent_imports = max(max_concurrent_imports, 1)
+        self.monitor = TaskMonitor(self.aws_client.ec2, "import")
+        # Set when AWS rejects a new task because the account's import quota is used up by other imports
+        self._quota_retry_at = 0.0
+
+    def run(self, images: List[Dict[str, str]]) -> List[BatchImage]:
+        """
+        Import every image of a manifest and return them with their outcomes and phase timings.
+
+        :param images: Manifest entries, each with a source and optional license_type or usage_operation
+        :return: The batch images, in manifest order
+        """
+        batch = [
+            BatchImage(number, image["source"], image.get("license_type"), image.get("usage_operation"))
+            for number, image in enumerate(images, start=1)
+        ]
+        try:
+            log_section(f"Batch Import of {len(batch)} Image(s)", section_level=1)
+            self.aws_client.create_s3_bucket(self.vmie.bucket_name)
+            self.aws_client.setup_vmimport_role(self.vmie.bucket_name)
+
+            prepared: "queue.Queue[Optional[BatchImage]]" = queue.Queue()
+            preparer = threading.Thread(target=self._prepare_images, args=(batch, prepared), daemon=True)
+            preparer.start()
+            self._schedule_imports(prepared)
+            preparer.join()
+        finally:
+            cleanup_temp_directory(self.vmie.temp_dir)
+        return batch
+
+    def _prepare_images(self, batch: List[BatchImage], prepared: "queue.Queue[Optional[BatchImage]]") -> None:
+        """Stage each image in S3 in turn and hand it to the import scheduler."""
+        try:
+            for image in batch:
+                log_section(f"Preparing Image {image.number}/{len(batch)}: {image.source}", section_level=2)
+                image.start_phase(BatchImage.PREPARE)
+                try:
+                    image.import_source, image.filename = self.vmie.stage_image(image.source)
+                except (Exception, SystemExit) as e:
+                    # Failures exit through error_and_exit, which has already shown the details
+                    image.fail(f"exit code {e.code}" if isinstance(e, SystemExit) else str(e))
+                    continue
+                image.start_phase(BatchImage.QUEUE)
+                prepared.put(image)
+        finally:
+            prepared.put(None)
+
+    def _schedule_imports(self, prepared: "queue.Queue[Optional[BatchImage]]") -> None:
+        """Start import tasks for prepared images as quota allows, and track them until all have finished."""
+        waiting: Deque[BatchImage] = deque()
+        running: Dict[str, BatchImage] = {}
+        preparing = True
+        next_poll = 0.0
+
+        while preparing or waiting or running:
+            # Sleep until the next status poll or quota retry, waking early for newly prepared images
+            wake_times = [next_poll] if running else []
+            if waiting and self._quota_retry_at > time.monotonic():
+                wake_times.append(self._quota_retry_at)
+            timeout = max(min(wake_times) - time.monotonic(), 0) if wake_times else None
+            if preparing:
+                try:
+                    image = prepared.get(timeout=timeout)
+                    if image is None:
+                        preparing = False
+                    else:
+                        waiting.append(image)
+                except queue.Empty:
+                    pass
+            elif timeout:
+                time.sleep(timeout)
+
+            self._start_imports(waiting, running)
+            if running and time.monotonic() >= next_poll:
+                self._poll_imports(running, len(waiting))
+                # Fill the slots of finished tasks now rather than a poll interval later, and poll the new tasks too
+                self._start_imports(waiting, running)
+                next_poll = time.monotonic() + self.monitor.next_interval()
+
+    def _start_imports(self, waiting: Deque[BatchImage], running: Dict[str, BatchImage]) -> None:
+        """Start import tasks for queued images while there are free slots."""
+        while waiting and len(running) < self.max_concurrent_imports and time.monotonic() >= self._quota_retry_at:
+            image = waiting[0]
+            # Per-image license options replace the command line ones, since the two are mutually exclusive
+            if image.license_type or image.usage_operation:
+                license_type, usage_operation = image.license_type, image.usage_operation
+            else:
+                license_type, usage_operation = self.vmie.license_type, self.vmie.usage_operation
+            # Only staged images are queued, so both are set
+            assert image.import_source is not None and image.filename is not None
+            try:
+                containers, description = self.vmie.get_import_request(image.import_source, image.filename)
+                task_id = self.aws_client.start_import_task(containers, description, license_type, usage_operation)
+            except ClientError as e:
+                if e.response["Error"]["Code"] == "ResourceCountLimitExceeded":
+                    log_message(
+                        LogLevel.WARN,
+                        f"Import task quota reached with {len(running)} task(s) of this batch running, "
+                        f"retrying in {TASK_POLL_MAX_SECONDS}s",
+                    )
+                    self._quota_retry_at = time.monotonic() + TASK_POLL_MAX_SECONDS
+                    return
+                waiting.popleft()
+                image.fail(str(e))
+                continue
+            except (Exception, SystemExit) as e:
+                waiting.popleft()
+                image.fail(f"exit code {e.code}" if isinstance(e, SystemExit) else str(e))
+                continue
+
+            waiting.popleft()
+            image.task_id = task_id
+            image.start_phase(BatchImage.IMPORT)
+            running[task_id] = image
+            self.monitor.track(task_id)
+
+    def _poll_imports(self, running: Dict[str, BatchImage], waiting_count: int) -> None:
+        """Check all running import tasks with a single describe call and retire the finished ones."""
+        try:
+            tasks = self.monitor.poll()
+        except (BotoCoreError, ClientError) as e:
+            log_message(LogLevel.WARN, f"Failed to check import task status, retrying: {e}")
+            return
+
+        for task_id, image in list(running.items()):
+            task = tasks[task_id]
+            if task.completed:
+                image.ami_id = task.result
+                image.end_phase()
+                log_message(LogLevel.SUCCESS, f"Image {image.number} imported: {image.ami_id}")
+            elif task.failed:
+                image.fail(f"task {task_id} {task.status}: {task.status_message or 'no details'}")
+            elif image.elapsed > IMPORT_TIMEOUT_MINUTES * 60:
+                image.fail(f"task {task_id} did not finish within {IMPORT_TIMEOUT_MINUTES} minutes")
+            else:
+                continue
+            del running[task_id]
+            self.monitor.untrack(task_id)
+
+        for task_id, image in running.items():
+            task = tasks[task_id]
+            # Logged on changes only, as tasks near completion are checked every few seconds
+            report = (task.status, task.status_message, task.progress)
+            if report != image.last_report:
+                image.last_report = report
+                log_message(LogLevel.INFO, f"Image {image.number} import {task_id}: {task.describe()}")
+        if waiting_count:
+            log_message(LogLevel.INFO, f"{waiting_count} image(s) waiting for an import slot")
+
+    @staticmethod
+    def display_results(batch: List[BatchImage]) -> None:
+        """Display the outcome and phase timings of every image."""
+        log_section("Batch Import Summary", section_level=1)
+
+        def format_seconds(seconds: Optional[float]) -> str:
+            if seconds is None:
+                return "-"
+            minutes, seconds = divmod(int(seconds), 60)
+            return f"{minutes}m {seconds:02d}s"
+
+        rows = [
+            [
+                str(image.number),
+                image.filename or image.source,
+                format_seconds(image.timings.get(BatchImage.PREPARE)),
+                format_seconds(image.timings.get(BatchImage.QUEUE)),
+                format_seconds(image.timings.get(BatchImage.IMPORT)),
+                format_seconds(sum(image.timings.values())),
+                image.ami_id or f"[red]{image.error}[/red]",
+            ]
+            for image in batch
+        ]
+        display_table(
+            "Batch Import Results", ["#", "Image", "Prepare", "Queued", "Import", "Total", "AMI / Error"], rows
+        )
+
+        failed = sum(1 for image in batch if not image.ami_id)
+        if failed:
+            log_message(LogLevel.WARN, f"{len(batch) - failed} of {len(batch)} image(s) imported, {failed} failed")
+        else:
+            log_message(LogLevel.SUCCESS, f"All {len(batch)} image(s) imported")
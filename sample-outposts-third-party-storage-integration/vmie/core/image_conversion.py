@@ -0,0 +1,438 @@
+"""Conversion of disk images into stream-optimized VMDK, reading and writing only their data."""
+
+import errno
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from vmie.common import CONVERT_READ_SIZE, VMDK_COMPRESSION_LEVEL, VMDK_GRAIN_SIZE, LogLevel
+from vmie.utils import format_bytes, is_convertible_image, log_message
+
+SECTOR_SIZE = 512
+
+# qcow2 header fields up to nb_snapshots/snapshots_offset, and the version 3 additions that follow them
+_QCOW2_MAGIC = b"QFI\xfb"
+_QCOW2_HEADER = struct.Struct(">4sIQIIQIIQQIIQ")
+_QCOW2_V3_HEADER = struct.Struct(">QQQII")
+_QCOW2_OFFSET_MASK = 0x00FFFFFFFFFFFE00
+_QCOW2_COMPRESSED = 1 << 62
+_QCOW2_ZERO = 1
+# Incompatible feature bits: dirty (refcounts may be stale, which does not affect reading) and corrupt
+_QCOW2_DIRTY = 1 << 0
+_QCOW2_CORRUPT = 1 << 1
+_QCOW2_FEATURE_NAMES = {2: "external data file", 3: "non-zlib compression", 4: "extended L2 entries"}
+
+# Stream-optimized sparse extent header, markers and flags (VMware Virtual Disk Format 1.1)
+_VMDK_MAGIC = 0x564D444B
+_VMDK_HEADER = struct.Struct("<IIIQQQQIQQQB4sH433x")
+_VMDK_GRAIN_MARKER = struct.Struct("<QI")
+_VMDK_METADATA_MARKER = struct.Struct("<QII")
+_VMDK_FLAGS = 0x1 | 0x10000 | 0x20000  # newline detection, compressed grains, markers
+_VMDK_GD_AT_END = 0xFFFFFFFFFFFFFFFF
+_VMDK_GT_ENTRIES = 512
+_MARKER_EOS, _MARKER_GT, _MARKER_GD, _MARKER_FOOTER = 0, 1, 2, 3
+
+
+class Qcow2Image:
+    """
+    Reads the guest data of a qcow2 image, skipping clusters that are unallocated or marked as zeros.
+
+    Version 2 and 3 images are supported, with zlib-compressed clusters. Images with a backing file,
+    encryption, an external data file, extended L2 entries or zstd compression are rejected on open.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Open an image and validate its header.
+
+        :param path: Path of the qcow2 image
+        :raises ValueError: If the file is not a qcow2 image or uses a feature that is not supported
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._read_header()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __enter__(self) -> "Qcow2Image":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @staticmethod
+    def is_qcow2(path: Path) -> bool:
+        """Check whether a file starts with the qcow2 magic, e.g. a cloud image named .img."""
+        try:
+            with open(path, "rb") as f:
+                return f.read(len(_QCOW2_MAGIC)) == _QCOW2_MAGIC
+        except OSError:
+            return False
+
+    def _read_header(self) -> None:
+        header = self._read_at(0, _QCOW2_HEADER.size)
+        (
+            magic,
+            version,
+            backing_file_offset,
+            _backing_file_size,
+            cluster_bits,
+            self.virtual_size,
+            crypt_method,
+            l1_size,
+            l1_table_offset,
+            *_,
+        ) = _QCOW2_HEADER.unpack(header)
+
+        if magic != _QCOW2_MAGIC:
+            raise ValueError(f"{self.path.name} is not a qcow2 image")
+        if version not in [2, 3]:
+            raise ValueError(f"Unsupported qcow2 version {version}")
+        if backing_file_offset:
+            raise ValueError(
+                "qcow2 images with a backing file are not supported; commit the overlay into its base first"
+            )
+        if crypt_method:
+            raise ValueError("Encrypted qcow2 images are not supported")
+        if not 9 <= cluster_bits <= 21:
+            raise ValueError(f"Invalid qcow2 cluster size: 2^{cluster_bits} bytes")
+
+        if version == 3:
+            incompatible_features = _QCOW2_V3_HEADER.unpack(self._read_at(_QCOW2_HEADER.size, _QCOW2_V3_HEADER.size))[0]
+            if incompatible_features & _QCOW2_CORRUPT:
+                raise ValueError("The qcow2 image is marked corrupt; repair it before importing")
+            unsupported = incompatible_features & ~(_QCOW2_DIRTY | _QCOW2_CORRUPT)
+            if unsupported:
+                features = [_QCOW2_FEATURE_NAMES.get(bit, f"bit {bit}") for bit in range(64) if unsupported >> bit & 1]
+                raise ValueError(f"Unsupported qcow2 features: {', '.join(features)}")
+
+        self.cluster_size = 1 << cluster_bits
+        self._l2_entries = self.cluster_size // 8
+        if l1_size * self._l2_entries * self.cluster_size < self.virtual_size:
+            raise ValueError("Invalid qcow2 image: the L1 table does not cover the virtual size")
+        self._l1_table = struct.unpack(f">{l1_size}Q", self._read_at(l1_table_offset, l1_size * 8))
+        # Compressed cluster descriptors: host offset in bits 0 to x-1, additional sectors in bits x to 61
+        self._compressed_offset_bits = 62 - (cluster_bits - 8)
+
+    def iter_data(self) -> Iterator[Tuple[int, bytes]]:
+        """
+        Yield (guest offset, data) for the allocated clusters, in guest order.
+
+        Clusters that are contiguous in both the guest and the file are read together, up to
+        CONVERT_READ_SIZE at a time, so a mostly sequential image is read in large requests.
+        """
+        max_run = max(CONVERT_READ_SIZE // self.cluster_size, 1)
+        run_guest = run_host = run_clusters = 0
+
+        for l1_index, l1_entry in enumerate(self._l1_table):
+            l2_offset = l1_entry & _QCOW2_OFFSET_MASK
+            if not l2_offset:
+                continue
+            l2_table = struct.unpack(f">{self._l2_entries}Q", self._read_at(l2_offset, self.cluster_size))
+
+            for l2_index, entry in enumerate(l2_table):
+                guest_offset = (l1_index * self._l2_entries + l2_index) * self.cluster_size
+                if guest_offset >= self.virtual_size:
+                    break
+                host_offset = entry & _QCOW2_OFFSET_MASK
+                contiguous = (
+                    run_clusters < max_run
+                    and guest_offset == run_guest + run_clusters * self.cluster_size
+                    and host_offset == run_host + run_clusters * self.cluster_size
+                )
+                if run_clusters and (entry & _QCOW2_COMPRESSED or not contiguous):
+                    yield run_guest, self._read_guest(run_guest, run_host, run_clusters * self.cluster_size)
+                    run_clusters = 0
+
+                if entry & _QCOW2_COMPRESSED:
+                    yield guest_offset, self._read_compressed_cluster(entry)
+                elif entry & _QCOW2_ZERO or not host_offset:
+                    # Zero or unallocated cluster; without a backing file both read as zeros
+                    continue
+                elif run_clusters:
+                    run_clusters += 1
+                else:
+                    run_guest, run_host, run_clusters = guest_offset, host_offset, 1
+
+        if run_clusters:
+            yield run_guest, self._read_guest(run_guest, run_host, run_clusters * self.cluster_size)
+
+    def _read_guest(self, guest_offset: int, host_offset: int, size: int) -> bytes:
+        # The last cluster may extend past the virtual size
+        return self._read_at(host_offset, min(size, self.virtual_size - guest_offset))
+
+    def _read_compressed_cluster(self, entry: int) -> bytes:
+        offset_bits = self._compressed_offset_bits
+        host_offset = entry & ((1 << offset_bits) - 1)
+        sectors = (entry >> offset_bits & ((1 << (62 - offset_bits)) - 1)) + 1
+        # The sector count is an upper bound that may reach past the end of the file
+        self._file.seek(host_offset)
+        compressed = self._file.read(sectors * SECTOR_SIZE - host_offset % SECTOR_SIZE)
+        cluster = zlib.decompressobj(-15).decompress(compressed, self.cluster_size)
+        if len(cluster) != self.cluster_size:
+            raise ValueError(f"Truncated compressed qcow2 cluster at offset {host_offset}")
+        return cluster
+
+    def _read_at(self, offset: int, size: int) -> bytes:
+        self._file.seek(offset)
+        data = self._file.read(size)
+        if len(data) != size:
+            raise ValueError(
+                f"Unexpected end of {self.path.name} at offset {offset + len(data)}; is the image truncated?"
+            )
+        return data
+
+
+class RawImage:
+    """
+    Reads the data regions of a raw image, skipping the holes of a sparse file.
+
+    Holes are found with SEEK_DATA/SEEK_HOLE where the platform and file system support them. Elsewhere,
+    and within data regions, runs of zeros are left to the VMDK writer, which drops all-zero grains.
+    """
+
+    def __init__(self, path: Path):
+        """Open a raw image; its virtual size is the file size."""
+        self.path = path
+        self._file = open(path, "rb")
+        self.virtual_size = os.fstat(self._file.fileno()).st_size
+
+    def __enter__(self) -> "RawImage":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def iter_data(self) -> Iterator[Tuple[int, bytes]]:
+        """Yield (offset, data) for the data regions of the file, in order, CONVERT_READ_SIZE at a time."""
+        for start, end in self._iter_data_regions():
+            self._file.seek(start)
+            for offset in range(start, end, CONVERT_READ_SIZE):
+                data = self._file.read(min(CONVERT_READ_SIZE, end - offset))
+                if not data:
+                    raise ValueError(f"{self.path.name} was truncated during conversion")
+                yield offset, data
+
+    def _iter_data_regions(self) -> Iterator[Tuple[int, int]]:
+        """Yield the (start, end) offsets of the file's data regions, or of the whole file if holes are not reported."""
+        if not hasattr(os, "SEEK_DATA"):
+            log_message(LogLevel.DEBUG, "Sparse files are not detectable on this platform, scanning for zero blocks")
+            yield 0, self.virtual_size
+            return
+
+        fd = self._file.fileno()
+        offset = 0
+        while offset < self.virtual_size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    return  # only a hole remains
+                # The file system does not support SEEK_DATA; file systems that ignore holes report one data region
+                log_message(
+                    LogLevel.DEBUG, f"SEEK_DATA is not supported for {self.path.name} ({e}), scanning for zero blocks"
+                )
+                yield offset, self.virtual_size
+                return
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), self.virtual_size)
+            yield start, end
+            offset = end
+
+
+class StreamOptimizedVmdkWriter:
+    """
+    Produces a stream-optimized VMDK from the data extents of a disk, as a stream of byte chunks.
+
+    The output is written front to back in one pass, so it can go straight into a streaming upload:
+    each grain that holds data is deflate-compressed and written with a grain marker, and the grain
+    tables, grain directory and footer follow the last grain. Grains that are not in the extents, or
+    that contain only zeros, are left out entirely. Grains are compressed on a thread pool, as zlib
+    releases the GIL, and written in order.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        name: str,
+        compression_level: int = VMDK_COMPRESSION_LEVEL,
+        workers: Optional[int] = None,
+    ):
+        """
+        Initialize the writer.
+
+        :param capacity: Virtual disk size in bytes
+        :param name: File name of the VMDK, recorded in its descriptor
+        :param compression_level: zlib compression level of the grains
+        :param workers: Number of grains compressed at the same time; defaults to the CPU count
+        """
+        self.capacity_sectors = -(-capacity // SECTOR_SIZE)
+        self.name = name
+        self.compression_level = compression_level
+        self.workers = workers or os.cpu_count() or 1
+        self.grain_sectors = VMDK_GRAIN_SIZE // SECTOR_SIZE
+        self.data_grains = 0
+        self.zero_grains = 0
+        self.bytes_written = 0
+        self._grain_tables: Dict[int, List[int]] = {}
+        self._zero_grain = bytes(VMDK_GRAIN_SIZE)
+
+    def iter_chunks(self, extents: Iterable[Tuple[int, bytes]]) -> Iterator[bytes]:
+        """
+        Yield the VMDK file in chunks.
+
+        :param extents: (offset, data) pairs of the disk's data, in increasing offset order and not overlapping
+        """
+        descriptor = self._get_descriptor()
+        descriptor_sectors = -(-len(descriptor) // SECTOR_SIZE)
+        # Grains start on a grain boundary, after the header and descriptor
+        overhead = -(-(1 + descriptor_sectors) // self.grain_sectors) * self.grain_sectors
+        header = self._get_header(descriptor_sectors, _VMDK_GD_AT_END, overhead)
+        yield self._write(header + descriptor.ljust((overhead - 1) * SECTOR_SIZE, b"\0"))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending: Deque[Tuple[int, Future]] = deque()
+            for grain_index, grain in self._iter_grains(extents):
+                if grain == self._zero_grain:
+                    self.zero_grains += 1
+                    continue
+                pending.append((grain_index, executor.submit(zlib.compress, grain, self.compression_level)))
+                # Keeps every worker busy while bounding the grains held in memory
+                if len(pending) > self.workers * 2:
+                    yield self._write_grain(*pending.popleft())
+            while pending:
+                yield self._write_grain(*pending.popleft())
+
+        yield from self._iter_metadata(descriptor_sectors, overhead)
+        log_message(
+            LogLevel.INFO,
+            f"Converted {format_bytes(self.capacity_sectors * SECTOR_SIZE)} disk to stream-optimized VMDK: "
+            f"{format_bytes(self.data_grains * VMDK_GRAIN_SIZE)} of data in {format_bytes(self.bytes_written)}, "
+            f"{self.zero_grains} zero grain(s) skipped",
+        )
+
+    def _iter_grains(self, extents: Iterable[Tuple[int, bytes]]) -> Iterator[Tuple[int, bytes]]:
+        """Cut extents into whole grains, zero-filling the parts of a grain the extents do not cover."""
+        partial_index, partial = -1, None
+        for offset, data in extents:
+            position = 0
+            while position < len(data):
+                grain_index, within = divmod(offset + position, VMDK_GRAIN_SIZE)
+                length = min(VMDK_GRAIN_SIZE - within, len(data) - position)
+                if partial is not None and partial_index != grain_index:
+                    yield partial_index, bytes(partial)
+                    partial = None
+                if length == VMDK_GRAIN_SIZE:
+                    yield grain_index, data[position : position + length]
+                else:
+                    if partial is None:
+                        partial_index, partial = grain_index, bytearray(VMDK_GRAIN_SIZE)
+                    partial[within : within + length] = data[position : position + length]
+                position += length
+        if partial is not None:
+            yield partial_index, bytes(partial)
+
+    def _write_grain(self, grain_index: int, compressed: "Future[bytes]") -> bytes:
+        data = compressed.result()
+        self.data_grains += 1
+        table = self._grain_tables.setdefault(grain_index // _VMDK_GT_ENTRIES, [0] * _VMDK_GT_ENTRIES)
+        table[grain_index % _VMDK_GT_ENTRIES] = self._next_sector()
+        return self._write(_VMDK_GRAIN_MARKER.pack(grain_index * self.grain_sectors, len(data)) + data)
+
+    def _iter_metadata(self, descriptor_sectors: int, overhead: int) -> Iterator[bytes]:
+        """Yield the grain tables, grain directory, footer and end-of-stream marker."""
+        total_grains = -(-self.capacity_sectors // self.grain_sectors)
+        directory = [0] * -(-total_grains // _VMDK_GT_ENTRIES)
+        # Grain tables without any grain are left out, with a zero grain directory entry
+        for table_index in sorted(self._grain_tables):
+            table = struct.pack(f"<{_VMDK_GT_ENTRIES}I", *self._grain_tables[table_index])
+            yield self._write_metadata(_MARKER_GT, table)
+            directory[table_index] = self._next_sector() - len(table) // SECTOR_SIZE
+        self._grain_tables.clear()
+
+        directory_data = struct.pack(f"<{len(directory)}I", *directory)
+        yield self._write_metadata(_MARKER_GD, directory_data)
+        directory_sector = self._next_sector() - -(-len(directory_data) // SECTOR_SIZE)
+        yield self._write_metadata(_MARKER_FOOTER, self._get_header(descriptor_sectors, directory_sector, overhead))
+        yield self._write(bytes(SECTOR_SIZE))  # end-of-stream marker
+
+    def _write_metadata(self, marker_type: int, data: bytes) -> bytes:
+        sectors = -(-len(data) // SECTOR_SIZE)
+        marker = _VMDK_METADATA_MARKER.pack(sectors, 0, marker_type).ljust(SECTOR_SIZE, b"\0")
+        return self._write(marker + data)
+
+    def _write(self, data: bytes) -> bytes:
+        # Everything in the stream is padded to whole sectors
+        data = data.ljust(-(-len(data) // SECTOR_SIZE) * SECTOR_SIZE, b"\0")
+        self.bytes_written += len(data)
+        if self.bytes_written // SECTOR_SIZE > 0xFFFFFFFF:
+            raise ValueError("Stream-optimized VMDK exceeds the 2 TiB limit of its grain table offsets")
+        return data
+
+    def _next_sector(self) -> int:
+        return self.bytes_written // SECTOR_SIZE
+
+    def _get_header(self, descriptor_sectors: int, directory_sector: int, overhead: int) -> bytes:
+        return _VMDK_HEADER.pack(
+            _VMDK_MAGIC,
+            3,  # version of stream-optimized extents
+            _VMDK_FLAGS,
+            self.capacity_sectors,
+            self.grain_sectors,
+            1,  # descriptor offset, in sectors
+            descriptor_sectors,
+            _VMDK_GT_ENTRIES,
+            0,  # no redundant grain directory
+            directory_sector,
+            overhead,
+            0,  # clean shutdown
+            b"\n \r\n",
+            1,  # deflate compression
+        )
+
+    def _get_descriptor(self) -> bytes:
+        # Content-derived identifier, so converting the same image twice yields identical files
+        cid = zlib.crc32(f"{self.name}:{self.capacity_sectors}".encode())
+        cylinders = min(self.capacity_sectors // (16 * 63), 16383)
+        return (
+            "# Disk DescriptorFile\n"
+            "version=1\n"
+            f"CID={cid:08x}\n"
+            "parentCID=ffffffff\n"
+            'createType="streamOptimized"\n'
+            "\n"
+            "# Extent description\n"
+            f'RW {self.capacity_sectors} SPARSE "{self.name}"\n'
+            "\n"
+            "# The Disk Data Base\n"
+            "#DDB\n"
+            "\n"
+            'ddb.virtualHWVersion = "4"\n'
+            f'ddb.geometry.cylinders = "{cylinders}"\n'
+            'ddb.geometry.heads = "16"\n'
+            'ddb.geometry.sectors = "63"\n'
+            'ddb.adapterType = "ide"\n'
+        ).encode()
+
+
+def open_convertible_image(path: Path) -> Union[Qcow2Image, RawImage]:
+    """
+    Open an image for conversion to a stream-optimized VMDK.
+
+    :param path: Path of an uncompressed qcow2 image, by extension or content, or else of a raw image
+    :raises ValueError: If the image cannot be converted
+    """
+    if is_convertible_image(path.name) or Qcow2Image.is_qcow2(path):
+        return Qcow2Image(path)
+    return RawImage(path)
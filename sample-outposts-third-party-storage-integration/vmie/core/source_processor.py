@@ -1,19 +1,36 @@
 """Image source processor for VM Import/Export operations."""
 
+import hashlib
+import shutil
 from pathlib import Path
+from typing import Iterator, Optional, Tuple
 
 import requests  # type: ignore
-from rich.progress import BarColumn, DownloadColumn, Progress, TextColumn, TimeRemainingColumn, TransferSpeedColumn
 from rich.rule import Rule
 
-from vmie.common import ERR_FILE_DOWNLOAD_FAILED, ERR_FILE_PROCESS_FAILED, LogLevel
+from vmie.aws import DigestIndex
+from vmie.common import (
+    DEFAULT_DOWNLOAD_CONNECTIONS,
+    DOWNLOAD_DIR,
+    ERR_FILE_CONVERT_FAILED,
+    ERR_FILE_DOWNLOAD_FAILED,
+    ERR_FILE_PROCESS_FAILED,
+    SUPPORTED_FORMATS,
+    ImageFormat,
+    LogLevel,
+)
+from vmie.core.image_conversion import Qcow2Image, StreamOptimizedVmdkWriter, open_convertible_image
+from vmie.core.ranged_download import RangedDownloader
 from vmie.utils import (
     decompress_file,
     error_and_exit,
     extract_filename_from_url,
     format_file_size,
+    get_converted_filename,
+    get_decompressed_filename,
     get_decompressed_path,
     is_compressed_file,
+    is_convertible_image,
     log_message,
 )
 
@@ -21,50 +38,40 @@ from vmie.utils import (
 class SourceProcessor:
     """Processes VM images from various sources."""
 
-    def __init__(self):
-        """Initialize source processor."""
+    def __init__(self, download_connections: int = DEFAULT_DOWNLOAD_CONNECTIONS, convert_raw: bool = False):
+        """
+        Initialize source processor.
+
+        :param download_connections: Parallel ranged connections for URL downloads
+        :param convert_raw: Convert local raw images to stream-optimized VMDK, leaving out their holes and zero blocks
+        """
+        self.downloader = RangedDownloader(download_connections)
+        self.convert_raw = convert_raw
 
     def download_from_url(self, url: str, output_dir: Path) -> Path:
-        """Download image from HTTP/HTTPS URL."""
+        """
+        Download image from HTTP/HTTPS URL, decompressing it into output_dir if needed.
+
+        Downloads go to a per-URL directory under DOWNLOAD_DIR so an interrupted download resumes on the
+        next run; call remove_download once the returned file is no longer needed.
+        """
         try:
             filename = extract_filename_from_url(url)
-            output_path = output_dir / filename
+            output_path = self.get_download_path(url)
 
             log_message(LogLevel.INFO, f"Downloading image: {filename}")
             log_message(LogLevel.INFO, f"Source URL: {url}")
 
-            # Start download with progress bar
-            # Timeout: (30s connection, 300s read) - configurable based on image size and network conditions
-            with requests.get(url, stream=True, timeout=(30, 300)) as response:
-                response.raise_for_status()
-
-                total_size = int(response.headers.get("content-length", 0))
-
-                with Progress(
-                    TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
-                    BarColumn(bar_width=None),
-                    "[progress.percentage]{task.percentage:>3.1f}%",
-                    "•",
-                    DownloadColumn(),
-                    "•",
-                    TransferSpeedColumn(),
-                    "•",
-                    TimeRemainingColumn(),
-                ) as progress:
-                    task = progress.add_task("download", filename=filename, total=total_size)
-
-                    with open(output_path, "wb") as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                                progress.update(task, advance=len(chunk))
+            self.downloader.download(url, output_path)
 
             log_message(LogLevel.SUCCESS, f"Download completed successfully: {output_path}")
 
             # Handle compressed files
             if is_compressed_file(filename):
-                decompressed_path = get_decompressed_path(output_path, output_path.parent)
-                return decompress_file(output_path, decompressed_path)
+                decompressed_path = get_decompressed_path(output_path, output_dir)
+                decompress_file(output_path, decompressed_path)
+                self.remove_download(output_path)
+                return decompressed_path
 
             return output_path
 
@@ -83,6 +90,67 @@ class SourceProcessor:
                 code=ERR_FILE_DOWNLOAD_FAILED,
             )
 
+    @staticmethod
+    def get_download_path(url: str) -> Path:
+        """Return the resumable download location of a URL."""
+        url_hash = hashlib.sha256(url.encode()).hexdigest()[:32]
+        return DOWNLOAD_DIR / url_hash / extract_filename_from_url(url)
+
+    @staticmethod
+    def remove_download(path: Path) -> None:
+        """Delete a finished download and its resume map; paths outside DOWNLOAD_DIR are left alone."""
+        if DOWNLOAD_DIR in path.parents:
+            shutil.rmtree(path.parent, ignore_errors=True)
+
+    def get_url_source_id(self, url: str) -> Optional[str]:
+        """Return the digest index id of a URL source, or None if it cannot be identified without downloading it."""
+        try:
+            validator = self.downloader.probe(url)[2]
+        except requests.RequestException as e:
+            # The download or stream that follows reports the error properly
+            log_message(LogLevel.DEBUG, f"Failed to probe {url}: {e}")
+            return None
+        return DigestIndex.get_url_source_id(url, validator)
+
+    def open_url_stream(self, url: str) -> Tuple[requests.Response, Optional[int]]:
+        """
+        Open a streaming HTTP/HTTPS response for an image without downloading it.
+
+        Returns the response, which the caller must close, and the image size if the server reported it.
+        """
+        try:
+            log_message(LogLevel.INFO, f"Streaming image: {extract_filename_from_url(url)}")
+            log_message(LogLevel.INFO, f"Source URL: {url}")
+
+            response = self._request_url(url)
+            total_size: Optional[int] = int(response.headers.get("content-length", 0)) or None
+            # With a content encoding the reported length is that of the encoded body, not of the image
+            if response.headers.get("content-encoding", "identity") != "identity":
+                total_size = None
+            if total_size:
+                log_message(LogLevel.INFO, f"Image size: {format_file_size(total_size)}")
+            return response, total_size
+
+        except requests.RequestException as e:
+            error_and_exit(
+                f"Failed to open URL: {url}",
+                f"Network error: {e}",
+                "Please check the URL and your internet connection",
+                code=ERR_FILE_DOWNLOAD_FAILED,
+            )
+
+    @staticmethod
+    def _request_url(url: str) -> requests.Response:
+        """Send a streaming GET request and raise for HTTP errors."""
+        # Timeout: (30s connection, 300s read) - configurable based on image size and network conditions
+        response = requests.get(url, stream=True, timeout=(30, 300))
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
     def process_local_file(self, local_path: str, temp_dir: Path) -> Path:
         """Process local file efficiently - decompress only if needed."""
         try:
@@ -111,3 +179,66 @@ class SourceProcessor:
                 str(e),
                 code=ERR_FILE_PROCESS_FAILED,
             )
+
+    def needs_conversion(self, image_path: Path) -> bool:
+        """
+        Check if a local image is converted to VMDK before upload.
+
+        qcow2 images are always converted, identified by extension or, for uncompressed files, by content;
+        raw images are converted when convert_raw is set.
+        """
+        filename = get_decompressed_filename(image_path.name)
+        if is_convertible_image(filename):
+            return True
+        # Cloud and appliance images are often qcow2 files named .img
+        if not is_compressed_file(image_path.name) and Qcow2Image.is_qcow2(image_path):
+            return True
+        return self.convert_raw and filename.lower().endswith(tuple(SUPPORTED_FORMATS[ImageFormat.RAW.value]))
+
+    def iter_converted_image(self, image_path: Path) -> Iterator[bytes]:
+        """
+        Open an uncompressed image for conversion and return its stream-optimized VMDK, in chunks.
+
+        The image is validated before this returns, so unsupported images fail before an upload starts.
+        """
+        try:
+            image = open_convertible_image(image_path)
+        except (OSError, ValueError) as e:
+            error_and_exit(
+                f"Failed to convert image: {image_path.name}",
+                Rule(),
+                str(e),
+                code=ERR_FILE_CONVERT_FAILED,
+            )
+
+        log_message(
+            LogLevel.INFO,
+            f"Converting {image_path.name} ({format_file_size(image.virtual_size)} virtual disk) "
+            "to stream-optimized VMDK, skipping unallocated data",
+        )
+        writer = StreamOptimizedVmdkWriter(image.virtual_size, get_converted_filename(image_path.name))
+
+        def iter_chunks() -> Iterator[bytes]:
+            with image:
+                yield from writer.iter_chunks(image.iter_data())
+
+        return iter_chunks()
+
+    def convert_image(self, image_path: Path, output_dir: Path) -> Path:
+        """Convert an uncompressed image to a stream-optimized VMDK file in output_dir."""
+        output_path = output_dir / get_converted_filename(image_path.name)
+        chunks = self.iter_converted_image(image_path)
+        try:
+            with open(output_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except (OSError, ValueError) as e:
+            output_path.unlink(missing_ok=True)
+            error_and_exit(
+                f"Failed to convert image: {image_path.name}",
+                Rule(),
+                str(e),
+                code=ERR_FILE_CONVERT_FAILED,
+            )
+        log_message(LogLevel.SUCCESS, f"Conversion completed successfully: {output_path}")
+        return output_path
@@ -2,15 +2,18 @@
 
 import time
 from pathlib import Path
-from typing import Dict, Optional, cast
+from typing import Dict, List, Optional, Tuple, cast
 
 from rich.rule import Rule
 
 from vmie import AWSClient
+from vmie.aws import DigestIndex, UploadSettings
 from vmie.common import (
+    DEFAULT_DOWNLOAD_CONNECTIONS,
     DEFAULT_INSTANCE_PROFILE,
     ERR_GENERAL_OPERATION_FAILED,
     INSTANCE_TYPE,
+    STREAM_CHUNK_SIZE,
     ImageSourceType,
     LogLevel,
     OperationMode,
@@ -22,11 +25,18 @@ from vmie.utils import (
     detect_image_format,
     display_summary,
     error_and_exit,
+    extract_filename_from_url,
     format_bytes,
+    get_converted_filename,
+    get_decompressed_filename,
     get_file_size,
     get_image_source_type,
     get_s3_info_from_url,
+    is_compressed_file,
+    is_convertible_image,
+    iter_decompressed_chunks,
     load_disk_containers_from_json,
+    log_decompression_benchmark,
     log_message,
     log_section,
 )
@@ -47,6 +57,10 @@ class VMIECore:
         export_prefix: Optional[str] = None,
         license_type: Optional[str] = None,
         usage_operation: Optional[str] = None,
+        upload_settings: Optional[UploadSettings] = None,
+        stage_to_disk: bool = False,
+        download_connections: int = DEFAULT_DOWNLOAD_CONNECTIONS,
+        convert_raw: bool = False,
     ):
         """Initialize VMIE core."""
         self.region = region
@@ -60,10 +74,12 @@ class VMIECore:
         self.export_prefix = export_prefix
         self.license_type = license_type
         self.usage_operation = usage_operation
+        self.upload_settings = upload_settings or UploadSettings()
+        self.stage_to_disk = stage_to_disk
 
         # Initialize components
         self.aws_client = AWSClient(region)
-        self.source_processor = SourceProcessor()
+        self.source_processor = SourceProcessor(download_connections, convert_raw)
         self.sanbootable_installer = SanbootableInstaller(
             self.aws_client,
         )
@@ -182,29 +198,171 @@ class VMIECore:
         # Setup VM import
         self._setup_vm_import()
 
+        import_source, filename = self.stage_image(image_source)
+        return self._import_image(import_source, filename)
+
+    def stage_image(self, image_source: str) -> Tuple[str, str]:
+        """
+        Make an image source available to ImportImage, uploading it to S3 if it is not there already.
+
+        :param image_source: URL, S3 URL, local file path or JSON file with disk containers
+        :return: Import source (S3 URL or JSON file) and image file name
+        """
         # Handle different source types
         source_type = get_image_source_type(image_source)
 
         if source_type == ImageSourceType.JSON:
             # JSON source - load disk containers and import directly
-            filename = Path(image_source).resolve().name
-            ami_id = self._import_image(image_source, filename)
+            return image_source, Path(image_source).resolve().name
         elif source_type == ImageSourceType.S3:
             # S3 source - validate bucket and import directly
             s3_key, filename = get_s3_info_from_url(image_source)
-            ami_id = self._import_image(image_source, filename)
+            return image_source, filename
         elif source_type == ImageSourceType.URL:
-            # URL source - download, optionally decompress, then upload
-            image_path = self._download_from_url(image_source)
-            s3_url = self._upload_to_s3(image_path)
-            ami_id = self._import_image(s3_url, image_path.name)
+            return self._upload_url_source(image_source)
         else:  # ImageSourceType.LOCAL
-            # Local source - optionally decompress, then upload
-            image_path = self._process_local_file(image_source)
-            s3_url = self._upload_to_s3(image_path)
-            ami_id = self._import_image(s3_url, image_path.name)
+            return self._upload_local_source(image_source)
+
+    def _upload_url_source(self, url: str) -> Tuple[str, str]:
+        """Upload image from HTTP/HTTPS URL to S3, unless identical content was uploaded before."""
+        filename = get_decompressed_filename(extract_filename_from_url(url))
+        convert = is_convertible_image(filename)
+        if convert:
+            filename = get_converted_filename(filename)
+        source_id = self.source_processor.get_url_source_id(url)
+        s3_url = self._find_uploaded_copy(source_id, filename)
+        if s3_url:
+            return s3_url, filename
+
+        if not self.stage_to_disk and not convert:
+            # Stream the response body, decompressing it if needed, straight into S3
+            return self._stream_url_to_s3(url, source_id)
+
+        # Download, optionally decompress, then upload; images to convert need random access, so are always downloaded
+        image_path = self._download_from_url(url)
+        if convert:
+            # Uploaded under the converted name; the downloaded file keeps its original format extension
+            s3_url = self._upload_converted_image(image_path, source_id)
+        else:
+            s3_url = self._upload_to_s3(image_path, source_id)
+            filename = image_path.name
+        # Kept until now so a failed upload can be retried without downloading again
+        self.source_processor.remove_download(image_path)
+        self._remove_staged_copy(image_path)
+        return s3_url, filename
+
+    def _upload_local_source(self, local_path: str) -> Tuple[str, str]:
+        """Upload local image to S3, unless identical content was uploaded before."""
+        source_path = Path(local_path).resolve()
+        filename = get_decompressed_filename(source_path.name)
+        convert = self.source_processor.needs_conversion(source_path)
+        if convert:
+            filename = get_converted_filename(filename)
+        # Identifies the file as given, so a compressed image is matched without decompressing it again
+        source_id = DigestIndex.get_file_source_id(source_path) if source_path.is_file() else None
+        if convert and source_id:
+            # A converted upload holds different content than an upload of the file itself, e.g. without --convert-raw
+            source_id += "|vmdk"
+        s3_url = self._find_uploaded_copy(source_id, filename)
+        if s3_url:
+            return s3_url, filename
+
+        if convert:
+            # Decompressed to the working directory first if needed, as conversion reads the image out of order
+            image_path = self._process_local_file(local_path)
+            s3_url = self._upload_converted_image(image_path, source_id)
+            self._remove_staged_copy(image_path)
+            return s3_url, filename
+
+        if is_compressed_file(local_path) and not self.stage_to_disk:
+            # Compressed local source - decompress straight into S3
+            return self._stream_decompressed_file_to_s3(local_path, source_id)
+
+        # Local source - optionally decompress, then upload
+        image_path = self._process_local_file(local_path)
+        s3_url = self._upload_to_s3(image_path, source_id)
+        self._remove_staged_copy(image_path)
+        return s3_url, image_path.name
+
+    def _remove_staged_copy(self, image_path: Path) -> None:
+        """Delete a decompressed copy from the working directory once uploaded, so batches do not pile them up."""
+        if self.temp_dir in image_path.parents:
+            image_path.unlink(missing_ok=True)
+
+    def _find_uploaded_copy(self, source_id: Optional[str], filename: str) -> Optional[str]:
+        """Return the S3 URL of a previous upload of identical content, copied to this bucket if needed."""
+        if not source_id:
+            return None
+        return self.aws_client.find_uploaded_copy(source_id, self.bucket_name, filename, self.upload_settings)
+
+    def _stream_url_to_s3(self, url: str, source_id: Optional[str] = None) -> Tuple[str, str]:
+        """Stream image from HTTP/HTTPS URL to S3 without staging it on disk."""
+        log_section("URL Streaming Upload Phase", section_level=2)
+
+        filename = extract_filename_from_url(url)
+        response, total_size = self.source_processor.open_url_stream(url)
+        with response:
+            if is_compressed_file(filename):
+                log_message(LogLevel.INFO, "Image is compressed, decompressing while uploading")
+                # Undo any HTTP content encoding before the image's own decompression
+                response.raw.decode_content = True
+                chunks = iter_decompressed_chunks(response.raw, filename)
+                # The decompressed size is only known once the stream ends
+                filename, total_size = get_decompressed_filename(filename), None
+            else:
+                chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+
+            s3_url = self.aws_client.upload_stream_to_s3(
+                chunks, filename, self.bucket_name, filename, total_size, self.upload_settings, source_id
+            )
 
-        return ami_id
+        return s3_url, filename
+
+    def _stream_decompressed_file_to_s3(self, local_path: str, source_id: Optional[str] = None) -> Tuple[str, str]:
+        """Decompress local compressed image straight into S3 without an intermediate file."""
+        log_section("Local File Streaming Decompression Phase", section_level=2)
+
+        source_path = Path(local_path).resolve()
+        filename = get_decompressed_filename(source_path.name)
+        log_message(LogLevel.INFO, f"Processing local file: {source_path.name}")
+        log_message(LogLevel.INFO, f"Source path: {source_path}")
+        log_message(LogLevel.INFO, f"File size: {format_bytes(get_file_size(source_path))}")
+        log_message(LogLevel.INFO, "File is compressed, decompressing while uploading")
+        log_decompression_benchmark(source_path)
+
+        with open(source_path, "rb") as compressed_file:
+            s3_url = self.aws_client.upload_stream_to_s3(
+                iter_decompressed_chunks(compressed_file, source_path.name),
+                filename,
+                self.bucket_name,
+                filename,
+                None,
+                self.upload_settings,
+                source_id,
+            )
+
+        return s3_url, filename
+
+    def _upload_converted_image(self, image_path: Path, source_id: Optional[str] = None) -> str:
+        """Convert an image to a stream-optimized VMDK and upload it, streaming unless staging to disk."""
+        log_section("Image Conversion Phase", section_level=2)
+
+        if self.stage_to_disk:
+            vmdk_path = self.source_processor.convert_image(image_path, self.temp_dir)
+            s3_url = self._upload_to_s3(vmdk_path, source_id)
+            self._remove_staged_copy(vmdk_path)
+            return s3_url
+
+        filename = get_converted_filename(image_path.name)
+        return self.aws_client.upload_stream_to_s3(
+            self.source_processor.iter_converted_image(image_path),
+            filename,
+            self.bucket_name,
+            filename,
+            None,
+            self.upload_settings,
+            source_id,
+        )
 
     def _download_from_url(self, url: str) -> Path:
         """Download image from HTTP/HTTPS URL."""
@@ -216,7 +374,7 @@ class VMIECore:
         log_section("Local File Processing Phase", section_level=2)
         return self.source_processor.process_local_file(local_path, self.temp_dir)
 
-    def _upload_to_s3(self, image_path: Path) -> str:
+    def _upload_to_s3(self, image_path: Path, source_id: Optional[str] = None) -> str:
         """Upload image to S3."""
         log_section("S3 Upload Phase", section_level=2)
 
@@ -227,7 +385,9 @@ class VMIECore:
         )
 
         s3_key = image_path.name
-        s3_url = self.aws_client.upload_to_s3(str(image_path), self.bucket_name, s3_key)
+        s3_url = self.aws_client.upload_to_s3(
+            str(image_path), self.bucket_name, s3_key, self.upload_settings, source_id
+        )
 
         return s3_url
 
@@ -240,22 +400,10 @@ class VMIECore:
         """Import VM image to AMI."""
         log_section("Image Import Phase", section_level=2)
 
-        image_source_type = get_image_source_type(image_source)
-
-        # Create description
-        base_name = Path(filename).stem
-        description = f"{base_name} imported via vmie script"
-
-        if image_source_type == ImageSourceType.JSON:
-            containers = load_disk_containers_from_json(image_source)
-            ami_id = self.aws_client.import_image_from_disk_containers(
-                containers, description, self.license_type, self.usage_operation
-            )
-        else:
-            image_format = detect_image_format(filename)
-            ami_id = self.aws_client.import_image(
-                image_source, description, image_format.value, self.license_type, self.usage_operation
-            )
+        containers, description = self.get_import_request(image_source, filename)
+        ami_id = self.aws_client.import_image_from_disk_containers(
+            containers, description, self.license_type, self.usage_operation
+        )
 
         log_message(
             LogLevel.SUCCESS,
@@ -263,6 +411,19 @@ class VMIECore:
         )
         return ami_id
 
+    @staticmethod
+    def get_import_request(image_source: str, filename: str) -> Tuple[List[Dict], str]:
+        """Return the disk containers and description of the import task for a staged image."""
+        # Create description
+        base_name = Path(filename).stem
+        description = f"{base_name} imported via vmie script"
+
+        if get_image_source_type(image_source) == ImageSourceType.JSON:
+            return load_disk_containers_from_json(image_source), description
+
+        image_format = detect_image_format(filename)
+        return AWSClient.get_s3_disk_containers(image_source, description, image_format.value), description
+
     def _install_sanbootable(self, ami_id: str) -> str:
         """Install sanbootable on AMI."""
         log_section("Sanbootable Installation Phase", section_level=2)
@@ -10,7 +10,15 @@ This package contains utility functions organized into specialized modules:
 - validation_utils: Input validation utilities (AMI IDs, URLs, file paths)
 """
 
-from .decompression_utils import decompress_file, get_decompressed_filename, get_decompressed_path, is_compressed_file
+from .decompression_utils import (
+    decompress_file,
+    get_decompressed_filename,
+    get_decompressed_path,
+    get_decompression_backends,
+    is_compressed_file,
+    iter_decompressed_chunks,
+    log_decompression_benchmark,
+)
 
 # Import from new utils modules
 from .file_utils import (
@@ -19,25 +27,32 @@ from .file_utils import (
     detect_image_format,
     format_bytes,
     format_file_size,
+    get_converted_filename,
     get_file_size,
+    is_convertible_image,
 )
 from .logging_utils import (
     _setup_file_logging,
     display_summary,
+    display_table,
     error_and_exit,
+    is_verbose,
     log_message,
     log_section,
     log_step,
+    setup_logging,
     wait_with_progress,
 )
 from .source_utils import (
     extract_filename_from_url,
     get_image_source_type,
     get_s3_info_from_url,
+    load_batch_manifest,
     load_disk_containers_from_json,
 )
 from .validation_utils import (
     validate_ami_id,
+    validate_batch_manifest,
     validate_image_source,
     validate_json_file,
     validate_license_type,
@@ -53,13 +68,21 @@ __all__ = [
     "get_decompressed_path",
     "get_decompressed_filename",
     "is_compressed_file",
+    "iter_decompressed_chunks",
+    "get_decompression_backends",
+    "log_decompression_benchmark",
     "wait_with_progress",
     "error_and_exit",
     "display_summary",
+    "display_table",
     "log_message",
     "log_section",
     "log_step",
+    "setup_logging",
+    "is_verbose",
     "detect_image_format",
+    "is_convertible_image",
+    "get_converted_filename",
     "get_file_size",
     "format_bytes",
     "format_file_size",
@@ -78,5 +101,7 @@ __all__ = [
     "validate_json_file",
     "validate_license_type",
     "validate_usage_operation",
+    "validate_batch_manifest",
     "load_disk_containers_from_json",
+    "load_batch_manifest",
 ]
@@ -1,21 +1,40 @@
 """Decompression utility functions for VM Import/Export operations."""
 
+import bz2
+import gzip
+import io
 import lzma
+import os
+import re
+import shutil
+import stat
 import subprocess
-import shlex
+import tempfile
+import threading
+import time
+from functools import lru_cache
 from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, cast
 
 from rich.rule import Rule
 
 from vmie.common import (
     COMPRESSED_EXTENSIONS,
+    DECOMPRESS_BENCHMARK_SAMPLE_SIZE,
+    DECOMPRESS_READ_SIZE,
     ERR_FILE_DECOMPRESS_BZ2_FAILED,
     ERR_FILE_DECOMPRESS_FAILED,
     ERR_FILE_DECOMPRESS_GZ_FAILED,
     ERR_FILE_UNSUPPORTED_COMPRESSION,
+    PARALLEL_DECOMPRESSORS,
+    STREAM_CHUNK_SIZE,
     LogLevel,
 )
-from vmie.utils.logging_utils import error_and_exit, log_message
+from vmie.utils.file_utils import format_bytes
+from vmie.utils.logging_utils import error_and_exit, is_verbose, log_message
+
+# Python's built-in decompressors, used when no parallel decompressor is installed
+PYTHON_BACKEND = "python"
 
 
 def decompress_file(compressed_path: Path, decompressed_path: Path) -> Path:
@@ -23,19 +42,18 @@ def decompress_file(compressed_path: Path, decompressed_path: Path) -> Path:
     try:
         log_message(LogLevel.INFO, f"Decompressing file: {compressed_path.name}")
 
-        if compressed_path.name.lower().endswith(".xz"):
-            _decompress_xz(compressed_path, decompressed_path)
-        elif compressed_path.name.lower().endswith(".gz"):
-            _decompress_gz(compressed_path, decompressed_path)
-        elif compressed_path.name.lower().endswith(".bz2"):
-            _decompress_bz2(compressed_path, decompressed_path)
-        else:
+        if not is_compressed_file(compressed_path.name):
             error_and_exit(
                 f"Unsupported compression format: {compressed_path}",
                 "Supported formats: .gz, .bz2, .xz",
                 code=ERR_FILE_UNSUPPORTED_COMPRESSION,
             )
 
+        log_decompression_benchmark(compressed_path)
+        with open(compressed_path, "rb") as compressed_file, open(decompressed_path, "wb") as decompressed_file:
+            for chunk in iter_decompressed_chunks(compressed_file, compressed_path.name):
+                decompressed_file.write(chunk)
+
         log_message(LogLevel.SUCCESS, f"Decompression completed successfully: {decompressed_path}")
         return decompressed_path
 
@@ -44,7 +62,76 @@ def decompress_file(compressed_path: Path, decompressed_path: Path) -> Path:
             "Failed to decompress file",
             Rule(),
             str(e),
-            code=ERR_FILE_DECOMPRESS_FAILED,
+            code=_get_decompress_error_code(compressed_path.name),
+        )
+
+
+def get_decompression_backends(filename: str) -> List[str]:
+    """
+    Return the decompression backends available for a compressed file, in order of preference.
+
+    Parallel decompressors from PARALLEL_DECOMPRESSORS are listed if they are installed; the built-in
+    Python decompressor is always available and always last.
+    """
+    extension = _get_compression_extension(filename)
+    installed = [command[0] for command in PARALLEL_DECOMPRESSORS[extension] if _is_decompressor_installed(command[0])]
+    return installed + [PYTHON_BACKEND]
+
+
+def iter_decompressed_chunks(
+    compressed_stream: BinaryIO, filename: str, chunk_size: int = STREAM_CHUNK_SIZE, backend: Optional[str] = None
+) -> Iterator[bytes]:
+    """
+    Decompress a compressed stream incrementally, yielding at most chunk_size bytes at a time.
+
+    Uses the preferred available backend unless one is given. Nothing is written to disk, and memory stays
+    bounded however well the image compresses. Concatenated streams, as written by pigz, pbzip2 and
+    parallel xz, are decompressed in full.
+    """
+    if not backend:
+        # Parallel decompressors only pay for their process and pipe overhead with more than one core
+        backend = get_decompression_backends(filename)[0] if (os.cpu_count() or 1) > 1 else PYTHON_BACKEND
+    log_message(
+        LogLevel.INFO,
+        f"Decompression backend: {backend}" + (" (parallel)" if backend != PYTHON_BACKEND else ""),
+    )
+    return _iter_backend_chunks(compressed_stream, filename, chunk_size, backend)
+
+
+def log_decompression_benchmark(compressed_path: Path, sample_size: int = DECOMPRESS_BENCHMARK_SAMPLE_SIZE) -> None:
+    """Decompress the start of a file with every available backend and log their throughput (--verbose only)."""
+    if not is_verbose():
+        return
+
+    backends = get_decompression_backends(compressed_path.name)
+    with open(compressed_path, "rb") as compressed_file:
+        sample = compressed_file.read(sample_size)
+
+    log_message(
+        LogLevel.DEBUG,
+        f"Decompression benchmark: first {format_bytes(len(sample))} of {compressed_path.name}, "
+        f"{os.cpu_count()} CPU(s)",
+    )
+    if compressed_path.name.lower().endswith(".xz") and shutil.which("xz"):
+        log_message(LogLevel.DEBUG, f"  xz blocks: {_count_xz_blocks(compressed_path)}")
+
+    throughputs = {}
+    for backend in backends:
+        decompressed_bytes = 0
+        start_time = time.monotonic()
+        try:
+            for chunk in _iter_backend_chunks(io.BytesIO(sample), compressed_path.name, STREAM_CHUNK_SIZE, backend):
+                decompressed_bytes += len(chunk)
+        except Exception:
+            # The sample is usually cut mid-stream, so every backend ends with an unexpected end of input
+            pass
+        throughputs[backend] = decompressed_bytes / max(time.monotonic() - start_time, 0.001)
+
+    baseline = throughputs[PYTHON_BACKEND] or 1
+    for backend, throughput in sorted(throughputs.items(), key=lambda item: item[1], reverse=True):
+        log_message(
+            LogLevel.DEBUG,
+            f"  {backend:<8} {format_bytes(int(throughput))}/s decompressed ({throughput / baseline:.1f}x {PYTHON_BACKEND})",
         )
 
 
@@ -69,41 +156,151 @@ def get_decompressed_filename(filename: str) -> str:
     return filename
 
 
-def _decompress_xz(input_path: Path, output_path: Path) -> None:
-    """Decompress XZ file."""
-    with lzma.open(input_path, "rb") as compressed_file:
-        with open(output_path, "wb") as decompressed_file:
-            # Read and write in chunks to handle large files
-            while True:
-                chunk = compressed_file.read(8192)
-                if not chunk:
-                    break
-                decompressed_file.write(chunk)
+def _get_compression_extension(filename: str) -> str:
+    """Return the compression extension of a file name."""
+    filename_lower = filename.lower()
+    for extension in COMPRESSED_EXTENSIONS:
+        if filename_lower.endswith(extension):
+            return extension
+    raise ValueError(f"Unsupported compression format: {filename} (supported formats: .gz, .bz2, .xz)")
+
+
+def _get_decompress_error_code(filename: str) -> int:
+    """Return the error code for a failed decompression of a file."""
+    return {".gz": ERR_FILE_DECOMPRESS_GZ_FAILED, ".bz2": ERR_FILE_DECOMPRESS_BZ2_FAILED}.get(
+        _get_compression_extension(filename), ERR_FILE_DECOMPRESS_FAILED
+    )
+
+
+@lru_cache(maxsize=None)
+def _is_decompressor_installed(name: str) -> bool:
+    """Check whether a parallel decompressor is installed and able to decompress in parallel."""
+    if not shutil.which(name):
+        return False
+    if name == "xz":
+        # xz decompresses multi-block archives in parallel from 5.4 on; older versions ignore -T0 when decompressing
+        try:
+            version = subprocess.run([name, "--version"], capture_output=True, text=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            return False
+        match = re.search(r"(\d+)\.(\d+)", version)
+        if not match:
+            return False
+        return (int(match.group(1)), int(match.group(2))) >= (5, 4)
+    return True
 
 
-def _decompress_gz(input_path: Path, output_path: Path) -> None:
-    """Decompress GZ file using gunzip."""
+def _count_xz_blocks(compressed_path: Path) -> str:
+    """Return the number of blocks in an xz file; only multi-block files decompress in parallel."""
     try:
-        with open(output_path, "wb") as output_file:
-            subprocess.run(["gunzip", "-c", str(input_path)], stdout=output_file, check=True)
-    except subprocess.CalledProcessError as e:
-        error_and_exit(
-            "Failed to decompress gzip file",
-            Rule(),
-            str(e),
-            code=ERR_FILE_DECOMPRESS_GZ_FAILED,
-        )
+        listing = subprocess.run(
+            ["xz", "--robot", "--list", str(compressed_path)], capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    for line in listing.splitlines():
+        fields = line.split("\t")
+        if fields[0] == "totals":
+            return fields[2]
+    return "unknown"
+
+
+def _iter_backend_chunks(compressed_stream: BinaryIO, filename: str, chunk_size: int, backend: str) -> Iterator[bytes]:
+    """Decompress a stream with a specific backend, yielding at most chunk_size bytes at a time."""
+    extension = _get_compression_extension(filename)
+    if backend == PYTHON_BACKEND:
+        return _iter_python_chunks(compressed_stream, extension, chunk_size)
+    command = next(command for command in PARALLEL_DECOMPRESSORS[extension] if command[0] == backend)
+    return _iter_command_chunks(command, compressed_stream, chunk_size)
 
 
-def _decompress_bz2(input_path: Path, output_path: Path) -> None:
-    """Decompress BZ2 file using bunzip2."""
+def _iter_python_chunks(compressed_stream: BinaryIO, extension: str, chunk_size: int) -> Iterator[bytes]:
+    """Decompress with Python's built-in decompressors, reading the compressed input in large blocks."""
+    # The decompressors read their input 8-128 KB at a time; a large buffer cuts syscalls and HTTP reads
+    buffered_stream = io.BufferedReader(cast(io.RawIOBase, compressed_stream), buffer_size=DECOMPRESS_READ_SIZE)
+    decompressed_stream: io.BufferedIOBase
+    if extension == ".xz":
+        decompressed_stream = lzma.LZMAFile(buffered_stream, "rb")
+    elif extension == ".gz":
+        decompressed_stream = gzip.GzipFile(fileobj=buffered_stream, mode="rb")
+    else:
+        decompressed_stream = bz2.BZ2File(buffered_stream, "rb")
+
+    with decompressed_stream:
+        while True:
+            chunk = decompressed_stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _iter_command_chunks(command: List[str], compressed_stream: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    """Decompress with an external decompressor, reading its output chunk_size bytes at a time."""
+    # A regular file is handed to the decompressor directly; anything else (e.g. an HTTP body) is piped in
+    input_fd = _get_regular_file_descriptor(compressed_stream)
+    # stderr goes to a file: an undrained pipe fills up and blocks the decompressor while we wait on stdout
+    stderr_file = tempfile.TemporaryFile()
     try:
-        with open(output_path, "wb") as output_file:
-            subprocess.run(["bunzip2", "-c", str(input_path)], stdout=output_file, check=True)
-    except subprocess.CalledProcessError as e:
-        error_and_exit(
-            "Failed to decompress bzip2 file",
-            Rule(),
-            str(e),
-            code=ERR_FILE_DECOMPRESS_BZ2_FAILED,
+        process = subprocess.Popen(
+            command,
+            stdin=input_fd if input_fd is not None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            bufsize=chunk_size,
         )
+    except BaseException:
+        stderr_file.close()
+        raise
+
+    feed_errors: List[Exception] = []
+    feeder = None
+    if input_fd is None and process.stdin is not None:
+        stdin = process.stdin
+
+        def feed() -> None:
+            try:
+                shutil.copyfileobj(compressed_stream, stdin, DECOMPRESS_READ_SIZE)
+            except BrokenPipeError:
+                pass  # The decompressor exited early; its exit status reports why
+            except Exception as e:
+                feed_errors.append(e)
+            finally:
+                try:
+                    stdin.close()
+                except OSError:
+                    pass
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)  # type: ignore[union-attr]
+            if not chunk:
+                break
+            yield chunk
+
+        process.wait()
+        if feeder:
+            feeder.join()
+        if feed_errors:
+            raise feed_errors[0]
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors="replace").strip()
+            raise RuntimeError(f"{command[0]} exited with code {process.returncode}: {stderr}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()  # type: ignore[union-attr]
+        stderr_file.close()
+
+
+def _get_regular_file_descriptor(stream: BinaryIO) -> Optional[int]:
+    """Return the file descriptor of a stream backed by a regular file, or None."""
+    try:
+        fd = stream.fileno()
+        return fd if stat.S_ISREG(os.fstat(fd).st_mode) else None
+    except (AttributeError, OSError, ValueError):
+        return None
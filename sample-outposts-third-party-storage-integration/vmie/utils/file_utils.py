@@ -3,7 +3,13 @@
 import tempfile
 from pathlib import Path
 
-from vmie.common import COMPRESSED_EXTENSIONS, ERR_FILE_UNSUPPORTED_FORMAT, SUPPORTED_FORMATS, ImageFormat
+from vmie.common import (
+    COMPRESSED_EXTENSIONS,
+    CONVERTIBLE_FORMATS,
+    ERR_FILE_UNSUPPORTED_FORMAT,
+    SUPPORTED_FORMATS,
+    ImageFormat,
+)
 from vmie.utils.logging_utils import error_and_exit
 
 
@@ -35,6 +41,17 @@ def detect_image_format(filename: str) -> ImageFormat:
     )
 
 
+def is_convertible_image(filename: str) -> bool:
+    """Check if an (uncompressed) image file name has a format that is converted to VMDK before upload."""
+    filename_lower = filename.lower()
+    return any(filename_lower.endswith(ext) for extensions in CONVERTIBLE_FORMATS.values() for ext in extensions)
+
+
+def get_converted_filename(filename: str) -> str:
+    """Get the file name of an image once converted to a stream-optimized VMDK."""
+    return f"{Path(filename).stem}.vmdk"
+
+
 def get_file_size(file_path: Path) -> int:
     """Get file size in bytes."""
     return file_path.stat().st_size
@@ -5,13 +5,14 @@ import sys
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, NoReturn, Optional
+from typing import Dict, List, NoReturn, Optional
 
 from rich.console import Console, Group, RenderableType
 from rich.logging import RichHandler
 from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
 from rich.rule import Rule
+from rich.table import Table
 from rich.text import Text
 
 from vmie.common import LogLevel
@@ -63,6 +64,8 @@ def setup_logging(log_level: str = "INFO") -> logging.Logger:
         Configured logger instance
     """
 
+    global _logger
+
     # Create logger
     logger = logging.getLogger("vmie")
     logger.setLevel(getattr(logging, log_level.upper()))
@@ -97,9 +100,15 @@ def setup_logging(log_level: str = "INFO") -> logging.Logger:
         f"Log file: {log_file}",
     )
 
+    _logger = logger
     return logger
 
 
+def is_verbose() -> bool:
+    """Check whether debug output is shown on the console (--verbose)."""
+    return get_logger().isEnabledFor(logging.DEBUG)
+
+
 def log_message(level: LogLevel, message: str) -> None:
     """
     Log a message.
@@ -194,7 +203,8 @@ def wait_with_progress(description: str, check_function, timeout_seconds: int =
     Args:
         description: Base description for the progress display
         check_function: Function that returns:
-            - Dict: {"completed": bool, "progress": int, "description": str}
+            - Dict: {"completed": bool, "progress": int, "description": str}, and optionally
+              "interval": seconds until the next check, overriding check_interval
         timeout_seconds: Maximum time to wait
         check_interval: Time between checks
 
@@ -229,7 +239,9 @@ def wait_with_progress(description: str, check_function, timeout_seconds: int =
             display_desc = f"{progress_desc} ({progress_percent}%)" if progress_percent > 0 else progress_desc
             progress.update(task, description=display_desc)
 
-            time.sleep(check_interval)
+            # Never sleep past the timeout
+            interval = result.get("interval", check_interval)
+            time.sleep(max(min(interval, start_time + timeout_seconds - time.time()), 0))
 
     logger.warning(f"[yellow]⚠[/yellow] Timeout: {description} did not complete within {timeout_seconds} seconds")
     return False
@@ -248,3 +260,17 @@ def display_summary(title: str, items: Dict) -> None:
     content = "\n".join([f"[bold]{key}:[/bold] {value}" for key, value in items.items()])
     panel = Panel(content, title=title, border_style="cyan", padding=(1, 2))
     _console.print(panel)
+
+
+def display_table(title: str, columns: List[str], rows: List[List[str]]) -> None:
+    """Display a table, e.g. per-image results of a batch, and log its rows."""
+    logger = get_logger()
+    logger.info(f"[bold cyan]{title}[/bold cyan]")
+
+    table = Table(title=title, title_style="bold cyan", border_style="cyan")
+    for column in columns:
+        table.add_column(column)
+    for row in rows:
+        logger.info("  " + " | ".join(f"{column}: {value}" for column, value in zip(columns, row)))
+        table.add_row(*row)
+    _console.print(table)
@@ -69,3 +69,25 @@ def load_disk_containers_from_json(json_path: str) -> List[Dict]:
             str(e),
             code=ERR_JSON_LOAD_FAILED,
         )
+
+
+def load_batch_manifest(manifest_path: str) -> List[Dict[str, str]]:
+    """
+    Load the images of a batch import manifest.
+
+    Args:
+        manifest_path: Path to the manifest JSON file, validated by validate_batch_manifest
+
+    Returns:
+        List[Dict[str, str]]: One entry per image, with a source and optional license_type or usage_operation
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)["images"]
+    except Exception as e:
+        error_and_exit(
+            f"Failed to load batch manifest: {manifest_path}",
+            Rule(),
+            str(e),
+            code=ERR_JSON_LOAD_FAILED,
+        )
@@ -223,3 +223,49 @@ def validate_usage_operation(usage_operation: Optional[str]) -> Optional[str]:
         )
 
     return usage_operation
+
+
+def validate_batch_manifest(manifest_path: Optional[str]) -> str:
+    """
+    Validate a batch import manifest and every image source in it.
+
+    The manifest is a JSON object with an "images" list; each image has a "source" (any source accepted
+    by --source) and optionally a "license_type" or "usage_operation" overriding the command line options.
+
+    Args:
+        manifest_path: The manifest file path to validate
+
+    Returns:
+        str: The validated manifest file path
+
+    Raises:
+        ValidationError: If the manifest or any image in it is invalid
+    """
+    if not manifest_path:
+        raise ValidationError("Manifest file is required for batch imports")
+    validate_json_file(manifest_path)
+
+    with open(Path(manifest_path).resolve(), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    images = manifest.get("images") if isinstance(manifest, dict) else None
+    if not isinstance(images, list) or not images:
+        raise ValidationError('Invalid manifest: expected a JSON object with a non-empty "images" list')
+
+    for number, image in enumerate(images, start=1):
+        if not isinstance(image, dict) or "source" not in image:
+            raise ValidationError(f'Invalid manifest: image {number} must be an object with a "source"')
+        unknown = set(image) - {"source", "license_type", "usage_operation"}
+        if unknown:
+            raise ValidationError(f"Invalid manifest: image {number} has unknown fields: {', '.join(sorted(unknown))}")
+        if image.get("license_type") and image.get("usage_operation"):
+            raise ValidationError(
+                f"Invalid manifest: image {number} sets both license_type and usage_operation, which are exclusive"
+            )
+        try:
+            validate_image_source(image["source"])
+            validate_license_type(image.get("license_type"))
+            validate_usage_operation(image.get("usage_operation"))
+        except ValidationError as e:
+            raise ValidationError(f"Invalid manifest: image {number}: {e}") from e
+
+    return manifest_path
@@ -3,85 +3,132 @@
 import boto3
 import argparse
 import sys
+import json
 import os
-import shlex
-import subprocess
+import re
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from botocore.exceptions import ClientError
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from outpost_utils import get_outpost_info
+from outpost_utils import find_instance_region, get_outpost_info
+from inventory_cache import ResourceSnapshot, get_outpost_arn, index_instance_placements, invalidate_launch_template
+from launch_template_utils import build_launch_template_data, ensure_launch_template
 
-def find_instance_region(instance_id):
-    """Find which region contains the instance"""
-    session = boto3.Session()
-    regions = session.get_available_regions('ec2')
-    
-    for region in regions:
-        try:
-            ec2_client = boto3.client('ec2', region_name=region)
-            ec2_client.describe_instances(InstanceIds=[instance_id])
-            return region
-        except ClientError:
-            continue
-    return None
+INSTANCE_MENU_PAGE_SIZE = 20
 
-def list_running_instances(ec2_client):
-    """List all running EC2 instances"""
-    try:
-        response = ec2_client.describe_instances(
-            Filters=[{'Name': 'instance-state-name', 'Values': ['running']}]
-        )
-        
-        instances = []
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), 'N/A')
-                placement = instance.get('Placement', {})
-                outpost_arn = placement.get('OutpostArn', 'N/A')
-                az = placement.get('AvailabilityZone', 'N/A')
-                
-                instances.append({
-                    'InstanceId': instance['InstanceId'],
-                    'InstanceType': instance['InstanceType'],
-                    'Name': name,
-                    'AvailabilityZone': az,
-                    'OutpostArn': outpost_arn
-                })
-        return instances
-    except ClientError as e:
-        print(f"Error listing instances: {e}")
-        return []
+# Adaptive retries slow the concurrent describe and create calls down when EC2 throttles them
+EC2_CLIENT_CONFIG = Config(retries={'mode': 'adaptive', 'max_attempts': 10})
 
-def select_instance(instances):
-    """Display instances and let user select one"""
-    if not instances:
-        print("No running instances found.")
-        return None
-    
-    print("\nRunning EC2 Instances:")
-    print("-" * 80)
-    for i, instance in enumerate(instances, 1):
-        outpost_info = "(Outpost)" if instance['OutpostArn'] != 'N/A' else ""
-        print(f"{i}. {instance['InstanceId']} ({instance['InstanceType']}) - {instance['Name']} {outpost_info}")
-        print(f"   AZ: {instance['AvailabilityZone']}")
-    
+def build_instance_filters(outpost_arn=None, name_filter=None, tag_filter=None, outposts_only=True):
+    """Build server-side describe_instances filters for the instance menu"""
+    filters = [{'Name': 'instance-state-name', 'Values': ['running']}]
+    if outpost_arn:
+        filters.append({'Name': 'outpost-arn', 'Values': [outpost_arn]})
+    elif outposts_only:
+        # Instances in the region itself have no Outpost ARN, so a wildcard match keeps only Outpost-placed ones
+        filters.append({'Name': 'outpost-arn', 'Values': ['arn:*:outposts:*']})
+    if name_filter:
+        if name_filter.startswith('i-'):
+            filters.append({'Name': 'instance-id', 'Values': [name_filter]})
+        else:
+            filters.append({'Name': 'tag:Name', 'Values': [f"*{name_filter}*"]})
+    if tag_filter:
+        key, value = tag_filter.split('=', 1)
+        filters.append({'Name': f"tag:{key}", 'Values': [value]})
+    return filters
+
+def iter_running_instances(ec2_client, filters=None, page_size=100):
+    """Yield running EC2 instances matching the filters, fetching one page at a time"""
+    paginator = ec2_client.get_paginator('describe_instances')
+    pages = paginator.paginate(
+        Filters=filters or build_instance_filters(),
+        PaginationConfig={'PageSize': page_size}
+    )
+    for page in pages:
+        instances = [instance for reservation in page['Reservations'] for instance in reservation['Instances']]
+        index_instance_placements(instances)
+        for instance in instances:
+            name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), 'N/A')
+            placement = instance.get('Placement', {})
+            yield {
+                'InstanceId': instance['InstanceId'],
+                'InstanceType': instance['InstanceType'],
+                'Name': name,
+                'AvailabilityZone': placement.get('AvailabilityZone', 'N/A'),
+                'OutpostArn': get_outpost_arn(instance) or 'N/A'
+            }
+
+def select_instance(ec2_client, outpost_arn=None, name_filter=None, tag_filter=None, outposts_only=True):
+    """Display running instances a page at a time and let user select one"""
     while True:
+        filters = build_instance_filters(outpost_arn, name_filter, tag_filter, outposts_only)
         try:
-            choice = int(input(f"\nSelect instance (1-{len(instances)}): ")) - 1
-            if 0 <= choice < len(instances):
-                return instances[choice]['InstanceId']
-            print("Invalid selection. Please try again.")
-        except (ValueError, KeyboardInterrupt):
+            instances = iter_running_instances(ec2_client, filters)
+            loaded = []
+            exhausted = False
+            page_start = 0
+            
+            while True:
+                # Only fetch as many instances from EC2 as the current menu page needs
+                while not exhausted and len(loaded) < page_start + INSTANCE_MENU_PAGE_SIZE:
+                    instance = next(instances, None)
+                    if instance is None:
+                        exhausted = True
+                    else:
+                        loaded.append(instance)
+                
+                if not loaded:
+                    print("No running instances found" + (f" matching '{name_filter}'." if name_filter else "."))
+                    if outposts_only and not outpost_arn:
+                        print("Only instances placed on Outposts are listed; use --all-instances to include the others.")
+                    if not name_filter:
+                        return None
+                    name_filter = None
+                    break
+                
+                page = loaded[page_start:page_start + INSTANCE_MENU_PAGE_SIZE]
+                more = not exhausted or len(loaded) > page_start + INSTANCE_MENU_PAGE_SIZE
+                search_info = f" matching '{name_filter}'" if name_filter else ""
+                print(f"\nRunning EC2 Instances{search_info} ({page_start + 1}-{page_start + len(page)}{', more available' if more else ''}):")
+                print("-" * 80)
+                for i, instance in enumerate(page, page_start + 1):
+                    outpost_info = "(Outpost)" if instance['OutpostArn'] != 'N/A' else ""
+                    print(f"{i}. {instance['InstanceId']} ({instance['InstanceType']}) - {instance['Name']} {outpost_info}")
+                    print(f"   AZ: {instance['AvailabilityZone']}")
+                
+                choice = input("\nSelect instance number, 'n' next page, 'p' previous page, '/text' to search by name or ID, 'q' to quit: ").strip()
+                if choice.lower() == 'q':
+                    return None
+                if choice.lower() == 'n':
+                    if more:
+                        page_start += INSTANCE_MENU_PAGE_SIZE
+                    continue
+                if choice.lower() == 'p':
+                    page_start = max(0, page_start - INSTANCE_MENU_PAGE_SIZE)
+                    continue
+                if choice.startswith('/'):
+                    name_filter = choice[1:].strip() or None
+                    break
+                try:
+                    index = int(choice) - 1
+                    if page_start <= index < page_start + len(page):
+                        return loaded[index]['InstanceId']
+                except ValueError:
+                    pass
+                print("Invalid selection. Please try again.")
+        except KeyboardInterrupt:
+            return None
+        except ClientError as e:
+            print(f"Error listing instances: {e}")
             return None
 
-def list_subnets_in_vpc(ec2_client, vpc_id):
+def list_subnets_in_vpc(ec2_client, vpc_id, snapshot=None):
     """List all subnets in the specified VPC"""
+    snapshot = snapshot or ResourceSnapshot(ec2_client)
     try:
-        response = ec2_client.describe_subnets(
-            Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]
-        )
-        
         subnets = []
-        for subnet in response['Subnets']:
+        for subnet in snapshot.subnets_in_vpc(vpc_id):
             name = next((tag['Value'] for tag in subnet.get('Tags', []) if tag['Key'] == 'Name'), 'N/A')
             subnets.append({
                 'SubnetId': subnet['SubnetId'],
@@ -146,20 +193,29 @@ def ask_instance_choice():
         except KeyboardInterrupt:
             return 'different'
 
-def create_launch_template_from_instance(ec2_client, instance_id, template_name=None):
-    """Create launch template from EC2 instance"""
+def get_instance_name(instance):
+    return next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), instance['InstanceId'])
+
+def get_default_template_name(instance):
+    # Launch template names only allow letters, digits and ( ) . - / _
+    instance_name = re.sub(r'[^a-zA-Z0-9().\-/_]', '', get_instance_name(instance))
+    return f"lt-{instance_name}-{instance['InstanceId']}"
+
+def create_launch_template_from_instance(ec2_client, instance_id, template_name=None, snapshot=None, update=False):
+    """Create launch template from EC2 instance, or with update=True add a version only if the template drifted"""
+    snapshot = snapshot or ResourceSnapshot(ec2_client)
     try:
         # Get instance details
-        response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        instance = response['Reservations'][0]['Instances'][0]
+        instance = snapshot.instance(instance_id)
         
-
+        # Fetch UserData in the background while the user picks a subnet
+        snapshot.prefetch_userdata([instance_id])
         
         # Get VPC ID and prompt for subnet selection
         vpc_id = instance['VpcId']
         print(f"\nInstance is in VPC: {vpc_id}")
         
-        subnets = list_subnets_in_vpc(ec2_client, vpc_id)
+        subnets = list_subnets_in_vpc(ec2_client, vpc_id, snapshot)
         selected_subnet_id = select_subnet(subnets)
         
         if not selected_subnet_id:
@@ -168,82 +224,37 @@ def create_launch_template_from_instance(ec2_client, instance_id, template_name=
         
         # Generate template name if not provided
         if not template_name:
-            instance_name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), instance_id)
-            template_name = f"lt-{instance_name}-{instance_id}"
-        
-        # Build launch template data
-        template_data = {
-            'ImageId': instance['ImageId'],
-            'InstanceType': instance['InstanceType'],
-            'TagSpecifications': [{
-                'ResourceType': 'instance',
-                'Tags': instance.get('Tags', [])
-            }]
-        }
+            template_name = get_default_template_name(instance)
         
-        # Add optional fields if they exist
-        if instance.get('KeyName'):
-            template_data['KeyName'] = instance['KeyName']
-            
-        # Only add SecurityGroupIds if not using NetworkInterfaces
-        if instance['SecurityGroups'] and len(instance.get('NetworkInterfaces', [])) <= 1:
-            template_data['SecurityGroupIds'] = [sg['GroupId'] for sg in instance['SecurityGroups']]
-            
         # Get UserData using describe_instance_attribute for reliability
-        try:
-            userdata_response = ec2_client.describe_instance_attribute(
-                InstanceId=instance_id,
-                Attribute='userData'
-            )
-            userdata = userdata_response.get('UserData', {}).get('Value', '')
-            if userdata:
-                template_data['UserData'] = userdata
-                print(f"  UserData found: {len(userdata)} characters")
-            else:
-                print(f"  No UserData found on source instance")
-        except ClientError as e:
-            print(f"  Could not retrieve UserData: {e.response['Error']['Code']} - {e.response['Error']['Message']}")
-            print(f"  Note: Ensure your IAM user/role has ec2:DescribeInstanceAttribute permission")
-            
-        if instance.get('MetadataOptions'):
-            valid_metadata_keys = ['HttpTokens', 'HttpPutResponseHopLimit', 'HttpEndpoint', 'HttpProtocolIpv6', 'InstanceMetadataTags']
-            metadata_options = {k: v for k, v in instance['MetadataOptions'].items() if k in valid_metadata_keys}
-            if metadata_options:
-                template_data['MetadataOptions'] = metadata_options
-            
-        # Include network interfaces - use selected subnet for both ENIs
-        network_interfaces = instance.get('NetworkInterfaces', [])
-        if len(network_interfaces) > 1:
-            eni_configs = []
-            for eni in sorted(network_interfaces, key=lambda x: x['Attachment']['DeviceIndex']):
-                eni_config = {
-                    'DeviceIndex': eni['Attachment']['DeviceIndex'],
-                    'SubnetId': selected_subnet_id,  # Use selected subnet
-                    'Groups': [sg['GroupId'] for sg in eni['Groups']]
-                }
-                eni_configs.append(eni_config)
-            template_data['NetworkInterfaces'] = eni_configs
+        userdata = snapshot.userdata(instance_id)
+        if userdata:
+            print(f"  UserData found: {len(userdata)} characters")
         else:
-            # Single ENI - add subnet configuration
-            template_data['NetworkInterfaces'] = [{
-                'DeviceIndex': 0,
-                'SubnetId': selected_subnet_id,
-                'Groups': [sg['GroupId'] for sg in instance['SecurityGroups']]
-            }]
-            # Remove SecurityGroupIds since we're using NetworkInterfaces
-            template_data.pop('SecurityGroupIds', None)
+            print(f"  No UserData found on source instance")
         
-        # Remove None values but keep empty strings for UserData
-        template_data = {k: v for k, v in template_data.items() if v is not None and (k == 'UserData' or v != '')}
+        template_data = build_launch_template_data(instance, selected_subnet_id, userdata)
         
-        # Create launch template
-        response = ec2_client.create_launch_template(
-            LaunchTemplateName=template_name,
-            LaunchTemplateData=template_data
-        )
+        if update:
+            # Keep the template ID stable: only write a new default version when the instance drifted
+            template_id, action, drifted_fields = ensure_launch_template(ec2_client, template_name, template_data)
+            if action == 'unchanged':
+                print(f"✓ Launch template is up to date with the instance, no new version needed")
+            elif action == 'updated':
+                print(f"✓ Launch template updated with a new default version (changed: {', '.join(drifted_fields)})")
+            else:
+                print(f"✓ Launch template created successfully!")
+        else:
+            # Create launch template
+            response = ec2_client.create_launch_template(
+                LaunchTemplateName=template_name,
+                LaunchTemplateData=template_data
+            )
+            template_id = response['LaunchTemplate']['LaunchTemplateId']
+            invalidate_launch_template(ec2_client, template_id)
+            print(f"✓ Launch template created successfully!")
         
-        template_id = response['LaunchTemplate']['LaunchTemplateId']
-        print(f"✓ Launch template created successfully!")
+        snapshot.add('launch_templates', template_id, {'LaunchTemplateId': template_id, 'LaunchTemplateName': template_name})
         print(f"  Template Name: {template_name}")
         print(f"  Template ID: {template_id}")
         print(f"  Source Instance: {instance_id}")
@@ -269,30 +280,43 @@ def ask_for_automated_recovery():
         except KeyboardInterrupt:
             return False
 
-def setup_automated_recovery(template_ids, region, source_instance_id=None, primary_template_id=None):
+def get_default_stack_name(instance):
+    """Build a valid CloudFormation stack name from the instance name"""
+    # Remove invalid characters and ensure it starts with a letter
+    clean_name = re.sub(r'[^a-zA-Z0-9-]', '', get_instance_name(instance))
+    if clean_name and not clean_name[0].isalpha():
+        clean_name = f"stack-{clean_name}"
+    elif not clean_name:
+        clean_name = f"stack-{instance['InstanceId'].replace('i-', '')}"
+    return f"autorestart-{clean_name}"
+
+def load_autorestart_tool():
+    """Import the autorestart tool's init module, which cannot be imported by name next to this init module"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    module_path = os.path.join(project_root, "autorestart", "autorestart-tool", "init.py")
+    if not os.path.exists(module_path):
+        raise Exception(f"Autorestart tool not found at: {module_path}")
+    spec = importlib.util.spec_from_file_location("autorestart_init", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def setup_automated_recovery(template_ids, region, source_instance_id=None, primary_template_id=None, snapshot=None, session=None):
     """Setup automated recovery using autorestart tool"""
+    session = session or boto3.Session()
+    snapshot = snapshot or ResourceSnapshot(session.client('ec2', region_name=region))
     
     try:
-        print("Source instance information will be auto-detected by the autorestart tool.")
+        if source_instance_id:
+            print(f"Source instance to monitor: {source_instance_id}")
+        else:
+            print("Source instance information will be auto-detected by the autorestart tool.")
         
         # Generate a valid stack name from instance name or use user input
         if source_instance_id:
             try:
-                ec2_client = boto3.client('ec2', region_name=region)
-                response = ec2_client.describe_instances(InstanceIds=[source_instance_id])
-                instance = response['Reservations'][0]['Instances'][0]
-                instance_name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), source_instance_id)
-                
-                # Ensure stack name starts with a letter and contains only valid characters
-                import re
-                # Remove invalid characters and ensure it starts with a letter
-                clean_name = re.sub(r'[^a-zA-Z0-9-]', '', instance_name)
-                if clean_name and not clean_name[0].isalpha():
-                    clean_name = f"stack-{clean_name}"
-                elif not clean_name:
-                    clean_name = f"stack-{source_instance_id.replace('i-', '')}"
-                
-                suggested_name = f"autorestart-{clean_name}"
+                instance = snapshot.instance(source_instance_id)
+                suggested_name = get_default_stack_name(instance)
                 stack_name = input(f"Enter CloudFormation stack name [{suggested_name}]: ").strip() or suggested_name
             except Exception:
                 stack_name = input("Enter CloudFormation stack name: ").strip()
@@ -300,136 +324,203 @@ def setup_automated_recovery(template_ids, region, source_instance_id=None, prim
             stack_name = input("Enter CloudFormation stack name: ").strip()
         
         # Validate stack name format
-        import re
         if not re.match(r'^[a-zA-Z][-a-zA-Z0-9]*$', stack_name):
             print(f"Invalid stack name '{stack_name}'. Stack names must start with a letter and contain only letters, numbers, and hyphens.")
             return False
         notification_email = input("Enter notification email address: ").strip()
         
-        # Find autorestart script path
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(current_dir)
-        autorestart_script = os.path.join(project_root, "autorestart", "autorestart-tool", "init.py")
-        template_file = os.path.join(project_root, "autorestart", "autorestart-tool", "AutoRestartTemplate.yaml")
-        
-        if not os.path.exists(autorestart_script):
-            print(f"Autorestart script not found at: {autorestart_script}")
-            return False
-            
-        if not os.path.exists(template_file):
-            print(f"Template file not found at: {template_file}")
-            return False
-        
-        # Build command arguments with input validation
-        python_cmd = "python" if os.name == "nt" else "python3"
-        
-        # Validate and sanitize all inputs
-        import re
-        
-        # Validate template IDs (AWS launch template ID format)
-        validated_template_ids = []
-        for tid in template_ids:
-            if tid and isinstance(tid, str) and re.match(r'^lt-[0-9a-f]{17}$', tid):
-                validated_template_ids.append(tid)
-        
-        # Validate stack name (CloudFormation naming rules)
-        if not re.match(r'^[a-zA-Z][-a-zA-Z0-9]*$', stack_name):
-            raise ValueError(f"Invalid stack name: {stack_name}")
-        
-        # Validate region (AWS region format)
-        if not re.match(r'^[a-z0-9-]+$', region):
-            raise ValueError(f"Invalid region: {region}")
-        
         # Validate email (basic email format)
         if not re.match(r'^[^@]+@[^@]+\.[^@]+$', notification_email):
             raise ValueError(f"Invalid email format: {notification_email}")
         
-        cmd = [
-            python_cmd, autorestart_script,
-            "--launch-template-id"] + validated_template_ids + [
-            "--template-file", template_file,
-            "--stack-name", stack_name,
-            "--region", region,
-            "--notification-email", notification_email
-        ]
-        
-        if primary_template_id and isinstance(primary_template_id, str) and re.match(r'^lt-[0-9a-f]{17}$', primary_template_id):
-            cmd.extend(["--primary-template-id", primary_template_id])
-        
-        if source_instance_id and isinstance(source_instance_id, str) and re.match(r'^i-[0-9a-f]{8,17}$', source_instance_id):
-            cmd.extend(["--source-instance-id", source_instance_id])
-        
-        print(f"Running autorestart setup with command: {' '.join(shlex.quote(arg) for arg in cmd)}")
-        subprocess.run(cmd, check=True)
-        return True
+        autorestart_tool = load_autorestart_tool()
+        
+        # Run the setup in this process with the same session and the resources described so far
+        action = autorestart_tool.deploy_auto_restart(
+            stack_name,
+            template_ids,
+            notification_email,
+            region,
+            session=session,
+            source_instance_id=source_instance_id,
+            primary_template_id=primary_template_id,
+            snapshot=snapshot
+        )
+        return action is not None
         
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         print(f"Error running autorestart setup: {e}")
         return False
+
+def parse_subnet_map(values):
+    """Parse PRIMARY=RECOVERY subnet pairs, or a JSON file mapping primary subnets to recovery subnets"""
+    subnet_map = {}
+    for value in values:
+        if value.endswith('.json'):
+            with open(value, 'r') as file:
+                subnet_map.update(json.load(file))
+        elif '=' in value:
+            primary_subnet_id, recovery_subnet_id = value.split('=', 1)
+            subnet_map[primary_subnet_id.strip()] = recovery_subnet_id.strip()
+        else:
+            raise ValueError(f"Invalid subnet mapping '{value}'; expected PRIMARY_SUBNET=RECOVERY_SUBNET or a .json file")
+    return subnet_map
+
+def describe_batch_instances(ec2_client, instance_ids=None, tag_filter=None):
+    """Describe every instance selected for batch mode with paginated describe_instances calls
+
+    Unknown and terminated instance IDs are left out; the caller reports them as not found.
+    """
+    instances = []
+    paginator = ec2_client.get_paginator('describe_instances')
+    if instance_ids:
+        for start in range(0, len(instance_ids), 200):
+            # Unknown IDs fail the whole call, so filter on instance-id instead of passing InstanceIds
+            filters = [{'Name': 'instance-id', 'Values': instance_ids[start:start + 200]}]
+            for page in paginator.paginate(Filters=filters):
+                for reservation in page['Reservations']:
+                    instances.extend(
+                        instance for instance in reservation['Instances']
+                        if instance['State']['Name'] not in ('shutting-down', 'terminated')
+                    )
+    else:
+        filters = build_instance_filters(tag_filter=tag_filter, outposts_only=False)
+        for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': 1000}):
+            for reservation in page['Reservations']:
+                instances.extend(reservation['Instances'])
+    index_instance_placements(instances)
+    return instances
+
+def create_batch_templates(ec2_client, instance, snapshot, recovery_subnet_id, update=False):
+    """Create the primary and recovery launch templates for one instance and return its batch result"""
+    instance_id = instance['InstanceId']
+    result = {
+        'instance_id': instance_id,
+        'stack_name': get_default_stack_name(instance),
+        'primary_template_id': None,
+        'recovery_template_id': None,
+        'actions': [],
+        'error': None
+    }
+    try:
+        # Waits only for this instance's UserData, so templates are created while other fetches are in flight
+        userdata = snapshot.userdata(instance_id)
+        template_name = get_default_template_name(instance)
+        templates = [
+            ('primary_template_id', template_name, instance['SubnetId']),
+            ('recovery_template_id', f"{template_name}-recovery", recovery_subnet_id)
+        ]
+        for result_key, name, subnet_id in templates:
+            template_data = build_launch_template_data(instance, subnet_id, userdata)
+            if update:
+                template_id, action, _ = ensure_launch_template(ec2_client, name, template_data)
+            else:
+                response = ec2_client.create_launch_template(LaunchTemplateName=name, LaunchTemplateData=template_data)
+                template_id, action = response['LaunchTemplate']['LaunchTemplateId'], 'created'
+                invalidate_launch_template(ec2_client, template_id)
+            result[result_key] = template_id
+            result['actions'].append(action)
     except Exception as e:
-        print(f"Unexpected error in autorestart setup: {e}")
-        return False
+        # Recorded as this instance's failure so the rest of the batch carries on
+        result['error'] = str(e)
+    return result
 
-def main():
-    parser = argparse.ArgumentParser(description='Create launch template from running EC2 instance')
-    parser.add_argument('-i', '--instance-id', help='EC2 instance ID')
-    parser.add_argument('-n', '--template-name', help='Launch template name')
-    parser.add_argument('-r', '--region', help='AWS region (if not specified, uses default from AWS config)')
-    parser.add_argument('--list-regions', action='store_true', help='List available regions')
+def generate_templates_batch(ec2_client, subnet_map, instance_ids=None, tag_filter=None, max_workers=8, update=False):
+    """Create primary and recovery launch templates for many instances concurrently"""
+    instances = describe_batch_instances(ec2_client, instance_ids, tag_filter)
+    found_ids = {instance['InstanceId'] for instance in instances}
+    results = [
+        {'instance_id': instance_id, 'error': 'Instance not found'}
+        for instance_id in (instance_ids or []) if instance_id not in found_ids
+    ]
     
-    args = parser.parse_args()
+    eligible = []
+    for instance in instances:
+        recovery_subnet_id = subnet_map.get(instance.get('SubnetId'))
+        if recovery_subnet_id:
+            eligible.append((instance, recovery_subnet_id))
+        else:
+            results.append({'instance_id': instance['InstanceId'], 'error': f"No recovery subnet mapped for subnet {instance.get('SubnetId')}"})
     
-    # Handle list regions option
-    if args.list_regions:
-        try:
-            ec2_client = boto3.client('ec2')
-            regions = ec2_client.describe_regions()['Regions']
-            print("Available AWS regions:")
-            for region in sorted(regions, key=lambda x: x['RegionName']):
-                print(f"  {region['RegionName']}")
-            sys.exit(0)
-        except Exception as e:
-            print(f"Error listing regions: {e}")
-            sys.exit(1)
+    print(f"Creating launch templates for {len(eligible)} instance(s) with {max_workers} worker(s)...")
+    snapshot = ResourceSnapshot(ec2_client, max_workers=max_workers)
+    snapshot.prefetch_userdata([instance['InstanceId'] for instance, _ in eligible])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(create_batch_templates, ec2_client, instance, snapshot, recovery_subnet_id, update)
+            for instance, recovery_subnet_id in eligible
+        ]
+        for future in futures:
+            result = future.result()
+            if result['error']:
+                print(f"✗ {result['instance_id']}: {result['error']}")
+            else:
+                print(f"✓ {result['instance_id']}: primary {result['primary_template_id']}, recovery {result['recovery_template_id']} "
+                      f"({'/'.join(result['actions'])})")
+            results.append(result)
+    
+    return results
+
+def build_rollout_manifest(results, region, notification_email=None, recovery_mode='automatic'):
+    """Build an autorestart rollout.py manifest for the instances whose templates were created"""
+    defaults = {'recovery_mode': recovery_mode}
+    if notification_email:
+        defaults['notification_email'] = notification_email
+    targets = []
+    for result in results:
+        if result.get('error'):
+            continue
+        targets.append({
+            'region': region,
+            'stack_name': result['stack_name'],
+            'launch_template_ids': [result['recovery_template_id']],
+            'primary_template_id': result['primary_template_id'],
+            'source_instance_id': result['instance_id']
+        })
+    return {'defaults': defaults, 'targets': targets}
+
+def run_batch(args, ec2_client):
+    """Non-interactive batch mode: create templates for many instances and write a rollout manifest"""
+    if not (args.instance_ids or args.tag):
+        print("Batch mode requires --instance-ids or --tag")
+        sys.exit(1)
+    if not args.subnet_map:
+        print("Batch mode requires --subnet-map")
+        sys.exit(1)
     
-    # Initialize EC2 client
     try:
-        if args.region:
-            ec2_client = boto3.client('ec2', region_name=args.region)
-            print(f"Using region: {args.region}")
-        else:
-            ec2_client = boto3.client('ec2')
-            print(f"Using default region from AWS config")
-    except Exception as e:
-        print(f"Error initializing AWS client: {e}")
+        subnet_map = parse_subnet_map(args.subnet_map)
+        results = generate_templates_batch(ec2_client, subnet_map, args.instance_ids, args.tag, args.max_workers, args.update)
+    except (ClientError, OSError, ValueError) as e:
+        print(f"Error in batch template generation: {e}")
         sys.exit(1)
     
-    instance_id = args.instance_id
+    region = ec2_client.meta.region_name
+    manifest = build_rollout_manifest(results, region, args.notification_email)
+    with open(args.manifest_file, 'w') as file:
+        json.dump(manifest, file, indent=4)
     
-    # If instance ID provided but region detection needed
-    if instance_id and not args.region:
-        print(f"Searching for instance {instance_id} across regions...")
-        detected_region = find_instance_region(instance_id)
-        if not detected_region:
-            print(f"Instance {instance_id} not found in any region")
-            sys.exit(1)
-        print(f"Found instance in region: {detected_region}")
-        ec2_client = boto3.client('ec2', region_name=detected_region)
+    failed = [result for result in results if result.get('error')]
+    print(f"\n{len(results) - len(failed)} instance(s) succeeded, {len(failed)} failed")
+    print(f"Rollout manifest written to {args.manifest_file}")
+    if not args.notification_email:
+        print("  Add 'notification_email' to the manifest defaults before running autorestart/autorestart-tool/rollout.py")
     
-    # If no instance ID provided, show selection menu
-    if not instance_id:
-        instances = list_running_instances(ec2_client)
-        instance_id = select_instance(instances)
-        
-        if not instance_id:
-            print("No instance selected. Exiting.")
-            sys.exit(1)
+    sys.exit(1 if failed else 0)
+
+def run_interactive(ec2_client, instance_id, template_name=None, update=False, instance_filter_args=None, snapshot=None, session=None):
+    """Create the primary and recovery templates for an instance, then offer to set up automated recovery
+
+    Returns the created template IDs, or an empty list if the primary template could not be created.
+    """
+    instance_filter_args = instance_filter_args or {}
+    snapshot = snapshot or ResourceSnapshot(ec2_client)
     
     # Create first launch template
-    template_id = create_launch_template_from_instance(ec2_client, instance_id, args.template_name)
+    template_id = create_launch_template_from_instance(ec2_client, instance_id, template_name, snapshot, update)
     
     if not template_id:
-        sys.exit(1)
+        return []
     
     created_template_ids = [template_id]
     
@@ -445,22 +536,19 @@ def main():
         if instance_choice == 'same':
             second_instance_id = instance_id
         else:
-            instances = list_running_instances(ec2_client)
             print("\nSelect instance for the second launch template:")
-            second_instance_id = select_instance(instances)
+            second_instance_id = select_instance(ec2_client, **instance_filter_args)
         
         if second_instance_id:
             # Generate a different template name for the second template
             second_template_name = None
-            if args.template_name:
-                second_template_name = f"{args.template_name}-recovery"
+            if template_name:
+                second_template_name = f"{template_name}-recovery"
             elif second_instance_id == instance_id:
                 # Same instance, generate unique name
-                instance_name = ec2_client.describe_instances(InstanceIds=[second_instance_id])['Reservations'][0]['Instances'][0].get('Tags', [])
-                instance_name = next((tag['Value'] for tag in instance_name if tag['Key'] == 'Name'), second_instance_id)
-                second_template_name = f"lt-{instance_name}-{second_instance_id}-recovery"
+                second_template_name = f"{get_default_template_name(snapshot.instance(second_instance_id))}-recovery"
             
-            second_template_id = create_launch_template_from_instance(ec2_client, second_instance_id, second_template_name)
+            second_template_id = create_launch_template_from_instance(ec2_client, second_instance_id, second_template_name, snapshot, update)
             
             if second_template_id:
                 created_template_ids.append(second_template_id)
@@ -477,16 +565,102 @@ def main():
         print("="*60)
         
         # Get region from EC2 client
-        region = ec2_client.meta.region_name or args.region or 'us-east-1'
+        region = ec2_client.meta.region_name or 'us-east-1'
         
         # Pass recovery template for launching and primary template for monitoring
         if len(created_template_ids) < 2:
             print("\n⚠ Both primary and recovery templates are required for automated recovery.")
-        elif setup_automated_recovery([created_template_ids[1]], region, instance_id, created_template_ids[0]):
+        elif setup_automated_recovery([created_template_ids[1]], region, instance_id, created_template_ids[0], snapshot, session):
             print("\n✓ Automated recovery setup completed successfully!")
         else:
             print("\n⚠ Automated recovery setup failed.")
     
+    return created_template_ids
+
+def main():
+    parser = argparse.ArgumentParser(description='Create launch template from running EC2 instance')
+    parser.add_argument('-i', '--instance-id', help='EC2 instance ID')
+    parser.add_argument('-n', '--template-name', help='Launch template name')
+    parser.add_argument('-r', '--region', help='AWS region (if not specified, uses default from AWS config)')
+    parser.add_argument('--list-regions', action='store_true', help='List available regions')
+    parser.add_argument('--outpost-arn', help='Only list instances placed on this Outpost')
+    parser.add_argument('--name-filter', help='Only list instances whose Name tag contains this text (or with this instance ID)')
+    parser.add_argument('--tag', help='Only list instances carrying this tag (KEY=VALUE)')
+    parser.add_argument('--all-instances', action='store_true', help='List instances in the region as well as on Outposts')
+    parser.add_argument('--update', action='store_true', help='Reuse existing templates with the same name, adding a new default version only when the instance drifted')
+    parser.add_argument('--batch', action='store_true', help='Create primary and recovery templates for many instances without prompting')
+    parser.add_argument('--instance-ids', nargs='+', help='Batch mode: instance IDs to create templates for')
+    parser.add_argument('--subnet-map', nargs='+', help='Batch mode: PRIMARY_SUBNET=RECOVERY_SUBNET pairs, or a JSON file with the mapping')
+    parser.add_argument('--manifest-file', default='rollout.json', help='Batch mode: rollout manifest to write (default: rollout.json)')
+    parser.add_argument('--notification-email', help='Batch mode: notification email to record in the rollout manifest')
+    parser.add_argument('--max-workers', type=int, default=8, help='Batch mode: maximum concurrent API calls (default: 8)')
+    
+    args = parser.parse_args()
+    if args.tag and '=' not in args.tag:
+        parser.error('--tag must be in KEY=VALUE format')
+    instance_filter_args = {
+        'outpost_arn': args.outpost_arn,
+        'name_filter': args.name_filter,
+        'tag_filter': args.tag,
+        'outposts_only': not args.all_instances
+    }
+    
+    # One session serves every client, including automated recovery setup
+    session = boto3.Session()
+    
+    # Handle list regions option
+    if args.list_regions:
+        try:
+            ec2_client = session.client('ec2')
+            regions = ec2_client.describe_regions()['Regions']
+            print("Available AWS regions:")
+            for region in sorted(regions, key=lambda x: x['RegionName']):
+                print(f"  {region['RegionName']}")
+            sys.exit(0)
+        except Exception as e:
+            print(f"Error listing regions: {e}")
+            sys.exit(1)
+    
+    # Initialize EC2 client
+    try:
+        if args.region:
+            ec2_client = session.client('ec2', region_name=args.region, config=EC2_CLIENT_CONFIG)
+            print(f"Using region: {args.region}")
+        else:
+            ec2_client = session.client('ec2', config=EC2_CLIENT_CONFIG)
+            print(f"Using default region from AWS config")
+    except Exception as e:
+        print(f"Error initializing AWS client: {e}")
+        sys.exit(1)
+    
+    if args.batch:
+        run_batch(args, ec2_client)
+    
+    instance_id = args.instance_id
+    snapshot = ResourceSnapshot(ec2_client)
+    
+    # If instance ID provided but region detection needed
+    if instance_id and not args.region:
+        print(f"Searching for instance {instance_id} across regions...")
+        detected_region = find_instance_region(instance_id)
+        if not detected_region:
+            print(f"Instance {instance_id} not found in any region")
+            sys.exit(1)
+        print(f"Found instance in region: {detected_region}")
+        ec2_client = session.client('ec2', region_name=detected_region, config=EC2_CLIENT_CONFIG)
+        snapshot = ResourceSnapshot(ec2_client)
+    
+    # If no instance ID provided, show selection menu
+    if not instance_id:
+        instance_id = select_instance(ec2_client, **instance_filter_args)
+        
+        if not instance_id:
+            print("No instance selected. Exiting.")
+            sys.exit(1)
+    
+    if not run_interactive(ec2_client, instance_id, args.template_name, args.update, instance_filter_args, snapshot, session):
+        sys.exit(1)
+    
     sys.exit(0)
 
 if __name__ == '__main__':
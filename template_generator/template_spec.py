@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import boto3
+from botocore.exceptions import ClientError
+
+from init import describe_batch_instances, get_default_template_name, parse_subnet_map
+# init puts the repository root on sys.path
+from inventory_cache import ResourceSnapshot
+from launch_template_utils import (
+    build_launch_template_data,
+    build_template_spec,
+    ensure_launch_template,
+    find_launch_templates,
+    load_template_spec,
+    resolve_template_spec,
+    write_template_spec,
+)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Export launch templates to reviewable spec files and apply them in bulk')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Write template specs for instances or existing launch templates')
+    export_parser.add_argument('-r', '--region', required=True, help='AWS region to export from')
+    export_parser.add_argument('--instance-ids', nargs='+', help='Export primary and recovery specs for these instances')
+    export_parser.add_argument('--tag', help='Export primary and recovery specs for running instances carrying this tag (KEY=VALUE)')
+    export_parser.add_argument('--subnet-map', nargs='+', help='PRIMARY_SUBNET=RECOVERY_SUBNET pairs, or a JSON file with the mapping')
+    export_parser.add_argument('--launch-template-ids', nargs='+', help='Export the default version of these launch templates')
+    export_parser.add_argument('-o', '--output-dir', default='specs', help='Directory to write spec files to (default: specs)')
+    export_parser.add_argument('--max-workers', type=int, default=8, help='Maximum concurrent API calls (default: 8)')
+
+    apply_parser = subparsers.add_parser('apply', help='Create or update launch templates from spec files')
+    apply_parser.add_argument('specs', nargs='+', help='Spec files, or directories of *.json spec files')
+    apply_parser.add_argument('--regions', nargs='+', help="Regions to apply to (default: each spec's source region)")
+    apply_parser.add_argument('--account-ids', nargs='+', help='Accounts to apply to, assuming --assume-role-name in each')
+    apply_parser.add_argument('--assume-role-name', help='IAM role name to assume in each of --account-ids')
+    apply_parser.add_argument('--max-workers', type=int, default=16, help='Maximum number of templates applied at the same time (default: 16)')
+    apply_parser.add_argument('--report-file', help='Write the apply report to this JSON file')
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        if not (args.instance_ids or args.tag or args.launch_template_ids):
+            parser.error('export requires --instance-ids, --tag or --launch-template-ids')
+        if (args.instance_ids or args.tag) and not args.subnet_map:
+            parser.error('exporting instances requires --subnet-map')
+    if args.command == 'apply' and args.account_ids and not args.assume_role_name:
+        parser.error('--account-ids requires --assume-role-name')
+    return args
+
+def get_spec_path(output_dir, name):
+    # Launch template names may contain '/', which cannot appear in a file name
+    return os.path.join(output_dir, f"{name.replace('/', '_')}.json")
+
+def export_instance_specs(ec2_client, subnet_map, instance_ids=None, tag_filter=None, max_workers=8):
+    """Return primary and recovery specs for instances, built the same way as the template generator's templates"""
+    instances = describe_batch_instances(ec2_client, instance_ids, tag_filter)
+    eligible = []
+    for instance in instances:
+        if subnet_map.get(instance.get('SubnetId')):
+            eligible.append(instance)
+        else:
+            print(f"✗ {instance['InstanceId']}: No recovery subnet mapped for subnet {instance.get('SubnetId')}")
+
+    snapshot = ResourceSnapshot(ec2_client, max_workers=max_workers)
+    snapshot.prefetch_userdata([instance['InstanceId'] for instance in eligible])
+
+    exported_at = datetime.now(timezone.utc).isoformat()
+    specs = []
+    for instance in eligible:
+        instance_userdata = snapshot.userdata(instance['InstanceId'])
+        template_name = get_default_template_name(instance)
+        source = {'instance_id': instance['InstanceId'], 'region': ec2_client.meta.region_name, 'exported_at': exported_at}
+        for name, subnet_id in ((template_name, instance['SubnetId']), (f"{template_name}-recovery", subnet_map[instance['SubnetId']])):
+            template_data = build_launch_template_data(instance, subnet_id, instance_userdata)
+            specs.append(build_template_spec(name, template_data, source))
+    return specs
+
+def export_launch_template_specs(ec2_client, launch_template_ids):
+    """Return specs for the default version of existing launch templates"""
+    exported_at = datetime.now(timezone.utc).isoformat()
+    specs = []
+    for launch_template_id in launch_template_ids:
+        version = ec2_client.describe_launch_template_versions(
+            LaunchTemplateId=launch_template_id, Versions=['$Default']
+        )['LaunchTemplateVersions'][0]
+        source = {
+            'launch_template_id': launch_template_id,
+            'version_number': version['VersionNumber'],
+            'region': ec2_client.meta.region_name,
+            'exported_at': exported_at
+        }
+        specs.append(build_template_spec(version['LaunchTemplateName'], version['LaunchTemplateData'], source))
+    return specs
+
+def run_export(args):
+    ec2_client = boto3.client('ec2', region_name=args.region)
+    specs = []
+    try:
+        if args.instance_ids or args.tag:
+            subnet_map = parse_subnet_map(args.subnet_map)
+            specs.extend(export_instance_specs(ec2_client, subnet_map, args.instance_ids, args.tag, args.max_workers))
+        if args.launch_template_ids:
+            specs.extend(export_launch_template_specs(ec2_client, args.launch_template_ids))
+    except (ClientError, OSError, ValueError) as e:
+        print(f"Error exporting template specs: {e}")
+        sys.exit(1)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for spec in specs:
+        path = get_spec_path(args.output_dir, spec['name'])
+        write_template_spec(path, spec)
+        print(f"✓ {spec['name']} -> {path}")
+    print(f"\n{len(specs)} spec(s) written to {args.output_dir}")
+
+def load_specs(paths):
+    """Load every spec file, expanding directories, and reject duplicate template names"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.json')))
+        else:
+            files.append(path)
+
+    specs = []
+    names = {}
+    for file in files:
+        spec = load_template_spec(file)
+        if spec['name'] in names:
+            raise ValueError(f"{file}: template name {spec['name']} is also used by {names[spec['name']]}")
+        names[spec['name']] = file
+        specs.append(spec)
+    return specs
+
+class TargetClients:
+    """Hands out one EC2 client per account and region, assuming each account's role at most once"""
+
+    def __init__(self, assume_role_name=None):
+        self.assume_role_name = assume_role_name
+        self._sessions = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, account_id):
+        with self._lock:
+            if account_id not in self._sessions:
+                if account_id:
+                    credentials = boto3.client('sts').assume_role(
+                        RoleArn=f"arn:aws:iam::{account_id}:role/{self.assume_role_name}",
+                        RoleSessionName='template-spec-apply'
+                    )['Credentials']
+                    self._sessions[account_id] = boto3.Session(
+                        aws_access_key_id=credentials['AccessKeyId'],
+                        aws_secret_access_key=credentials['SecretAccessKey'],
+                        aws_session_token=credentials['SessionToken']
+                    )
+                else:
+                    self._sessions[account_id] = boto3.Session()
+            return self._sessions[account_id]
+
+    def get_ec2_client(self, account_id, region):
+        session = self.get_session(account_id)
+        with self._lock:
+            if (account_id, region) not in self._clients:
+                self._clients[(account_id, region)] = session.client('ec2', region_name=region)
+            return self._clients[(account_id, region)]
+
+def apply_specs(specs, regions=None, account_ids=None, assume_role_name=None, max_workers=16):
+    """Create or update the launch template for every spec in every target account and region
+
+    Existing templates are looked up in one batched call per account and region, and only get a new default
+    version when any field of their latest version differs from the spec, so re-applying the same specs changes
+    nothing.
+    """
+    clients = TargetClients(assume_role_name)
+    targets = [
+        (account_id, region, spec)
+        for account_id in (account_ids or [None])
+        for spec in specs
+        for region in (regions or [spec.get('source', {}).get('region')])
+    ]
+    for _, region, spec in targets:
+        if not region:
+            raise ValueError(f"Template spec {spec['name']} has no source region; pass --regions")
+
+    # One name lookup per account and region instead of one describe call per template
+    known_templates = {}
+    known_locks = {key: threading.Lock() for key in {(account_id, region) for account_id, region, _ in targets}}
+
+    def get_known_templates(account_id, region):
+        with known_locks[(account_id, region)]:
+            if (account_id, region) not in known_templates:
+                names = [spec['name'] for target_account_id, target_region, spec in targets
+                         if (target_account_id, target_region) == (account_id, region)]
+                known_templates[(account_id, region)] = find_launch_templates(clients.get_ec2_client(account_id, region), names)
+            return known_templates[(account_id, region)]
+
+    def apply_target(account_id, region, spec):
+        result = {
+            'account_id': account_id or 'default',
+            'region': region,
+            'name': spec['name'],
+            'launch_template_id': None,
+            'action': None,
+            'drifted_fields': [],
+            'error': None,
+            'duration_seconds': 0
+        }
+        start_time = time.time()
+        try:
+            ec2_client = clients.get_ec2_client(account_id, region)
+            template_data = resolve_template_spec(spec, region, account_id)
+            template_id, action, drifted_fields = ensure_launch_template(
+                ec2_client, spec['name'], template_data, get_known_templates(account_id, region), compare_all_fields=True
+            )
+            result.update(launch_template_id=template_id, action=action, drifted_fields=drifted_fields)
+        except Exception as e:
+            result['error'] = str(e)
+        result['duration_seconds'] = round(time.time() - start_time, 1)
+        return result
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(apply_target, *target) for target in targets]
+        for future in as_completed(futures):
+            result = future.result()
+            if result['error']:
+                print(f"✗ {result['region']} {result['name']}: {result['error']}")
+            else:
+                print(f"✓ {result['region']} {result['name']}: {result['action']} {result['launch_template_id']}")
+            results.append(result)
+
+    return sorted(results, key=lambda result: (result['account_id'], result['region'], result['name']))
+
+def run_apply(args):
+    try:
+        specs = load_specs(args.specs)
+    except (OSError, ValueError) as e:
+        print(f"Error loading template specs: {e}")
+        sys.exit(1)
+    if not specs:
+        print("No template specs found")
+        sys.exit(1)
+
+    print(f"Applying {len(specs)} spec(s) with {args.max_workers} worker(s)...")
+    try:
+        results = apply_specs(specs, args.regions, args.account_ids, args.assume_role_name, args.max_workers)
+    except (ClientError, ValueError) as e:
+        print(f"Error applying template specs: {e}")
+        sys.exit(1)
+
+    counts = {}
+    for result in results:
+        status = 'failed' if result['error'] else result['action']
+        counts[status] = counts.get(status, 0) + 1
+    print(f"\n{len(results)} template(s) applied: " + ', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+    if args.report_file:
+        with open(args.report_file, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Report written to {args.report_file}")
+
+    sys.exit(1 if counts.get('failed') else 0)
+
+def main():
+    args = parse_arguments()
+    if args.command == 'export':
+        run_export(args)
+    else:
+        run_apply(args)
+
+if __name__ == '__main__':
+    main()